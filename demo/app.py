@@ -9,10 +9,13 @@ import sys
 import json
 import traceback
 import socket
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
 from typing import Dict, List, Any, Optional
 
-from flask import Flask, request, jsonify, render_template, send_from_directory
+from flask import Flask, Response, request, jsonify, render_template, send_from_directory, stream_with_context
 from flask_cors import CORS
 import pandas as pd
 import numpy as np
@@ -26,7 +29,16 @@ from src.search import ProductSearcher
 from src.add_row import ProductManager
 from src.delete_row import ProductDeleter
 from src.update_row import ProductUpdater
-from simple_config import API_SETTINGS, get_global_embedding_model, monitor_gpu_memory
+from src.bulk_row import ProductBulkWriter
+from src.import_job import ImportJobRunner, detect_format, FORMATS
+from src.catalog_export import CatalogExport, product_records
+from src.cache import SearchResultCache
+from src.delta_index import build_merged_index, commit_merged_index
+from src.tombstones import build_compaction, commit_compaction
+from simple_config import (
+    API_SETTINGS, RETRIEVAL_K, RESULT_CACHE, BULK, COMPACTION, DELTA_INDEX, get_global_embedding_model,
+    monitor_gpu_memory
+)
 
 # Initialize Flask app
 app = Flask(__name__, template_folder='templates', static_folder='static')
@@ -37,6 +49,35 @@ searcher = None
 product_manager = None
 product_deleter = None
 product_updater = None
+product_bulk_writer = None
+import_runner = None
+search_result_cache = SearchResultCache(
+    max_size=RESULT_CACHE['max_size'],
+    ttl_seconds=RESULT_CACHE['ttl_seconds']
+) if RESULT_CACHE['enabled'] else None
+
+# Serialize các thao tác ghi (add/update/delete và bước commit của delta merge / compaction)
+catalog_write_lock = threading.RLock()
+# Delta merge và compaction chạy lần lượt (publish của job này làm kết quả đang build của job kia bị bỏ)
+maintenance_lock = threading.Lock()
+delta_merge_thread = None
+compaction_thread = None
+checkpoint_thread = None
+# Backoff của job nền sau lần chạy bị bỏ / lỗi (không schedule lại ngay ở lần ghi kế tiếp)
+delta_merge_backoff = {'delay_s': 0.0, 'next_attempt': 0.0}
+compaction_backoff = {'delay_s': 0.0, 'next_attempt': 0.0}
+
+
+@contextmanager
+def catalog_write():
+    """
+    Giữ lock ghi trong lúc sửa catalog; sau khi nhả lock mới chờ fsync catalog log
+    → các request ghi đồng thời dùng chung một lần fsync (group commit) thay vì fsync lần lượt trong lock
+    """
+    with catalog_write_lock:
+        yield
+    if searcher:
+        searcher.store.sync()
 
 
 def find_available_port(start_port=5000, max_attempts=10):
@@ -53,7 +94,7 @@ def find_available_port(start_port=5000, max_attempts=10):
 
 def initialize_search_service():
     """Khởi tạo search service và database managers"""
-    global searcher, product_manager, product_deleter, product_updater
+    global searcher, product_manager, product_deleter, product_updater, product_bulk_writer, import_runner
     
     try:
         print("🚀 Initializing search service...")
@@ -64,20 +105,28 @@ def initialize_search_service():
         print("✅ Global models loaded")
         monitor_gpu_memory("After loading global models")
         
-        # Initialize searcher
+        # Initialize searcher (tạo ProductStore: index / metadata / embeddings chỉ load 1 lần)
         searcher = ProductSearcher()
+        searcher.store.defer_sync = True  # Endpoint ghi fsync log sau khi nhả lock (catalog_write)
+        searcher.store.background_checkpoint = True  # Snapshot được ghi ở thread checkpoint, không trên request
         print("✅ ProductSearcher initialized")
         
-        # Initialize database managers
-        product_manager = ProductManager()
+        # Initialize database managers - dùng chung store của searcher, không load thêm bản copy
+        product_manager = ProductManager(store=searcher.store)
         print("✅ ProductManager initialized")
         
-        product_deleter = ProductDeleter()
+        product_deleter = ProductDeleter(score_cache=searcher.score_cache, store=searcher.store)
         print("✅ ProductDeleter initialized")
         
-        product_updater = ProductUpdater()
+        product_updater = ProductUpdater(score_cache=searcher.score_cache, store=searcher.store)
         print("✅ ProductUpdater initialized")
         
+        product_bulk_writer = ProductBulkWriter(score_cache=searcher.score_cache, store=searcher.store)
+        print("✅ ProductBulkWriter initialized")
+        
+        # Import CSV / JSONL chạy nền: mỗi chunk commit trong lock ghi như một request bulk
+        import_runner = ImportJobRunner(product_bulk_writer, catalog_write, commit_catalog_change)
+        
         print("🎉 Search service and database managers initialized successfully!")
         monitor_gpu_memory("After all initialization")
         return True
@@ -89,30 +138,15 @@ def initialize_search_service():
 
 
 def reload_all_managers():
-    """Reload tất cả managers sau khi database thay đổi"""
-    global searcher, product_manager, product_deleter, product_updater
-    
+    """
+    Đọc lại toàn bộ catalog từ đĩa (chỉ dùng khi admin yêu cầu, vd file bị thay từ bên ngoài server)
+    Thao tác ghi, delta merge và compaction publish thay đổi trong bộ nhớ nên không cần gọi hàm này.
+    Searcher và các manager dùng chung một ProductStore nên chỉ cần đọc lại một lần.
+    """
     try:
-        print("🔄 Reloading all managers...")
-        
-        # Reload searcher
+        print("🔄 Reloading product store...")
         if searcher:
-            searcher._load_data()
-            print("✅ Searcher reloaded")
-        
-        # Reload database managers
-        if product_manager:
-            product_manager._load_data()
-            print("✅ ProductManager reloaded")
-            
-        if product_deleter:
-            product_deleter.reload_data()
-            print("✅ ProductDeleter reloaded")
-            
-        if product_updater:
-            product_updater._load_data()
-            print("✅ ProductUpdater reloaded")
-        
+            searcher.store.reload()
         print("🎉 All managers reloaded successfully!")
         return True
         
@@ -121,6 +155,129 @@ def reload_all_managers():
         return False
 
 
+def commit_catalog_change():
+    """
+    Tăng index generation sau một lần add/update/delete thành công
+    Manager đã publish snapshot mới vào store dùng chung trước khi trả về nên không cần reload.
+    """
+    # Generation tăng sau khi searcher đã có dữ liệu mới: response cache theo generation cũ không còn được dùng
+    if searcher:
+        searcher.bump_generation()
+    if search_result_cache:
+        search_result_cache.clear()
+    
+    schedule_delta_merge()
+    schedule_compaction()
+    schedule_checkpoint()
+
+
+def record_attempt(backoff: dict, succeeded: bool, config: dict):
+    """Thành công: bỏ backoff; bị bỏ / lỗi: lần thử sau chờ retry_backoff_s, gấp đôi mỗi lần liên tiếp"""
+    if succeeded:
+        backoff['delay_s'] = 0.0
+        backoff['next_attempt'] = 0.0
+        return
+    backoff['delay_s'] = min(max(backoff['delay_s'] * 2, config['retry_backoff_s']), config['max_retry_backoff_s'])
+    backoff['next_attempt'] = time.time() + backoff['delay_s']
+    print(f"⏳ Thử lại sau {backoff['delay_s']:.0f}s")
+
+
+def schedule_delta_merge():
+    """Chạy merge delta → main index ở thread nền khi delta vượt ngưỡng (mỗi lúc tối đa một merge)"""
+    global delta_merge_thread
+    
+    if not searcher or searcher.delta is None or not searcher.delta.should_merge():
+        return
+    if delta_merge_thread is not None and delta_merge_thread.is_alive():
+        return
+    if time.time() < delta_merge_backoff['next_attempt']:
+        return
+    
+    delta_merge_thread = threading.Thread(target=run_delta_merge, name='delta-merge', daemon=True)
+    delta_merge_thread.start()
+
+
+def run_delta_merge():
+    """
+    Build main index mới từ snapshot hiện tại ngoài lock, chỉ giữ lock ghi khi publish
+    Change commit trong lúc build được replay lên kết quả (store.rebuild / rebase).
+    """
+    committed = False
+    try:
+        with maintenance_lock:
+            print("🔄 Merging delta index into main index...")
+            with searcher.store.rebuild() as journal:
+                merged = build_merged_index(journal.base)
+                with catalog_write_lock:
+                    committed = commit_merged_index(searcher.store, journal, merged)
+                    if committed:
+                        commit_catalog_change()
+    except Exception as e:
+        print(f"❌ Delta merge error: {e}")
+        traceback.print_exc()
+    record_attempt(delta_merge_backoff, committed, DELTA_INDEX)
+
+
+def schedule_compaction():
+    """Chạy compaction ở thread nền khi tỉ lệ tombstone vượt ngưỡng (mỗi lúc tối đa một compaction)"""
+    global compaction_thread
+    
+    if not searcher or searcher.index is None or not searcher.tombstones.should_compact(searcher.index.ntotal):
+        return
+    if compaction_thread is not None and compaction_thread.is_alive():
+        return
+    if time.time() < compaction_backoff['next_attempt']:
+        return
+    
+    compaction_thread = threading.Thread(target=run_compaction, name='compaction', daemon=True)
+    compaction_thread.start()
+
+
+def run_compaction():
+    """
+    Dọn vector / dòng metadata của ID đã xóa (trên snapshot hiện tại) ngoài lock, chỉ giữ lock ghi khi publish
+    Change commit trong lúc build được replay lên kết quả (store.rebuild / rebase).
+    """
+    committed = False
+    try:
+        with maintenance_lock:
+            print("🔄 Compacting tombstones...")
+            with searcher.store.rebuild() as journal:
+                compaction = build_compaction(journal.base)
+                with catalog_write_lock:
+                    committed = commit_compaction(searcher.store, journal, compaction)
+                    if committed:
+                        commit_catalog_change()
+    except Exception as e:
+        print(f"❌ Compaction error: {e}")
+        traceback.print_exc()
+    record_attempt(compaction_backoff, committed, COMPACTION)
+
+
+def schedule_checkpoint():
+    """Ghi checkpoint ở thread nền khi log vượt ngưỡng kích thước / thời gian hoặc merge / compaction vừa publish"""
+    global checkpoint_thread
+    
+    if not searcher or not searcher.store.should_checkpoint():
+        return
+    if checkpoint_thread is not None and checkpoint_thread.is_alive():
+        return
+    
+    checkpoint_thread = threading.Thread(target=run_checkpoint, name='checkpoint', daemon=True)
+    checkpoint_thread.start()
+
+
+def run_checkpoint():
+    """Ghi generation mới của snapshot hiện tại (data/snapshots/), đổi con trỏ CURRENT rồi cắt catalog log"""
+    try:
+        # Lặp nếu có merge / compaction publish trong lúc đang ghi (thread này chặn lần schedule khác)
+        while searcher.store.checkpoint() and searcher.store.should_checkpoint():
+            pass
+    except Exception as e:
+        print(f"❌ Checkpoint error: {e}")
+        traceback.print_exc()
+
+
 def safe_str(value):
     """Helper function to safely convert values to string, handling NaN"""
     if pd.isna(value):
@@ -206,7 +363,8 @@ def search_products():
     {
         "query": "search query",
         "method": "bi_encoder" | "hybrid",
-        "top_k": 5
+        "top_k": 5,
+        "retrieval_k": 20
     }
     """
     try:
@@ -223,15 +381,27 @@ def search_products():
         
         method = data.get('method', 'hybrid')
         top_k = min(max(data.get('top_k', 5), 1), 50)  # Limit between 1-50
-        
-        # Perform search
-        if method == 'bi_encoder':
-            results, scores = searcher.bi_encoder_search(query, top_k)
-        else:  # hybrid
-            results, scores = searcher.hybrid_search(query, top_k)
-        
-        # Format results
-        formatted_results = format_search_results(results, scores)
+        retrieval_k = min(max(data.get('retrieval_k', RETRIEVAL_K), top_k), 200)
+        
+        # Response cache theo generation - hit thì bỏ qua encode, FAISS và re-rank
+        cache_key = None
+        formatted_results = None
+        if search_result_cache:
+            cache_key = search_result_cache.make_key(query, method, top_k, retrieval_k, searcher.generation)
+            formatted_results = search_result_cache.get(cache_key)
+        cached = formatted_results is not None
+        
+        if not cached:
+            # Perform search
+            if method == 'bi_encoder':
+                results, scores = searcher.bi_encoder_search(query, top_k)
+            else:  # hybrid
+                results, scores = searcher.hybrid_search(query, top_k, retrieval_k)
+            
+            # Format results
+            formatted_results = format_search_results(results, scores)
+            if cache_key is not None:
+                search_result_cache.put(cache_key, formatted_results)
         
         return jsonify({
             'success': True,
@@ -239,6 +409,7 @@ def search_products():
             'method': method,
             'total_results': len(formatted_results),
             'results': formatted_results,
+            'cached': cached,
             'timestamp': datetime.now().isoformat()
         })
         
@@ -248,6 +419,70 @@ def search_products():
         return jsonify({'error': f'Search failed: {str(e)}'}), 500
 
 
+@app.route('/api/search/batch', methods=['POST'])
+def search_products_batch():
+    """
+    Tìm kiếm nhiều query trong một request (encode, FAISS search và re-rank theo batch)
+    
+    Request body:
+    {
+        "queries": ["query 1", "query 2"],
+        "method": "bi_encoder" | "hybrid",
+        "top_k": 5,
+        "retrieval_k": 20
+    }
+    """
+    try:
+        if not searcher:
+            return jsonify({'error': 'Search service not initialized'}), 500
+        
+        data = request.get_json()
+        if not data:
+            return jsonify({'error': 'No JSON data provided'}), 400
+        
+        queries = data.get('queries')
+        if not isinstance(queries, list) or not queries:
+            return jsonify({'error': 'Queries must be a non-empty list'}), 400
+        
+        max_batch = API_SETTINGS.get('max_batch_queries', 256)
+        if len(queries) > max_batch:
+            return jsonify({'error': f'Too many queries (max {max_batch})'}), 400
+        
+        queries = [str(query).strip() for query in queries]
+        if not all(queries):
+            return jsonify({'error': 'Queries must not be empty'}), 400
+        
+        method = data.get('method', 'hybrid')
+        top_k = min(max(data.get('top_k', 5), 1), 50)  # Limit between 1-50
+        retrieval_k = min(max(data.get('retrieval_k', RETRIEVAL_K), top_k), 200)
+        
+        # Perform batched search
+        batch_results = searcher.search_batch(queries, method, top_k, retrieval_k)
+        
+        # Format results - mỗi query cùng format với /api/search
+        formatted_batch = []
+        for query, (results, scores) in zip(queries, batch_results):
+            formatted_results = format_search_results(results, scores)
+            formatted_batch.append({
+                'query': query,
+                'total_results': len(formatted_results),
+                'results': formatted_results
+            })
+        
+        return jsonify({
+            'success': True,
+            'method': method,
+            'total_queries': len(formatted_batch),
+            'results': formatted_batch,
+            'timestamp': datetime.now().isoformat()
+        })
+        
+    except Exception as e:
+        print(f"Batch search error: {e}")
+        traceback.print_exc()
+        return jsonify({'error': f'Batch search failed: {str(e)}'}), 500
+
+
 @app.route('/api/products', methods=['GET'])
 def list_products():
     """
@@ -290,17 +525,8 @@ def list_products():
         # Get page data
         page_df = filtered_df.iloc[start_idx:end_idx]
         
-        products = []
-        for idx, row in page_df.iterrows():
-            products.append({
-                'id': int(convert_numpy_types(row.get('id', idx))),
-                'name': safe_str(row.get('name', '')),
-                'brand': safe_str(row.get('brand', '')),
-                'ingredients': safe_str(row.get('ingredients', '')),
-                'categories': safe_str(row.get('categories', '')),
-                'manufacturer': safe_str(row.get('manufacturer', '')),
-                'manufacturerNumber': safe_str(row.get('manufacturerNumber', ''))
-            })
+        # Build theo cột (không iterrows)
+        products = product_records(page_df)
         
         return jsonify({
             'success': True,
@@ -339,6 +565,13 @@ def get_database_stats():
             },
             'sample_ids': df['id'].head(10).tolist() if len(df) > 0 else [],
             'faiss_vectors': searcher.index.ntotal if searcher.index else 0,
+            'query_embedding_cache': searcher.query_cache.stats() if searcher.query_cache else None,
+            'cross_encoder_score_cache': searcher.score_cache.stats() if searcher.score_cache else None,
+            'search_result_cache': search_result_cache.stats() if search_result_cache else None,
+            'index_generation': searcher.generation,
+            'delta_index': searcher.delta.stats() if searcher.delta is not None else None,
+            'tombstones': searcher.tombstones.stats(searcher.index.ntotal) if searcher.index else None,
+            'product_store': searcher.store.stats(),
             'timestamp': datetime.now().isoformat()
         }
         
@@ -359,13 +592,11 @@ def get_product(product_id: int):
         if not searcher:
             return jsonify({'error': 'Search service not initialized'}), 500
         
-        # Check if product exists by ID value, not by index
-        if product_id not in searcher.metadata_df['id'].values:
+        # Get product data using ID (id → row index, không quét DataFrame)
+        product = searcher.get_product(product_id)
+        if product is None:
             return jsonify({'error': 'Product not found'}), 404
         
-        # Get product data using ID
-        product = searcher.metadata_df[searcher.metadata_df['id'] == product_id].iloc[0]
-        
         print(f"Debug - Product {product_id}:")
         print(f"  Name: {product.get('name', 'MISSING')}")
         print(f"  Brand: {product.get('brand', 'MISSING')}")
@@ -491,11 +722,13 @@ def add_product():
         }
         
         # Add product using ProductManager
-        success = product_manager.add_product_from_data(product_data)
+        with catalog_write():
+            success = product_manager.add_product_from_data(product_data)
+            
+            if success:
+                commit_catalog_change()
         
         if success:
-            # Reload all managers to reflect changes
-            reload_all_managers()
             
             return jsonify({
                 'success': True,
@@ -521,23 +754,22 @@ def delete_product(product_id):
         if not product_deleter:
             return jsonify({'error': 'Product deleter not initialized'}), 500
         
-        # Reload data to ensure consistency
-        product_deleter.reload_data()
-        
-        # Check if product exists
-        df = product_deleter.metadata_df
-        if product_id not in df['id'].values:
-            return jsonify({'error': f'Product with ID {product_id} not found'}), 404
-        
-        # Get product info before deletion
-        product_info = df[df['id'] == product_id].iloc[0].to_dict()
-        
-        # Delete product
-        success = product_deleter.delete_products([product_id])
+        with catalog_write():
+            # Check if product exists (store đã có mọi thay đổi trước đó, không cần reload)
+            product = searcher.get_product(product_id)
+            if product is None:
+                return jsonify({'error': f'Product with ID {product_id} not found'}), 404
+            
+            # Get product info before deletion
+            product_info = product.to_dict()
+            
+            # Delete product
+            success = product_deleter.delete_products([product_id])
+            
+            if success:
+                commit_catalog_change()
         
         if success:
-            # Reload all managers to reflect changes
-            reload_all_managers()
             
             return jsonify({
                 'success': True,
@@ -581,14 +813,6 @@ def update_product(product_id):
         if not data:
             return jsonify({'error': 'No JSON data provided'}), 400
         
-        # Check if product exists
-        df = product_updater.metadata_df
-        if product_id not in df['id'].values:
-            return jsonify({'error': f'Product with ID {product_id} not found'}), 404
-        
-        # Get current product info
-        current_product = df[df['id'] == product_id].iloc[0].to_dict()
-        
         # Prepare update data - only update provided fields
         update_data = {}
         updateable_fields = ['name', 'brand', 'ingredients', 'categories', 'manufacturer', 'manufacturerNumber']
@@ -601,15 +825,19 @@ def update_product(product_id):
             return jsonify({'error': 'No updateable fields provided'}), 400
         
         # Update product
-        success = product_updater.update_product(product_id, update_data)
+        with catalog_write():
+            # Check if product exists (trong lock: DELETE đồng thời không chen giữa kiểm tra và commit)
+            if searcher.get_product(product_id) is None:
+                return jsonify({'error': f'Product with ID {product_id} not found'}), 404
+            
+            success = product_updater.update_product(product_id, update_data)
+            
+            if success:
+                commit_catalog_change()
+                # Get updated product info từ snapshot vừa publish (trước khi nhả lock)
+                updated_product = searcher.get_product(product_id).to_dict()
         
         if success:
-            # Reload all managers to reflect changes
-            reload_all_managers()
-            
-            # Get updated product info
-            updated_df = searcher.metadata_df  # Use reloaded searcher data
-            updated_product = updated_df[updated_df['id'] == product_id].iloc[0].to_dict()
             
             return jsonify({
                 'success': True,
@@ -635,6 +863,246 @@ def update_product(product_id):
         return jsonify({'error': f'Update product failed: {str(e)}'}), 500
 
 
+@app.route('/api/products/bulk', methods=['GET'])
+def get_products_bulk():
+    """
+    Lấy nhiều sản phẩm theo danh sách ID
+    
+    Query parameters:
+    - ids: danh sách ID cách nhau bởi dấu phẩy (vd: ids=1,2,3; tối đa BULK['max_get_ids'])
+    """
+    try:
+        if not searcher:
+            return jsonify({'error': 'Search service not initialized'}), 500
+        
+        try:
+            ids = [int(value) for value in request.args.get('ids', '').split(',') if value.strip()]
+        except ValueError:
+            return jsonify({'error': 'ids must be a comma-separated list of integers'}), 400
+        if not ids:
+            return jsonify({'error': 'No ids provided'}), 400
+        if len(ids) > BULK['max_get_ids']:
+            return jsonify({'error': f"At most {BULK['max_get_ids']} ids per request"}), 400
+        
+        # Một snapshot cho cả request: các sản phẩm trả về nhất quán với nhau
+        snapshot = searcher.store.snapshot()
+        products, missing_ids = [], []
+        for product_id in ids:
+            product = snapshot.get_product(product_id)
+            if product is None:
+                missing_ids.append(product_id)
+                continue
+            products.append({
+                'id': int(product['id']),
+                'name': safe_str(product.get('name', '')),
+                'brand': safe_str(product.get('brand', '')),
+                'ingredients': safe_str(product.get('ingredients', '')),
+                'categories': safe_str(product.get('categories', '')),
+                'manufacturer': safe_str(product.get('manufacturer', '')),
+                'manufacturerNumber': safe_str(product.get('manufacturerNumber', ''))
+            })
+        
+        return jsonify({
+            'success': True,
+            'products': products,
+            'missing_ids': missing_ids,
+            'timestamp': datetime.now().isoformat()
+        })
+        
+    except Exception as e:
+        print(f"Bulk get products error: {e}")
+        traceback.print_exc()
+        return jsonify({'error': f'Bulk get products failed: {str(e)}'}), 500
+
+
+@app.route('/api/products/bulk', methods=['POST'])
+def bulk_write_products():
+    """
+    Thêm / sửa / xóa nhiều sản phẩm trong một transaction: cả batch được áp dụng hoặc không thao tác nào
+    
+    Request body:
+    {
+        "operations": [
+            {"op": "add", "product": {"name": "...", "brand": "...", "ingredients": "..."}},
+            {"op": "update", "id": 12, "product": {"name": "New name"}},
+            {"op": "delete", "id": 34}
+        ]
+    }
+    """
+    try:
+        if not product_bulk_writer:
+            return jsonify({'error': 'Product bulk writer not initialized'}), 500
+        
+        data = request.get_json()
+        if not data:
+            return jsonify({'error': 'No JSON data provided'}), 400
+        
+        # Embed + commit một lần trong lock ghi (ID tồn tại được kiểm tra trên snapshot mới nhất)
+        with catalog_write():
+            result = product_bulk_writer.apply(data.get('operations'))
+            
+            if result['success']:
+                commit_catalog_change()
+        
+        if not result['success']:
+            return jsonify({'success': False, 'errors': result['errors']}), 400
+        
+        return jsonify({
+            'success': True,
+            'message': f"Applied {len(result['results'])} operations",
+            'results': result['results'],
+            'counts': result['counts'],
+            'store_version': result['version'],
+            'timestamp': datetime.now().isoformat()
+        })
+        
+    except Exception as e:
+        print(f"Bulk write error: {e}")
+        traceback.print_exc()
+        return jsonify({'error': f'Bulk write failed: {str(e)}'}), 500
+
+
+@app.route('/api/import', methods=['POST'])
+def start_import():
+    """
+    Import sản phẩm từ file CSV / JSONL lớn (chạy nền, trả về job id ngay)
+    
+    - multipart/form-data: trường 'file' (+ 'format' nếu đuôi file không phải .csv / .jsonl)
+    - hoặc body là nội dung file, ?format=csv|jsonl (hoặc Content-Type text/csv / application/x-ndjson)
+    Mỗi dòng: name, brand, ingredients, categories, manufacturer, manufacturerNumber; có id → sửa, op=delete → xóa.
+    """
+    try:
+        if not import_runner:
+            return jsonify({'error': 'Import service not initialized'}), 500
+        
+        upload = request.files.get('file') if request.files else None
+        if upload is not None:
+            stream, filename = upload.stream, upload.filename or ''
+            file_format = request.args.get('format') or request.form.get('format') or \
+                detect_format(filename, upload.content_type)
+        else:
+            stream, filename = request.stream, request.args.get('filename', '')
+            file_format = request.args.get('format') or detect_format(filename, request.content_type)
+        
+        if file_format not in FORMATS:
+            return jsonify({'error': f"Unknown format {file_format!r}, expected one of {list(FORMATS)}"}), 400
+        
+        job = import_runner.submit(stream, file_format, filename)
+        if job is None:
+            return jsonify({'error': 'Too many pending import jobs, retry later'}), 429
+        
+        return jsonify({
+            'success': True,
+            'job': job.to_dict(),
+            'status_url': f"/api/import/{job.id}",
+            'timestamp': datetime.now().isoformat()
+        }), 202
+        
+    except Exception as e:
+        print(f"Import error: {e}")
+        traceback.print_exc()
+        return jsonify({'error': f'Import failed: {str(e)}'}), 500
+
+
+@app.route('/api/import', methods=['GET'])
+def list_import_jobs():
+    """Danh sách job import gần đây"""
+    if not import_runner:
+        return jsonify({'error': 'Import service not initialized'}), 500
+    return jsonify({
+        'success': True,
+        'jobs': [job.to_dict() for job in import_runner.list_jobs()],
+        'timestamp': datetime.now().isoformat()
+    })
+
+
+@app.route('/api/import/<job_id>', methods=['GET'])
+def get_import_job(job_id: str):
+    """Tiến độ + lỗi từng dòng của một job import"""
+    if not import_runner:
+        return jsonify({'error': 'Import service not initialized'}), 500
+    job = import_runner.get(job_id)
+    if job is None:
+        return jsonify({'error': f'Import job {job_id} not found'}), 404
+    return jsonify({
+        'success': True,
+        'job': job.to_dict(),
+        'timestamp': datetime.now().isoformat()
+    })
+
+
+@app.route('/api/export', methods=['GET'])
+def export_catalog():
+    """
+    Stream toàn bộ catalog (chunked transfer, không build cả response trong RAM)
+    
+    Query parameters:
+    - format: ndjson (default) | csv
+    - include_vectors: true để kèm embedding (base64, xem header X-Vector-Encoding)
+    - vector_dtype: float16 (default) | float32
+    - since_generation: chỉ sản phẩm thêm/sửa/xóa sau generation này (X-Catalog-Generation của lần export trước)
+    """
+    try:
+        if not searcher:
+            return jsonify({'error': 'Search service not initialized'}), 500
+        
+        since_generation = request.args.get('since_generation')
+        try:
+            since_generation = int(since_generation) if since_generation not in (None, '') else None
+        except ValueError:
+            return jsonify({'error': 'since_generation must be an integer'}), 400
+        
+        try:
+            export = CatalogExport(
+                searcher.store.snapshot(),  # Một snapshot cho cả lần export
+                file_format=request.args.get('format', 'ndjson'),
+                since_generation=since_generation,
+                include_vectors=request.args.get('include_vectors', 'false').lower() in ('1', 'true', 'yes'),
+                vector_dtype=request.args.get('vector_dtype', 'float16')
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        mimetype = 'application/x-ndjson' if export.format == 'ndjson' else 'text/csv'
+        headers = export.headers()
+        headers['Content-Disposition'] = f"attachment; filename=catalog.{export.format}"
+        return Response(stream_with_context(export.stream()), mimetype=mimetype, headers=headers)
+        
+    except Exception as e:
+        print(f"Export error: {e}")
+        traceback.print_exc()
+        return jsonify({'error': f'Export failed: {str(e)}'}), 500
+
+
+@app.route('/api/admin/reload', methods=['POST'])
+def admin_reload():
+    """
+    Đọc lại catalog từ đĩa (vd sau khi chạy src/embedding.py hoặc sửa file data/ bên ngoài server)
+    """
+    try:
+        if not searcher:
+            return jsonify({'error': 'Search service not initialized'}), 500
+        
+        with catalog_write_lock:
+            success = reload_all_managers()
+            if success:
+                commit_catalog_change()
+        
+        if success:
+            return jsonify({
+                'success': True,
+                'product_store': searcher.store.stats(),
+                'timestamp': datetime.now().isoformat()
+            })
+        else:
+            return jsonify({'error': 'Failed to reload catalog'}), 500
+        
+    except Exception as e:
+        print(f"Admin reload error: {e}")
+        traceback.print_exc()
+        return jsonify({'error': f'Reload failed: {str(e)}'}), 500
+
+
 @app.errorhandler(404)
 def not_found(error):
     """Handle 404 errors"""
@@ -658,11 +1126,17 @@ if __name__ == '__main__':
     print("🌐 API Endpoints:")
     print("  GET  /api/health - Health check")
     print("  POST /api/search - Search products")
+    print("  POST /api/search/batch - Search many queries in one request")
     print("  GET  /api/products - List products (with pagination)")
     print("  POST /api/products - Add new product")
     print("  GET  /api/products/<id> - Get product by ID")
     print("  PUT  /api/products/<id> - Update product by ID")
     print("  DELETE /api/products/<id> - Delete product by ID")
+    print("  GET  /api/products/bulk?ids=1,2,3 - Get many products by ID")
+    print("  POST /api/products/bulk - Add/update/delete many products in one transaction")
+    print("  POST /api/import - Import products from a CSV / JSONL upload (background job)")
+    print("  GET  /api/import/<job_id> - Import job progress and row errors")
+    print("  GET  /api/export - Stream the catalog as NDJSON / CSV (optionally with vectors)")
     print("  GET  /api/stats - Get system statistics")
     
     # Find available port
@@ -93,11 +93,12 @@ SEARCH_CONFIG = {
     'index_type': 'IndexIDMap',  # Support for dynamic updates
 }
 
-# FAISS index settings
+# FAISS index settings (runtime đọc FAISS_CONFIG trong simple_config.py qua src/index_factory.py)
 FAISS_CONFIG = {
-    'index_type': 'IndexFlatIP',  # Inner Product for cosine similarity
+    'index_type': 'flat',  # 'flat' | 'ivf_flat' | 'hnsw' | 'ivf_pq' | 'sq_fp16' | 'sq8', Inner Product for cosine similarity
     'use_gpu': False,  # Set to True if GPU available and beneficial
-    'nprobe': 1,  # For IVF indices
+    'nprobe': 16,  # For IVF indices
+    'ef_search': 64,  # For HNSW indices
     'metric': 'METRIC_INNER_PRODUCT'  # Will be converted to faiss constant when needed
 }
 
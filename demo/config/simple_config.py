@@ -10,7 +10,8 @@ API_SETTINGS = {
     'debug': False,
     'cors_enabled': True,
     'max_page_size': 100,
-    'default_page_size': 20
+    'default_page_size': 20,
+    'max_batch_queries': 256  # Số query tối đa cho /api/search/batch
 }
 
 # ============================================================================
@@ -34,6 +35,17 @@ DATA_PATHS = {
     'metadata': os.path.join(PROJECT_ROOT, 'data', 'product_metadata.csv'),
     'embeddings': os.path.join(PROJECT_ROOT, 'data', 'embeddings_attention.npy'),
     'faiss_index': os.path.join(PROJECT_ROOT, 'data', 'faiss_index.index'),
+    'binary_index': os.path.join(PROJECT_ROOT, 'data', 'binary_index.index'),
+    'projection': os.path.join(PROJECT_ROOT, 'data', 'projection.npz'),
+    'attention_pooling': os.path.join(PROJECT_ROOT, 'data', 'attention_pooling.pt'),
+    'embedding_cache': os.path.join(PROJECT_ROOT, 'data', 'embedding_cache'),
+    'delta_index': os.path.join(PROJECT_ROOT, 'data', 'delta_index.npz'),
+    'tombstones': os.path.join(PROJECT_ROOT, 'data', 'tombstones.npy'),
+    'catalog_log': os.path.join(PROJECT_ROOT, 'data', 'catalog.wal'),
+    'snapshots': os.path.join(PROJECT_ROOT, 'data', 'snapshots'),
+    'snapshot_pointer': os.path.join(PROJECT_ROOT, 'data', 'CURRENT'),
+    'imports': os.path.join(PROJECT_ROOT, 'data', 'imports'),
+    'build': os.path.join(PROJECT_ROOT, 'data', 'build'),
     'evaluation_results': os.path.join(PROJECT_ROOT, 'data', 'evaluation_results.json')
 }
 
@@ -42,11 +54,153 @@ DATASET_LIMIT = 500
 BATCH_SIZE = 32
 MAX_LENGTH = 512
 
+# Build embeddings cho cả catalog (src/embedding.py): tokenize một lượt, gom text theo độ dài token
+EMBEDDING_BUILD = {
+    'batch_size': 128,             # Số text / chunk mỗi forward pass trên GPU (text cùng bucket → padding ít)
+    'cpu_batch_size': 16,          # Số text / chunk mỗi forward pass trên CPU (batch lớn không nhanh hơn, chỉ thêm padding)
+    'bucket_size': 4096,           # Số text mỗi lần model.encode (đã sắp theo độ dài token)
+    'tokenize_batch_size': 10000   # Số text mỗi lần gọi fast tokenizer để đếm token
+}
+
+# Build song song nhiều process CPU cho cả catalog (src/parallel_build.py, checkpoint ở data/build/)
+PARALLEL_BUILD = {
+    'workers': 4,                  # Số process worker (mỗi process giữ một bản model)
+    'threads_per_worker': None,    # Số thread intra-op của torch mỗi worker (None → số CPU / workers)
+    'shard_rows': 5000             # Số sản phẩm mỗi shard (đơn vị checkpoint / resume)
+}
+
+# Attention pooling head gộp chunks của text dài (src/attention_pooling.py, lưu ở data/attention_pooling.pt)
+ATTENTION_POOLING = {
+    'seed': 0,                     # Seed khởi tạo trọng số khi chưa có file
+    'batch_size': 256              # Số text mỗi lần pool (pad tới số chunk lớn nhất trong batch)
+}
+
+# Cache embedding theo nội dung (src/embedding_cache.py, data/embedding_cache/): text_corpus không đổi → không encode lại
+EMBEDDING_CACHE = {
+    'enabled': True,
+    'dtype': 'float32',            # 'float32' (giống hệt vector vừa encode) | 'float16' (nửa dung lượng)
+    'merge_threshold': 65536       # Số key mới giữ trong dict trước khi gộp vào mảng đã sắp
+}
+
 # Search settings
 DEFAULT_TOP_K = 3
 RETRIEVAL_K = 20  # For hybrid search first stage
 MAX_TOP_K = 10
 
+# FAISS index settings - dùng chung cho mọi đường build/rebuild (src/index_factory.py)
+FAISS_CONFIG = {
+    'index_type': 'flat',          # 'flat' | 'ivf_flat' | 'hnsw' | 'ivf_pq' | 'sq_fp16' | 'sq8'
+    'nlist': None,                 # IVF: số cluster (None = 4*sqrt(N))
+    'nprobe': 16,                  # IVF: số cluster duyệt khi search
+    'hnsw_m': 32,                  # HNSW: số neighbor mỗi node
+    'ef_construction': 200,        # HNSW: độ rộng khi build
+    'ef_search': 64,               # HNSW: độ rộng khi search
+    'pq_m': 64,                    # IVF-PQ: số sub-quantizer (tự giảm về ước số của dimension)
+    'pq_nbits': 8,                 # IVF-PQ: số bit mỗi sub-quantizer
+    'train_sample_size': 100000,   # Số vectors tối đa dùng để train
+    'add_block_size': 100000,      # Số vectors add vào index mỗi lần
+    'report_queries': 200,         # Số query cho báo cáo recall-vs-latency
+    'report_k': 10,
+    'report_file': os.path.join(PROJECT_ROOT, 'data', 'index_report.json')
+}
+
+# Embeddings storage (embeddings_attention.npy)
+EMBEDDING_STORAGE = {
+    'dtype': 'float32',            # 'float32' | 'float16' | 'sq8' - kiểu khi ghi file
+    'mmap': True,                  # Load bằng mmap_mode='c' (copy-on-write, page lazily)
+    'report_dtypes': ['float16', 'sq8']  # Đo recall delta so với float32 khi build
+}
+
+# Delta index trước main index: add/update/delete không sửa main index cho tới lần merge
+DELTA_INDEX = {
+    'enabled': True,
+    'merge_threshold': 1000,       # Merge nền khi số vector trong delta vượt ngưỡng
+    'retry_backoff_s': 5,          # Merge bị bỏ / lỗi: chờ chừng này giây trước lần thử sau, gấp đôi mỗi lần
+    'max_retry_backoff_s': 300
+}
+
+# Delete ghi tombstone (ID giữ nguyên, bị loại lúc search), compaction nền dọn vector của ID đã xóa
+COMPACTION = {
+    'enabled': True,
+    'tombstone_ratio': 0.1,        # Compact khi số tombstone / số vector trong main index ≥ ratio
+    'min_tombstones': 100,         # và có ít nhất chừng này tombstone
+    'retry_backoff_s': 5,          # Compaction bị bỏ / lỗi: chờ chừng này giây trước lần thử sau, gấp đôi mỗi lần
+    'max_retry_backoff_s': 300
+}
+
+# Write-ahead log: add/update/delete chỉ append vào data/catalog.wal, snapshot đầy đủ được ghi lúc checkpoint
+WAL = {
+    'enabled': True,
+    'fsync': True,                 # fsync log trước khi trả response (và file checkpoint trước khi cắt log)
+    'group_commit_ms': 2,          # Thread fsync chờ thêm chừng này ms để các write đồng thời dùng chung một fsync
+    'checkpoint_bytes': 64 * 1024 * 1024,  # Checkpoint khi log vượt kích thước này
+    'checkpoint_interval_s': 300   # hoặc khi log không rỗng và checkpoint gần nhất đã quá chừng này giây
+}
+
+# Checkpoint ghi vào data/snapshots/gen-<generation>/ rồi trỏ data/CURRENT vào (xem src/snapshot_dir.py)
+SNAPSHOTS = {
+    'keep': 2,                     # Số generation giữ lại trên đĩa
+    'verify_checksums': True       # Kiểm tra sha256 trong manifest khi load (đọc toàn bộ file một lần)
+}
+
+# /api/products/bulk: nhiều add/update/delete trong một transaction (một lần embed, một CatalogChange)
+BULK = {
+    'max_operations': 10000,       # Số thao tác tối đa mỗi request ghi
+    'max_get_ids': 1000            # Số ID tối đa mỗi request đọc
+}
+
+# Import CSV / JSONL qua /api/import: file upload được đọc từng dòng, embed + commit theo chunk
+IMPORT = {
+    'chunk_rows': 256,             # Số dòng mỗi lần embed + commit (giới hạn RAM và thời gian giữ lock ghi)
+    'max_pending_jobs': 4,         # Job chờ tối đa - vượt quá thì /api/import trả 429
+    'max_errors': 100,             # Số lỗi từng dòng giữ lại trong job status
+    'keep_jobs': 50                # Số job đã xong giữ lại để xem status
+}
+
+# Export catalog qua /api/export (NDJSON / CSV, stream theo chunk)
+EXPORT = {
+    'chunk_rows': 1000             # Số sản phẩm mỗi chunk được ghi ra response
+}
+
+# Giảm chiều vector của FAISS index (rescore top candidates bằng vector đầy đủ)
+PROJECTION = {
+    'enabled': False,
+    'method': 'pca',               # 'pca' (train lúc build index) | 'truncate' (giữ prefix, cho model Matryoshka)
+    'dim': 256,                    # Số chiều của index (128-256)
+    'train_sample_size': 100000,   # Số vectors tối đa để train PCA
+    'rescore_k': 100               # Số candidates được rescore bằng vector đầy đủ
+}
+
+# Binary-quantized first stage (Hamming scan + rescoring bằng vector float)
+BINARY_SEARCH = {
+    'enabled': False,              # Bật cho catalog rất lớn
+    'candidate_multiplier': 10,    # Phase 1 lấy max(k * multiplier, min_candidates) candidates
+    'min_candidates': 100,
+    'report_file': os.path.join(PROJECT_ROOT, 'data', 'binary_search_report.json')
+}
+
+# Query embedding cache (ProductSearcher)
+QUERY_CACHE = {
+    'enabled': True,
+    'max_size': 1000,          # Số query tối đa trong LRU của mỗi process
+    'ttl_seconds': 3600,       # 1 hour
+    'disk_dir': None           # vd: os.path.join(PROJECT_ROOT, 'data', 'query_cache') để các worker dùng chung
+}
+
+# Cross-encoder score cache (hybrid search re-ranking)
+SCORE_CACHE = {
+    'enabled': True,
+    'max_size': 50000,         # Số cặp (query, sản phẩm) tối đa
+    'ttl_seconds': None        # Không hết hạn - invalidate theo update/delete
+}
+
+# Search result cache (/api/search response-level, theo index generation)
+RESULT_CACHE = {
+    'enabled': True,
+    'max_size': 2000,          # Số response tối đa
+    'ttl_seconds': 600         # 10 minutes
+}
+
 # Evaluation targets
 TARGETS = {
     'hit_at_3_percent': 95.0,      # ≥ 95%
@@ -9,7 +9,6 @@ import os
 import sys
 import pandas as pd
 import numpy as np
-import faiss
 import torch
 from sentence_transformers import SentenceTransformer
 from transformers import AutoTokenizer
@@ -20,23 +19,27 @@ from typing import Dict, Optional
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from simple_config import (
-    EMBEDDING_MODEL_NAME, DATA_PATHS, BATCH_SIZE, MAX_LENGTH, get_device,
+    EMBEDDING_MODEL_NAME, BATCH_SIZE, MAX_LENGTH, get_device,
     get_global_embedding_model, monitor_gpu_memory
 )
 from src.preprocess import create_text_corpus_for_product
-from src.embedding import embed_text_with_attention, load_embedding_model
+from src.embedding import embed_texts, load_embedding_model
+from src.product_store import ProductStore, CatalogView, CatalogChange
+from src.bulk_row import ProductBulkWriter
 
-class ProductManager:
-    """Quản lý thêm/sửa/xóa sản phẩm"""
+class ProductManager(CatalogView):
+    """
+    Quản lý thêm/sửa/xóa sản phẩm
+    index, metadata_df, embeddings, embedding_ids, delta, binary_index... đọc từ snapshot của ProductStore
+    dùng chung (không giữ bản copy riêng); khi thêm sản phẩm chỉ copy phần bị sửa rồi ghi file.
+    """
     
-    def __init__(self):
-        """Khởi tạo ProductManager"""
+    def __init__(self, store: Optional[ProductStore] = None):
+        """Khởi tạo ProductManager (store: ProductStore dùng chung, tạo mới nếu không truyền)"""
         self.device = get_device()
         self.model = None
         self.tokenizer = None
-        self.index = None
-        self.metadata_df = None
-        self.embeddings = None  # Thêm embeddings array
+        self.store = store
         self._load_models_and_data()
     
     def _load_models_and_data(self):
@@ -47,31 +50,27 @@ class ProductManager:
             # ✅ Sử dụng global model thay vì load mới
             self.model, self.tokenizer = get_global_embedding_model()
             
-            self._load_data()
+            self._load_data(reload=False)
             
         except Exception as e:
             print(f"❌ Error loading models: {e}")
     
-    def _load_data(self):
-        """Load/reload index, embeddings và metadata"""
+    def _load_data(self, reload: bool = True):
+        """Load/reload index, embeddings và metadata (qua ProductStore dùng chung; reload=False: dùng snapshot hiện có)"""
         try:
-            # Load FAISS index
-            self.index = faiss.read_index(DATA_PATHS['faiss_index'])
+            if self.store is None:
+                self.store = ProductStore()
+            elif reload:
+                self.store.reload()
             
-            # Load embeddings array
-            self.embeddings = np.load(DATA_PATHS['embeddings'])
-            
-            # Load metadata
-            self.metadata_df = pd.read_csv(DATA_PATHS['metadata'])
+            if self.store.snapshot() is None:
+                print("Please run preprocess.py and embedding.py first")
+                return
             
             print(f"✅ Loaded {len(self.metadata_df)} products")
             print(f"✅ Loaded embeddings: {self.embeddings.shape}")
             print(f"✅ Index has {self.index.ntotal} vectors")
             
-        except FileNotFoundError as e:
-            print(f"❌ Error loading files: {e}")
-            print("Please run preprocess.py and embedding.py first")
-            
         except Exception as e:
             print(f"❌ Error: {e}")
     
@@ -87,29 +86,9 @@ class ProductManager:
         )
     
     def _create_embedding(self, text: str) -> np.ndarray:
-        """Tạo embedding cho text"""
+        """Tạo embedding cho text (qua embedding cache, attention pooling nếu text dài)"""
         try:
-            # Kiểm tra độ dài text
-            tokens = self.tokenizer.tokenize(text)
-            
-            if len(tokens) <= MAX_LENGTH:
-                # Text ngắn - embed bình thường
-                embedding = self.model.encode(
-                    text,
-                    batch_size=BATCH_SIZE,
-                    show_progress_bar=False,
-                    normalize_embeddings=True,
-                    max_length=MAX_LENGTH,
-                    device=self.device,
-                    convert_to_tensor=True
-                )
-            else:
-                # Text dài - sử dụng attention pooling
-                embedding = embed_text_with_attention(
-                    text, self.model, self.tokenizer, MAX_LENGTH, self.device, BATCH_SIZE
-                )
-            
-            return embedding.detach().cpu().numpy()
+            return embed_texts([text], self.model, self.tokenizer, MAX_LENGTH, self.device, BATCH_SIZE)[0]
             
         except Exception as e:
             print(f"❌ Error creating embedding: {e}")
@@ -191,7 +170,8 @@ class ProductManager:
     
     def add_product(self, product_data: Optional[Dict[str, str]] = None) -> bool:
         """Thêm sản phẩm mới vào cơ sở dữ liệu"""
-        if self.model is None or self.index is None or self.metadata_df is None or self.embeddings is None:
+        snapshot = self.store.snapshot() if self.store is not None else None
+        if self.model is None or snapshot is None:
             print("❌ Models hoặc data chưa được load")
             return False
         
@@ -204,8 +184,8 @@ class ProductManager:
         try:
             print("\n🔄 Processing new product...")
             
-            # 1. Tạo ID mới
-            new_id = self.metadata_df['id'].max() + 1 if len(self.metadata_df) > 0 else 0
+            # 1. Tạo ID mới (next_id của catalog: không dùng lại ID đã xóa, kể cả sau compaction)
+            new_id = snapshot.next_id
             
             # 2. Tạo text corpus
             text_corpus = self._create_text_corpus(product_data)
@@ -234,29 +214,18 @@ class ProductManager:
                 'text_corpus': text_corpus
             }
             
-            # Thêm vào DataFrame
-            self.metadata_df = pd.concat([
-                self.metadata_df, 
-                pd.DataFrame([new_row])
-            ], ignore_index=True)
-            
-            # 5. Thêm vào embeddings array
-            self.embeddings = np.vstack([self.embeddings, embedding.reshape(1, -1)])
-            
-            # 6. Thêm vào FAISS index
-            embedding_2d = embedding.reshape(1, -1)  # Reshape to (1, dimension)
-            self.index.add_with_ids(embedding_2d, np.array([new_id], dtype=np.int64))
-            
-            # 7. Lưu file
-            self._save_data()
+            # 5-7. Phát CatalogChange: store thêm dòng metadata / embeddings, ghi vector vào FAISS index
+            #      (delta index nếu bật - main index chỉ đổi khi merge), lưu file và publish snapshot mới
+            change = CatalogChange(rows=pd.DataFrame([new_row]), vectors=embedding.reshape(1, -1))
+            snapshot = self.store.commit(change)
             
             print(f"✅ Đã thêm sản phẩm thành công!")
             print(f"   • ID: {new_id}")
             print(f"   • Tên: {product_data['name']}")
             print(f"   • Thương hiệu: {product_data['brand']}")
-            print(f"   • Total products: {len(self.metadata_df)}")
-            print(f"   • Total embeddings: {self.embeddings.shape[0]}")
-            print(f"   • Total vectors: {self.index.ntotal}")
+            print(f"   • Total products: {snapshot.num_products}")
+            print(f"   • Total embeddings: {snapshot.embeddings.shape[0]}")
+            print(f"   • Total vectors: {snapshot.index.ntotal + (len(snapshot.delta) if snapshot.delta is not None else 0)}")
             
             return True
             
@@ -264,35 +233,22 @@ class ProductManager:
             print(f"❌ Lỗi khi thêm sản phẩm: {e}")
             return False
     
-    def _save_data(self):
-        """Lưu metadata, embeddings và FAISS index"""
-        try:
-            # Lưu metadata
-            self.metadata_df.to_csv(DATA_PATHS['metadata'], index=False)
-            
-            # Lưu embeddings array
-            np.save(DATA_PATHS['embeddings'], self.embeddings)
-            
-            # Lưu FAISS index
-            faiss.write_index(self.index, DATA_PATHS['faiss_index'])
-            
-            print("💾 Đã lưu tất cả dữ liệu")
-            
-        except Exception as e:
-            print(f"❌ Lỗi khi lưu dữ liệu: {e}")
-    
     def batch_add_products(self, products_list):
-        """Thêm nhiều sản phẩm cùng lúc"""
+        """
+        Thêm nhiều sản phẩm cùng lúc: embed một lượt và commit một lần (ProductBulkWriter)
+        Cả batch được thêm hoặc không sản phẩm nào được thêm (trả về số sản phẩm đã thêm).
+        """
         print(f"\n🔄 Thêm {len(products_list)} sản phẩm...")
         
-        success_count = 0
-        for i, product_data in enumerate(products_list, 1):
-            print(f"\nThêm sản phẩm {i}/{len(products_list)}:")
-            if self.add_product(product_data):
-                success_count += 1
+        writer = ProductBulkWriter(store=self.store)
+        result = writer.apply([{'op': 'add', 'product': product_data} for product_data in products_list])
+        if not result['success']:
+            for error in result['errors']:
+                print(f"   • {error}")
+            return 0
         
-        print(f"\n✅ Đã thêm thành công {success_count}/{len(products_list)} sản phẩm")
-        return success_count
+        print(f"\n✅ Đã thêm thành công {result['counts']['add']}/{len(products_list)} sản phẩm")
+        return result['counts']['add']
     
     def search_test(self, query: str, top_k: int = 3):
         """Test search với sản phẩm mới"""
@@ -315,9 +271,8 @@ class ProductManager:
             print("="*60)
             
             for i, (idx, score) in enumerate(zip(indices[0], distances[0]), 1):
-                product_row = self.metadata_df[self.metadata_df['id'] == idx]
-                if not product_row.empty:
-                    row = product_row.iloc[0]
+                row = self.get_product(idx)
+                if row is not None:
                     print(f"{i}. {row['name']} - {row['brand']}")
                     print(f"   Score: {score:.4f}")
                     print(f"   ID: {row['id']}")
@@ -0,0 +1,67 @@
+"""
+Buffer numpy tăng dung lượng kiểu nhân đôi cho dữ liệu chỉ append (embeddings, product id, cột metadata)
+- Append ghi vào phần dư phía sau rồi trả về view [:size] mới → amortized O(số dòng thêm), không copy cả catalog
+- View đã trả ra trước đó (snapshot cũ) không bị đổi vì chỉ các dòng ≥ size cũ được ghi
+- Chỉ view mới nhất của buffer được append tại chỗ; append từ một view khác copy sang buffer mới (một lần)
+"""
+
+import numpy as np
+from typing import Optional, Tuple
+
+MIN_CAPACITY = 1024
+
+
+def same_start(a: np.ndarray, b: np.ndarray) -> bool:
+    """Hai mảng bắt đầu ở cùng vùng nhớ (view [:n] và [:m] của cùng một buffer)"""
+    return (isinstance(a, np.ndarray) and isinstance(b, np.ndarray)
+            and a.__array_interface__['data'][0] == b.__array_interface__['data'][0])
+
+
+class AppendBuffer:
+    """Mảng có dung lượng dư; view() là phần đã dùng"""
+
+    def __init__(self, array, capacity: Optional[int] = None):
+        """Copy array vào buffer mới có dung lượng ≥ capacity"""
+        array = np.asarray(array)
+        capacity = max(capacity or 0, len(array), MIN_CAPACITY)
+        self._data = np.empty((capacity,) + array.shape[1:], dtype=array.dtype)
+        self._data[:len(array)] = array
+        self._size = len(array)
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def capacity(self) -> int:
+        return len(self._data)
+
+    def view(self) -> np.ndarray:
+        return self._data[:self._size]
+
+    def owns(self, array) -> bool:
+        """array là view mới nhất của buffer (append tiếp không làm đổi view nào khác)"""
+        return (isinstance(array, np.ndarray) and not isinstance(array, np.memmap)
+                and len(array) == self._size and array.dtype == self._data.dtype
+                and array.shape[1:] == self._data.shape[1:] and same_start(array, self._data))
+
+    def append(self, rows) -> np.ndarray:
+        """Ghi rows vào sau phần đã dùng (nhân đôi dung lượng khi thiếu), trả về view mới"""
+        rows = np.asarray(rows, dtype=self._data.dtype).reshape((-1,) + self._data.shape[1:])
+        needed = self._size + len(rows)
+        if needed > len(self._data):
+            data = np.empty((max(needed, 2 * len(self._data)),) + self._data.shape[1:], dtype=self._data.dtype)
+            data[:self._size] = self._data[:self._size]
+            self._data = data
+        self._data[self._size:needed] = rows
+        self._size = needed
+        return self.view()
+
+    @classmethod
+    def extend(cls, buffer: Optional['AppendBuffer'], array, rows) -> Tuple['AppendBuffer', np.ndarray]:
+        """
+        array + rows: append tại chỗ nếu array là view mới nhất của buffer,
+        nếu không (lần đầu, mảng memory-mapped, đã bị copy khi sửa...) copy array sang buffer mới
+        """
+        if buffer is None or not buffer.owns(array):
+            buffer = cls(array, capacity=2 * (len(array) + len(rows)))
+        return buffer, buffer.append(rows)
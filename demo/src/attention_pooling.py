@@ -0,0 +1,156 @@
+"""
+Attention pooling head gộp embedding các chunk của một text dài thành một vector
+- Một bộ trọng số duy nhất lưu cạnh faiss index (data/attention_pooling.pt): build (embedding.py),
+  add / update / bulk / import đều pool giống nhau → vector của cùng một text tái lập được
+- Chưa có file: khởi tạo theo seed ATTENTION_POOLING['seed'] rồi lưu lại
+- Load một lần (cache theo path + mtime + device), chạy ở inference mode,
+  pool cả batch text một lần với mask cho các chunk padding
+"""
+
+import os
+import sys
+import hashlib
+import torch
+import torch.nn as nn
+from typing import List, Optional, Tuple
+
+# Add config path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'config'))
+from simple_config import DATA_PATHS, ATTENTION_POOLING
+
+# Cache head đã load theo (path, device) → (mtime, head) để add/update không đọc lại file mỗi lần
+_loaded_pooling = {}
+
+
+class AttentionPooling(nn.Module):
+    """
+    Attention pooling layer để kết hợp embeddings từ nhiều chunks
+    """
+    def __init__(self, embed_dim):
+        super().__init__()
+        self.embed_dim = embed_dim
+        self.attention = nn.Sequential(
+            nn.Linear(embed_dim, 128),
+            nn.Tanh(),
+            nn.Linear(128, 1)
+        )
+
+    def forward(self, embeddings, mask=None):
+        # embeddings: [batch_size, num_chunks, embed_dim], mask: [batch_size, num_chunks] (True = chunk thật)
+        scores = self.attention(embeddings)  # [batch_size, num_chunks, 1]
+        if mask is not None:
+            scores = scores.masked_fill(~mask.unsqueeze(-1), float('-inf'))
+        weights = torch.softmax(scores, dim=1)  # [batch_size, num_chunks, 1]
+        weighted = embeddings * weights  # [batch_size, num_chunks, embed_dim]
+        pooled = weighted.sum(dim=1)  # [batch_size, embed_dim]
+        return pooled
+
+
+def create_attention_pooling(embed_dim: int, seed: Optional[int] = None) -> AttentionPooling:
+    """Head mới với trọng số khởi tạo theo seed (cùng seed + embed_dim → cùng trọng số)"""
+    seed = ATTENTION_POOLING['seed'] if seed is None else seed
+    state = torch.random.get_rng_state()
+    try:
+        torch.manual_seed(seed)
+        pooling = AttentionPooling(embed_dim)
+    finally:
+        torch.random.set_rng_state(state)
+    return pooling
+
+
+def save_attention_pooling(pooling: AttentionPooling, path: Optional[str] = None) -> str:
+    """Lưu trọng số head (ghi file tạm rồi os.replace)"""
+    path = path or DATA_PATHS['attention_pooling']
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    state = {key: value.detach().cpu() for key, value in pooling.state_dict().items()}
+    torch.save({'embed_dim': pooling.embed_dim, 'state_dict': state}, tmp_path)
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_attention_pooling(embed_dim: int, device, path: Optional[str] = None) -> AttentionPooling:
+    """
+    Head đang dùng trên device (eval, không tính gradient), cache theo mtime của file
+    Chưa có file hoặc file khác embed_dim (đổi embedding model): tạo head theo seed và lưu lại.
+    """
+    path = path or DATA_PATHS['attention_pooling']
+    key = (path, str(device))
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        mtime = None
+
+    cached = _loaded_pooling.get(key)
+    if cached is not None and cached[0] == mtime and mtime is not None and cached[1].embed_dim == embed_dim:
+        return cached[1]
+
+    pooling = None
+    if mtime is not None:
+        data = torch.load(path, map_location='cpu', weights_only=True)
+        if data['embed_dim'] == embed_dim:
+            pooling = AttentionPooling(embed_dim)
+            pooling.load_state_dict(data['state_dict'])
+        else:
+            print(f"⚠️ Attention pooling head có embed_dim {data['embed_dim']} ≠ {embed_dim} - tạo head mới")
+    if pooling is None:
+        pooling = create_attention_pooling(embed_dim)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        save_attention_pooling(pooling, path)
+        mtime = os.path.getmtime(path)
+        print(f"✅ Attention pooling head saved: {path} (seed {ATTENTION_POOLING['seed']})")
+
+    pooling.fingerprint = pooling_fingerprint(pooling)
+    pooling = pooling.to(device).eval().requires_grad_(False)
+    _loaded_pooling[key] = (mtime, pooling)
+    return pooling
+
+
+def saved_pooling_dim(path: Optional[str] = None) -> Optional[int]:
+    """embed_dim của head đã lưu (None nếu chưa có file)"""
+    path = path or DATA_PATHS['attention_pooling']
+    if not os.path.exists(path):
+        return None
+    return int(torch.load(path, map_location='cpu', weights_only=True)['embed_dim'])
+
+
+def pooling_fingerprint(pooling: AttentionPooling) -> str:
+    """sha256 của trọng số head (một phần key của embedding cache)"""
+    digest = hashlib.sha256()
+    for name, value in sorted(pooling.state_dict().items()):
+        digest.update(name.encode('utf-8'))
+        digest.update(value.detach().cpu().contiguous().numpy().tobytes())
+    return digest.hexdigest()[:16]
+
+
+def remove_attention_pooling(path: Optional[str] = None):
+    """Xóa file trọng số head (build sau sẽ tạo lại theo seed)"""
+    path = path or DATA_PATHS['attention_pooling']
+    if os.path.exists(path):
+        os.remove(path)
+    for key in [key for key in _loaded_pooling if key[0] == path]:
+        del _loaded_pooling[key]
+
+
+def pool_chunks(chunk_embeddings: torch.Tensor, spans: List[Tuple[int, int]], pooling: AttentionPooling,
+                batch_size: Optional[int] = None) -> torch.Tensor:
+    """
+    Pool chunks của nhiều text: spans[j] = (vị trí chunk đầu, số chunk) của text j trong chunk_embeddings
+    Text được sắp theo số chunk, mỗi batch pad tới số chunk lớn nhất (mask bỏ chunk padding).
+    Trả về tensor [len(spans), embed_dim] đã normalize L2, theo đúng thứ tự spans.
+    """
+    batch_size = batch_size or ATTENTION_POOLING['batch_size']
+    device = chunk_embeddings.device
+    pooled = torch.empty((len(spans), chunk_embeddings.shape[1]), dtype=torch.float32, device=device)
+    order = sorted(range(len(spans)), key=lambda j: spans[j][1])
+
+    with torch.inference_mode():
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            starts = torch.tensor([spans[j][0] for j in batch], device=device)
+            counts = torch.tensor([spans[j][1] for j in batch], device=device)
+            offsets = torch.arange(int(counts.max()), device=device)
+            mask = offsets.unsqueeze(0) < counts.unsqueeze(1)  # [batch, max_chunks]
+            positions = torch.where(mask, starts.unsqueeze(1) + offsets, starts.unsqueeze(1))
+            result = pooling(chunk_embeddings[positions].float(), mask)  # [batch, embed_dim]
+            pooled[torch.tensor(batch, device=device)] = torch.nn.functional.normalize(result, p=2, dim=1)
+    return pooled
@@ -0,0 +1,120 @@
+"""
+Benchmark thêm sản phẩm vào ProductStore (chỉ phần trong bộ nhớ, không ghi đĩa / không tạo embedding)
+So sánh append bằng buffer dư dung lượng (CatalogSnapshot.apply) với cách cũ:
+pd.concat metadata + np.vstack embeddings + build lại bảng id → dòng cho mỗi sản phẩm.
+Đo thêm update một sản phẩm: có delta index (ghi vào delta) và không có delta (ghi tại chỗ vào main index).
+
+Chạy: python src/benchmark_add.py [số sản phẩm ban đầu ...]   (mặc định 10000 100000 1000000)
+"""
+
+import sys
+import time
+import numpy as np
+import pandas as pd
+import faiss
+
+from id_index import IdPositionIndex
+from delta_index import DeltaIndex
+from product_store import CatalogChange, CatalogSnapshot, ProductStore
+
+DIMENSION = 32
+ADDS = 1000
+
+
+def make_catalog(size: int, rng: np.random.Generator):
+    """Catalog giả: metadata vài cột text, embeddings ngẫu nhiên, flat index + delta rỗng"""
+    ids = np.arange(size, dtype=np.int64)
+    metadata_df = pd.DataFrame({
+        'id': ids,
+        'name': [f"product {i}" for i in ids],
+        'brand': 'brand',
+        'categories': 'food',
+        'text_corpus': 'text'
+    })
+    embeddings = rng.standard_normal((size, DIMENSION), dtype=np.float32)
+    index = faiss.IndexIDMap(faiss.IndexFlatIP(DIMENSION))
+    index.add_with_ids(embeddings, ids)
+    return metadata_df, embeddings, ids, index
+
+
+def new_product(product_id: int, rng: np.random.Generator):
+    """Một dòng metadata + vector cho sản phẩm mới"""
+    row = pd.DataFrame([{'id': product_id, 'name': f"product {product_id}", 'brand': 'brand',
+                         'categories': 'food', 'text_corpus': 'text'}])
+    return row, rng.standard_normal((1, DIMENSION), dtype=np.float32)
+
+
+def benchmark_store(size: int, adds: int) -> float:
+    """Số sản phẩm thêm được mỗi giây qua ProductStore.commit (persist=False)"""
+    rng = np.random.default_rng(0)
+    metadata_df, embeddings, ids, index = make_catalog(size, rng)
+    store = ProductStore(load=False)
+    store.publish(CatalogSnapshot(index, metadata_df, embeddings, ids, delta=DeltaIndex(DIMENSION)))
+
+    start = time.time()
+    for _ in range(adds):
+        snapshot = store.snapshot()
+        row, vector = new_product(snapshot.next_id, rng)
+        store.commit(CatalogChange(rows=row, vectors=vector), persist=False)
+    elapsed = time.time() - start
+
+    snapshot = store.snapshot()
+    assert snapshot.num_products == size + adds and snapshot.get_product(size + adds - 1) is not None
+    return adds / elapsed
+
+
+def benchmark_update(size: int, updates: int, use_delta: bool) -> float:
+    """Số sản phẩm update được mỗi giây qua ProductStore.commit (persist=False)"""
+    rng = np.random.default_rng(0)
+    metadata_df, embeddings, ids, index = make_catalog(size, rng)
+    store = ProductStore(load=False)
+    delta = DeltaIndex(DIMENSION) if use_delta else None
+    store.publish(CatalogSnapshot(index, metadata_df, embeddings, ids, delta=delta))
+
+    targets = rng.integers(0, size, updates)
+    start = time.time()
+    for product_id in targets:
+        row, vector = new_product(int(product_id), rng)
+        store.commit(CatalogChange(rows=row, vectors=vector), persist=False)
+    elapsed = time.time() - start
+
+    snapshot = store.snapshot()
+    assert snapshot.num_products == size
+    return updates / elapsed
+
+
+def benchmark_naive(size: int, adds: int) -> float:
+    """Số sản phẩm thêm được mỗi giây khi copy cả catalog mỗi lần thêm"""
+    rng = np.random.default_rng(0)
+    metadata_df, embeddings, ids, _ = make_catalog(size, rng)
+
+    start = time.time()
+    for _ in range(adds):
+        new_id = int(metadata_df['id'].max()) + 1
+        row, vector = new_product(new_id, rng)
+        metadata_df = pd.concat([metadata_df, row], ignore_index=True)
+        embeddings = np.vstack([embeddings, vector])
+        ids = np.concatenate([ids, [new_id]])
+        IdPositionIndex(metadata_df['id'].values)
+    elapsed = time.time() - start
+    return adds / elapsed
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10000, 100000, 1000000]
+    print("🚀 BENCHMARK THÊM SẢN PHẨM")
+    print("=" * 60)
+    print(f"   • Dimension: {DIMENSION}, {ADDS} lần thêm mỗi cỡ catalog")
+    for size in sizes:
+        buffered = benchmark_store(size, ADDS)
+        naive = benchmark_naive(size, ADDS)
+        print(f"📊 {size:>9,} sản phẩm: buffer {buffered:>9,.0f} adds/s | "
+              f"concat/vstack {naive:>9,.0f} adds/s | x{buffered / naive:.1f}")
+        with_delta = benchmark_update(size, ADDS, use_delta=True)
+        in_place = benchmark_update(size, ADDS, use_delta=False)
+        print(f"   {'':>9} update: delta {with_delta:>9,.0f} updates/s | "
+              f"tại chỗ {in_place:>9,.0f} updates/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Benchmark build embeddings: đường cũ (từng text một) so với đường batch theo bucket độ dài token
+Cả hai đường chạy trên cùng corpus và cùng model:
+- Cũ: tokenizer.tokenize từng text (hai lượt để lấy độ dài như trước), model.encode từng text ngắn,
+  text dài chia chunk bằng detokenize (overlap CHUNK_OVERLAP) rồi encode từng chunk, pool bằng head đã lưu
+- Mới: _encode_texts của embedding.py (đếm token theo batch một lượt, encode theo bucket độ dài,
+  chunk của mọi text dài encode chung theo batch), không qua embedding cache
+In throughput (texts/s) của từng đường (đường mới với batch build của device và batch GPU), tỉ lệ tăng tốc
+và sai khác lớn nhất trên text ngắn.
+
+Chạy: python src/benchmark_embedding.py [số text] [--synthetic]   (mặc định 2000)
+(--synthetic: corpus giả 95% text ngắn / 5% text dài hơn MAX_LENGTH thay vì text_corpus của data/product_metadata.csv)
+"""
+
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+import torch
+
+# Add config path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'config'))
+from simple_config import DATA_PATHS, MAX_LENGTH, EMBEDDING_BUILD, get_device, get_global_embedding_model
+from embedding import CHUNK_OVERLAP, _encode_texts, build_batch_size
+from attention_pooling import load_attention_pooling, pool_chunks
+
+TEXTS = 2000
+
+
+def load_benchmark_corpus(size: int, tokenizer, max_length: int, synthetic: bool = False):
+    """
+    size text từ text_corpus của metadata đã tiền xử lý, hoặc corpus giả nếu chưa có file / synthetic
+    Corpus giả ghép các từ một token của vocab: 95% text 16..max_length/2 token, 5% text 1-4 lần max_length
+    """
+    if not synthetic and os.path.exists(DATA_PATHS['metadata']):
+        texts = pd.read_csv(DATA_PATHS['metadata'], usecols=['text_corpus'], keep_default_na=False)['text_corpus']
+        texts = texts.astype(str).tolist()[:size]
+        if texts:
+            return texts
+    rng = np.random.default_rng(0)
+    words = sorted(word for word in tokenizer.get_vocab() if word.isalpha() and word.islower() and len(word) > 2)
+    counts = np.where(rng.random(size) < 0.05,
+                      rng.integers(max_length + 1, 4 * max_length, size),
+                      rng.integers(16, max_length // 2, size))
+    return [' '.join(rng.choice(words, int(count))) for count in counts]
+
+
+def naive_embeddings(texts, model, tokenizer, max_length, device, batch_size) -> np.ndarray:
+    """Đường cũ: tokenize từng text hai lượt, encode từng text / từng chunk một"""
+    lengths = [len(tokenizer.tokenize(text)) for text in texts]
+    lengths = [len(tokenizer.tokenize(text)) for text in texts]
+    pooling = None
+    embeddings = []
+    for text, length in zip(texts, lengths):
+        if length <= max_length:
+            embedding = model.encode(text, batch_size=batch_size, show_progress_bar=False,
+                                     normalize_embeddings=True, device=device, convert_to_tensor=True)
+        else:
+            tokens = tokenizer.tokenize(text)
+            chunks = [tokenizer.convert_tokens_to_string(tokens[i:i + max_length])
+                      for i in range(0, len(tokens), max_length - CHUNK_OVERLAP)]
+            chunk_embeddings = torch.stack([
+                model.encode(chunk, batch_size=batch_size, show_progress_bar=False,
+                             normalize_embeddings=True, device=device, convert_to_tensor=True)
+                for chunk in chunks
+            ])
+            if pooling is None:
+                pooling = load_attention_pooling(chunk_embeddings.shape[-1], chunk_embeddings.device)
+            embedding = pool_chunks(chunk_embeddings, [(0, len(chunks))], pooling)[0]
+        embeddings.append(embedding.detach().cpu().numpy())
+    return np.array(embeddings, dtype=np.float32)
+
+
+def benchmark(texts, model, tokenizer, max_length, device, batch_sizes):
+    """(texts/s đường cũ, {batch size: texts/s đường mới}, sai khác lớn nhất trên text ngắn)"""
+    start = time.time()
+    old = naive_embeddings(texts, model, tokenizer, max_length, device, batch_sizes[0])
+    old_rate = len(texts) / (time.time() - start)
+
+    new_rates = {}
+    for batch_size in batch_sizes:
+        start = time.time()
+        new = _encode_texts(texts, model, tokenizer, max_length, device, batch_size)
+        new_rates[batch_size] = len(texts) / (time.time() - start)
+
+    short = np.array([len(tokenizer.tokenize(text)) <= max_length for text in texts])
+    max_diff = float(np.abs(old[short] - new[short]).max()) if short.any() else 0.0
+    return old_rate, new_rates, max_diff
+
+
+def main():
+    args = sys.argv[1:]
+    synthetic = '--synthetic' in args
+    sizes = [int(arg) for arg in args if arg.isdigit()]
+    size = sizes[0] if sizes else TEXTS
+
+    model, tokenizer = get_global_embedding_model()
+    device = get_device()
+    batch_sizes = sorted({build_batch_size(device), EMBEDDING_BUILD['batch_size']})
+    texts = load_benchmark_corpus(size, tokenizer, MAX_LENGTH, synthetic)
+    long_texts = sum(len(tokenizer.tokenize(text)) > MAX_LENGTH for text in texts)
+
+    print(f"📊 {len(texts)} texts ({long_texts} dài hơn {MAX_LENGTH} token), device {device}, "
+          f"batch build {build_batch_size(device)}, torch threads {torch.get_num_threads()}")
+    old_rate, new_rates, max_diff = benchmark(texts, model, tokenizer, MAX_LENGTH, device, batch_sizes)
+    print(f"   • Từng text một:            {old_rate:8.1f} texts/s")
+    for batch_size, new_rate in new_rates.items():
+        print(f"   • Batch theo bucket ({batch_size:>3}): {new_rate:8.1f} texts/s  (x{new_rate / old_rate:.1f})")
+    print(f"   • Sai khác lớn nhất trên text ngắn: {max_diff:.2e}")
+
+
+if __name__ == "__main__":
+    main()
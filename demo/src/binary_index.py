@@ -0,0 +1,113 @@
+"""
+Binary-quantized first-stage search
+- Embedding được binarize theo dấu (1 bit/dim, nhỏ hơn float32 32 lần) vào FAISS IndexBinaryIDMap
+- Phase 1: quét Hamming distance lấy tập candidate rộng
+- Phase 2: rescore exact candidate bằng vector float (embeddings_attention.npy, memory-mapped)
+"""
+
+import os
+import sys
+import numpy as np
+import faiss
+from typing import Optional, Tuple
+
+# Add config path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'config'))
+from simple_config import DATA_PATHS, BINARY_SEARCH
+from index_factory import normalize_vectors, rescore_candidates
+
+
+def binarize(vectors) -> np.ndarray:
+    """Sign-binarize vectors [n, d] → packed codes uint8 [n, d/8]"""
+    vectors = np.asarray(vectors)
+    return np.packbits(vectors.reshape(len(vectors), -1) > 0, axis=1)
+
+
+class BinaryIndex:
+    """Hamming index trên sign bits + rescoring bằng vector float"""
+
+    def __init__(self, index: Optional[faiss.IndexBinary] = None):
+        """Khởi tạo từ IndexBinaryIDMap có sẵn (hoặc rỗng, gọi build() sau)"""
+        self.index = index
+
+    @property
+    def ntotal(self) -> int:
+        return self.index.ntotal if self.index is not None else 0
+
+    def build(self, embeddings, ids, block_size: int = 100000):
+        """Build lại toàn bộ từ embeddings (theo block, hỗ trợ memmap)"""
+        num_vectors, dimension = embeddings.shape
+        if dimension % 8 != 0:
+            raise ValueError(f"Dimension {dimension} phải chia hết cho 8 để binarize")
+        self.index = faiss.IndexBinaryIDMap(faiss.IndexBinaryFlat(dimension))
+        ids = np.asarray(ids, dtype=np.int64)
+        for start in range(0, num_vectors, block_size):
+            end = min(start + block_size, num_vectors)
+            self.index.add_with_ids(binarize(embeddings[start:end]), ids[start:end])
+        return self
+
+    def add(self, vectors, ids):
+        """Thêm code của các vector mới"""
+        self.index.add_with_ids(binarize(vectors), np.asarray(ids, dtype=np.int64))
+
+    def remove(self, ids):
+        """Xóa code theo product id"""
+        self.index.remove_ids(np.asarray(ids, dtype=np.int64))
+
+    def update(self, vectors, ids):
+        """Ghi đè code của các product id đã có"""
+        self.remove(ids)
+        self.add(vectors, ids)
+
+    def copy(self) -> 'BinaryIndex':
+        """Bản copy độc lập (faiss.clone_binary_index không hỗ trợ IndexBinaryIDMap)"""
+        if self.index is None:
+            return BinaryIndex()
+        return BinaryIndex(faiss.deserialize_index_binary(faiss.serialize_index_binary(self.index)))
+
+    def save(self, path: Optional[str] = None):
+        """Lưu index ra file (ghi file tạm rồi os.replace)"""
+        path = path or DATA_PATHS['binary_index']
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        faiss.write_index_binary(self.index, tmp_path)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: Optional[str] = None) -> 'BinaryIndex':
+        """Load index từ file"""
+        return cls(faiss.read_index_binary(path or DATA_PATHS['binary_index']))
+
+    def candidate_count(self, k: int) -> int:
+        """Số candidate lấy ở phase 1 cho top-k cuối cùng"""
+        return min(self.ntotal, max(k * BINARY_SEARCH['candidate_multiplier'], BINARY_SEARCH['min_candidates']))
+
+    def search(self, query_embeddings: np.ndarray, k: int, embeddings, positions_of) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Two-phase search, trả về (scores, ids) [nq, k] giống faiss Index.search (thiếu thì id = -1)
+        - embeddings: vector float theo vị trí dòng (memmap được, chỉ đọc các dòng candidate)
+        - positions_of: hàm ánh xạ mảng product id → vị trí dòng (-1 nếu không tồn tại)
+        """
+        query_embeddings = normalize_vectors(query_embeddings)
+        if self.ntotal == 0:
+            empty_ids = np.full((len(query_embeddings), 0), -1, dtype=np.int64)
+            return rescore_candidates(query_embeddings, empty_ids, k, embeddings, positions_of)
+
+        # Phase 1: Hamming scan
+        _, candidate_ids = self.index.search(binarize(query_embeddings), self.candidate_count(k))
+
+        # Phase 2: exact rescoring trên các dòng candidate
+        return rescore_candidates(query_embeddings, candidate_ids, k, embeddings, positions_of)
+
+
+def load_or_build_binary_index(embeddings, ids, path: Optional[str] = None) -> BinaryIndex:
+    """Load binary index từ file; nếu chưa có hoặc lệch số lượng với embeddings thì build lại và lưu"""
+    path = path or DATA_PATHS['binary_index']
+    if os.path.exists(path):
+        binary_index = BinaryIndex.load(path)
+        if binary_index.ntotal == len(ids):
+            return binary_index
+        print(f"⚠️ Binary index có {binary_index.ntotal} codes, metadata có {len(ids)} sản phẩm - build lại")
+    binary_index = BinaryIndex().build(embeddings, ids)
+    binary_index.save(path)
+    print(f"✅ Binary index built: {binary_index.ntotal} codes")
+    return binary_index
@@ -0,0 +1,159 @@
+"""
+Thêm / sửa / xóa nhiều sản phẩm trong một transaction (đồng bộ catalog từ PIM, /api/products/bulk)
+- Kiểm tra toàn bộ thao tác trước: một thao tác lỗi → không áp dụng thao tác nào
+- Text của mọi sản phẩm thêm/sửa được embed trong một lượt (embed_texts)
+- Toàn bộ batch là một CatalogChange: một record catalog log, một snapshot mới được publish
+"""
+
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+from typing import Any, Dict, List, Optional
+
+# Add config path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'config'))
+from simple_config import MAX_LENGTH, BATCH_SIZE, BULK, get_device, get_global_embedding_model
+from preprocess import create_text_corpus_for_product
+from embedding import embed_texts
+from product_store import ProductStore, CatalogView, CatalogChange
+
+PRODUCT_FIELDS = ['name', 'brand', 'ingredients', 'categories', 'manufacturer', 'manufacturerNumber']
+REQUIRED_FIELDS = ['name', 'brand']
+
+
+class ProductBulkWriter(CatalogView):
+    """
+    Áp dụng một batch thao tác add / update / delete lên catalog
+    Mỗi thao tác: {"op": "add", "product": {...}} | {"op": "update", "id": 5, "product": {...}} | {"op": "delete", "id": 7}
+    """
+
+    def __init__(self, score_cache=None, store: Optional[ProductStore] = None):
+        """
+        Khởi tạo ProductBulkWriter
+        - score_cache: CrossEncoderScoreCache cần invalidate khi sản phẩm đổi / bị xóa
+        - store: ProductStore dùng chung (tạo mới nếu không truyền)
+        """
+        self.device = get_device()
+        self.score_cache = score_cache
+        self.store = store if store is not None else ProductStore()
+        self.model, self.tokenizer = get_global_embedding_model()
+
+    def operation_error(self, operation: Dict[str, Any], snapshot, touched: set) -> Optional[str]:
+        """
+        Lỗi của một thao tác với snapshot hiện tại (None nếu hợp lệ)
+        touched: product id đã có thao tác trước đó trong batch (được thêm ID của thao tác này)
+        """
+        if not isinstance(operation, dict):
+            return "thao tác phải là object"
+        op = operation.get('op')
+        product = operation.get('product') or {}
+        if op not in ('add', 'update', 'delete'):
+            return f"op không hợp lệ: {op!r} (add / update / delete)"
+        if op in ('add', 'update') and not isinstance(product, dict):
+            return "product phải là object"
+        if op == 'add':
+            missing = [field for field in REQUIRED_FIELDS if not str(product.get(field) or '').strip()]
+            return f"thiếu trường bắt buộc {', '.join(missing)}" if missing else None
+
+        product_id = operation.get('id')
+        if isinstance(product_id, bool) or not isinstance(product_id, int):
+            return "id phải là số nguyên"
+        if product_id not in snapshot.id_index:
+            return f"product ID {product_id} không tồn tại"
+        if product_id in touched:
+            return f"product ID {product_id} xuất hiện nhiều lần trong batch"
+        touched.add(product_id)
+        if op == 'update' and not any(field in product for field in PRODUCT_FIELDS):
+            return f"không có trường nào để cập nhật ({', '.join(PRODUCT_FIELDS)})"
+        return None
+
+    def validate(self, operations: List[Dict[str, Any]], snapshot) -> List[str]:
+        """Lỗi của từng thao tác (rỗng nếu cả batch hợp lệ với snapshot hiện tại)"""
+        if not isinstance(operations, list) or not operations:
+            return ['operations phải là danh sách không rỗng']
+        if len(operations) > BULK['max_operations']:
+            return [f"Tối đa {BULK['max_operations']} thao tác mỗi request (nhận {len(operations)})"]
+
+        touched = set()
+        errors = [(i, self.operation_error(operation, snapshot, touched)) for i, operation in enumerate(operations)]
+        return [f"#{i}: {error}" for i, error in errors if error is not None]
+
+    def apply(self, operations: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Kiểm tra, embed và commit cả batch (gọi khi giữ lock ghi)
+        Trả về {'success': False, 'errors': [...]} nếu batch không hợp lệ (không có gì bị đổi),
+        hoặc {'success': True, 'results': [...]} với ID của từng thao tác theo thứ tự request.
+        """
+        snapshot = self.store.snapshot()
+        if snapshot is None or self.model is None:
+            return {'success': False, 'errors': ['Models hoặc data chưa được load']}
+
+        errors = self.validate(operations, snapshot)
+        if errors:
+            print(f"❌ Bulk: {len(errors)} thao tác không hợp lệ - không áp dụng thao tác nào")
+            return {'success': False, 'errors': errors}
+
+        start_time = time.time()
+        print(f"\n🔄 Bulk: {len(operations)} thao tác...")
+
+        # 1. Dòng metadata mới / đã sửa (ID mới cấp liên tiếp từ next_id)
+        rows, results, deleted_ids = [], [], []
+        kept_rows = {}          # vị trí trong rows → dòng embeddings hiện có (update không đổi text_corpus)
+        next_id = snapshot.next_id
+        for operation in operations:
+            op = operation['op']
+            if op == 'delete':
+                deleted_ids.append(operation['id'])
+                results.append({'op': op, 'id': operation['id']})
+                continue
+
+            product = {field: str(value) for field, value in (operation.get('product') or {}).items()
+                       if field in PRODUCT_FIELDS}
+            if op == 'add':
+                row = {field: product.get(field, '') for field in PRODUCT_FIELDS}
+                row['id'] = next_id
+                next_id += 1
+            else:
+                row = snapshot.get_product(operation['id']).to_dict()
+                current_text = row.get('text_corpus')
+                row.update(product)
+            row['text_corpus'] = create_text_corpus_for_product(
+                **{field: row.get(field, '') if pd.notna(row.get(field, '')) else '' for field in PRODUCT_FIELDS}
+            )
+            if op == 'update' and row['text_corpus'] == current_text:
+                embedding_row = snapshot.embedding_rows.get(operation['id'])
+                if embedding_row is not None:
+                    kept_rows[len(rows)] = embedding_row
+            rows.append(row)
+            results.append({'op': op, 'id': int(row['id'])})
+
+        # 2. Embed mọi text thêm/sửa trong một lượt (qua embedding cache);
+        #    update không đổi text_corpus giữ vector hiện có, không encode
+        vectors = None
+        embed = [i for i in range(len(rows)) if i not in kept_rows]
+        if embed:
+            embed_start = time.time()
+            encoded = embed_texts([rows[i]['text_corpus'] for i in embed], self.model, self.tokenizer,
+                                  MAX_LENGTH, self.device, BATCH_SIZE)
+            vectors = np.empty((len(rows), encoded.shape[1]), dtype=np.float32)
+            vectors[embed] = encoded
+            print(f"🔗 Created {len(embed)} embeddings in {(time.time() - embed_start) * 1000:.1f}ms")
+        if kept_rows and vectors is not None:
+            positions = list(kept_rows)
+            vectors[positions] = np.asarray(snapshot.embeddings[list(kept_rows.values())], dtype=np.float32)
+
+        # 3. Một CatalogChange cho cả batch: một record log, một snapshot mới
+        change = CatalogChange(rows=pd.DataFrame(rows) if rows else None, vectors=vectors, deleted_ids=deleted_ids)
+        snapshot = self.store.commit(change)
+
+        # 4. Invalidate score cross-encoder của sản phẩm đã sửa / xóa
+        changed_ids = [result['id'] for result in results if result['op'] != 'add']
+        if self.score_cache is not None and changed_ids:
+            self.score_cache.invalidate_products(changed_ids)
+
+        counts = {op: sum(result['op'] == op for result in results) for op in ('add', 'update', 'delete')}
+        print(f"✅ Bulk: thêm {counts['add']}, sửa {counts['update']}, xóa {counts['delete']} "
+              f"trong {(time.time() - start_time) * 1000:.1f}ms (store v{snapshot.version})")
+        return {'success': True, 'results': results, 'counts': counts, 'version': snapshot.version}
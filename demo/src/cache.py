@@ -0,0 +1,331 @@
+"""
+Các lớp cache cho search
+- LRUCache: cache trong process với giới hạn kích thước và TTL
+- QueryEmbeddingCache: cache embedding của query (LRU + tier trên đĩa dùng chung giữa các worker)
+- CrossEncoderScoreCache: cache score re-rank theo (query, product id, hash text_corpus)
+- SearchResultCache: cache response của /api/search theo generation của index
+"""
+
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+def normalize_query(query: str) -> str:
+    """Chuẩn hóa query làm cache key: gộp khoảng trắng và chuyển về chữ thường"""
+    return ' '.join(str(query).split()).lower()
+
+
+class LRUCache:
+    """LRU cache thread-safe với giới hạn số entry và TTL"""
+
+    def __init__(self, max_size: int = 1000, ttl_seconds: Optional[float] = 3600):
+        """Khởi tạo cache (ttl_seconds=None để không hết hạn)"""
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._data = OrderedDict()  # key → (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        """Lấy giá trị theo key, đưa entry lên đầu LRU"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            expires_at, value = entry
+            if expires_at is not None and expires_at < time.time():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """Thêm/ghi đè entry, loại entry cũ nhất khi vượt max_size"""
+        expires_at = time.time() + self.ttl_seconds if self.ttl_seconds else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        """Xóa một entry"""
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def clear(self):
+        """Xóa toàn bộ entry (giữ nguyên counters)"""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        """Thống kê hit/miss/eviction"""
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'max_size': self.max_size,
+            'ttl_seconds': self.ttl_seconds,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'hit_rate': self.hits / lookups if lookups else 0.0
+        }
+
+
+class QueryEmbeddingCache:
+    """
+    Cache embedding của query đặt trước model.encode
+    - Tier 1: LRUCache trong process
+    - Tier 2 (tùy chọn): file .npy trên đĩa, nhiều worker process dùng chung
+    Key là hash của (tên model, query đã chuẩn hóa) nên đổi EMBEDDING_MODEL_NAME sẽ tự invalidate;
+    tier trên đĩa còn được tách thư mục riêng theo model.
+    """
+
+    def __init__(self, model_name: str, max_size: int = 1000, ttl_seconds: Optional[float] = 3600,
+                 disk_dir: Optional[str] = None):
+        """Khởi tạo cache cho một embedding model"""
+        self.model_name = model_name
+        self.ttl_seconds = ttl_seconds
+        self.memory = LRUCache(max_size, ttl_seconds)
+        self.disk_dir = None
+        self.disk_hits = 0
+        self.disk_misses = 0
+        self.disk_errors = 0
+
+        if disk_dir:
+            model_hash = hashlib.sha1(model_name.encode('utf-8')).hexdigest()[:12]
+            self.disk_dir = os.path.join(disk_dir, model_hash)
+            os.makedirs(self.disk_dir, exist_ok=True)
+            # Ghi tên model để dễ kiểm tra thư mục cache
+            model_file = os.path.join(self.disk_dir, 'model.txt')
+            if not os.path.exists(model_file):
+                with open(model_file, 'w') as f:
+                    f.write(model_name)
+
+    def _key(self, normalized_query: str) -> str:
+        """Cache key của một query đã chuẩn hóa"""
+        return hashlib.sha1(f"{self.model_name}\n{normalized_query}".encode('utf-8')).hexdigest()
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f"{key}.npy")
+
+    def _disk_get(self, key: str) -> Optional[np.ndarray]:
+        """Đọc embedding từ tier trên đĩa (None nếu không có hoặc đã hết TTL)"""
+        path = self._disk_path(key)
+        try:
+            if self.ttl_seconds and time.time() - os.path.getmtime(path) > self.ttl_seconds:
+                self.disk_misses += 1
+                return None
+            embedding = np.load(path)
+            self.disk_hits += 1
+            return embedding
+        except FileNotFoundError:
+            self.disk_misses += 1
+        except Exception:
+            self.disk_errors += 1
+        return None
+
+    def _disk_put(self, key: str, embedding: np.ndarray):
+        """Ghi embedding ra đĩa (ghi file tạm rồi os.replace để các worker không đọc file dở)"""
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                np.save(f, embedding)
+            os.replace(tmp_path, path)
+        except Exception:
+            self.disk_errors += 1
+
+    def encode(self, queries: List[str], encode_fn: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """
+        Trả về embedding [len(queries), dim] cho danh sách query
+        Chỉ các query chưa có trong cache mới được đưa vào encode_fn (một lần gọi cho cả batch).
+        Query được encode ở dạng đã chuẩn hóa (model bge-*-en là uncased) để mọi biến thể dùng chung một vector.
+        """
+        normalized = [normalize_query(query) for query in queries]
+        keys = [self._key(text) for text in normalized]
+        found = {}
+        missing = {}
+
+        for key, text in zip(keys, normalized):
+            if key in found or key in missing:
+                continue
+            embedding = self.memory.get(key)
+            if embedding is None and self.disk_dir:
+                embedding = self._disk_get(key)
+                if embedding is not None:
+                    self.memory.put(key, embedding)
+            if embedding is None:
+                missing[key] = text
+            else:
+                found[key] = embedding
+
+        if missing:
+            missing_keys = list(missing.keys())
+            new_embeddings = np.asarray(encode_fn([missing[key] for key in missing_keys]), dtype=np.float32)
+            for key, embedding in zip(missing_keys, new_embeddings):
+                embedding = embedding.copy()
+                self.memory.put(key, embedding)
+                if self.disk_dir:
+                    self._disk_put(key, embedding)
+                found[key] = embedding
+
+        return np.stack([found[key] for key in keys]).astype(np.float32, copy=False)
+
+    def clear(self):
+        """Xóa tier trong process (tier trên đĩa hết hạn theo TTL)"""
+        self.memory.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Thống kê cho /api/stats"""
+        stats = self.memory.stats()
+        stats['model_name'] = self.model_name
+        stats['disk'] = {
+            'enabled': self.disk_dir is not None,
+            'path': self.disk_dir,
+            'hits': self.disk_hits,
+            'misses': self.disk_misses,
+            'errors': self.disk_errors
+        }
+        return stats
+
+
+class CrossEncoderScoreCache:
+    """
+    Cache score cross-encoder cho cặp (query, sản phẩm)
+    Key gồm query đã chuẩn hóa, product id, hash của text_corpus và version của product id.
+    invalidate_products() chỉ tăng version (O(1)); entry cũ không còn truy cập được và bị LRU đẩy ra dần.
+    Bảng version giới hạn max_size id: vượt ngưỡng thì xóa cả score lẫn version (không để version về 0
+    khi score cũ của id đó còn trong LRU).
+    """
+
+    def __init__(self, max_size: int = 50000, ttl_seconds: Optional[float] = None):
+        """Khởi tạo cache với giới hạn số cặp"""
+        self.cache = LRUCache(max_size, ttl_seconds)
+        self._product_versions = {}  # product id → version, tăng khi sản phẩm đổi/xóa
+        self._lock = threading.Lock()
+        self.invalidations = 0
+        self.version_resets = 0
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        """Hash ngắn của text_corpus"""
+        return hashlib.sha1(str(text).encode('utf-8')).hexdigest()[:16]
+
+    def _key(self, query: str, product_id: int, text: str) -> Tuple:
+        product_id = int(product_id)
+        return (
+            normalize_query(query), product_id, self.text_hash(text),
+            self._product_versions.get(product_id, 0)
+        )
+
+    def score_pairs(self, items: List[Tuple[str, int, str]],
+                    predict_fn: Callable[[List[Tuple[str, str]]], Iterable[float]]) -> np.ndarray:
+        """
+        Trả về score cho danh sách (query, product id, text_corpus)
+        Chỉ các cặp chưa có trong cache mới được đưa vào predict_fn (một lần gọi).
+        """
+        keys = [self._key(query, product_id, text) for query, product_id, text in items]
+        scores = np.zeros(len(items), dtype=np.float32)
+        missing_positions = []
+        pending = {}
+
+        for i, key in enumerate(keys):
+            if key in pending:
+                pending[key].append(i)
+                continue
+            score = self.cache.get(key)
+            if score is None:
+                pending[key] = [i]
+                missing_positions.append(i)
+            else:
+                scores[i] = score
+
+        if missing_positions:
+            pairs = [(items[i][0], items[i][2]) for i in missing_positions]
+            new_scores = np.asarray(predict_fn(pairs), dtype=np.float32).reshape(-1)
+            for i, score in zip(missing_positions, new_scores):
+                self.cache.put(keys[i], float(score))
+                for position in pending[keys[i]]:
+                    scores[position] = score
+
+        return scores
+
+    def invalidate_products(self, product_ids: Iterable[int]):
+        """Invalidate mọi score của các sản phẩm (gọi khi text_corpus đổi hoặc sản phẩm bị xóa)"""
+        with self._lock:
+            for product_id in product_ids:
+                product_id = int(product_id)
+                self._product_versions[product_id] = self._product_versions.get(product_id, 0) + 1
+                self.invalidations += 1
+            if len(self._product_versions) > self.cache.max_size:
+                self.cache.clear()
+                self._product_versions = {}
+                self.version_resets += 1
+
+    def clear(self):
+        """Xóa toàn bộ score (version cũng không còn cần)"""
+        with self._lock:
+            self.cache.clear()
+            self._product_versions = {}
+
+    def stats(self) -> Dict[str, Any]:
+        """Thống kê cho /api/stats"""
+        stats = self.cache.stats()
+        stats['invalidations'] = self.invalidations
+        stats['tracked_products'] = len(self._product_versions)
+        stats['version_resets'] = self.version_resets
+        return stats
+
+
+class SearchResultCache:
+    """
+    Cache kết quả search đã format (response-level)
+    Key gồm generation của index: mỗi lần add/update/delete thành công generation tăng,
+    nên entry của generation cũ không bao giờ được trả về sau khi ghi.
+    """
+
+    def __init__(self, max_size: int = 2000, ttl_seconds: Optional[float] = 600):
+        """Khởi tạo cache với giới hạn số response"""
+        self.cache = LRUCache(max_size, ttl_seconds)
+
+    @staticmethod
+    def make_key(query: str, method: str, top_k: int, retrieval_k: int, generation: int) -> Tuple:
+        """Tạo cache key cho một request search"""
+        return (normalize_query(query), method, int(top_k), int(retrieval_k), int(generation))
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def put(self, key, results):
+        self.cache.put(key, results)
+
+    def clear(self):
+        """Xóa toàn bộ response (gọi khi generation tăng để giải phóng bộ nhớ)"""
+        self.cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Thống kê cho /api/stats"""
+        return self.cache.stats()
@@ -0,0 +1,153 @@
+"""
+Export toàn bộ catalog (hoặc phần thay đổi từ một generation) dạng NDJSON / CSV cho hệ thống downstream
+- Đọc từ một CatalogSnapshot cố định: export nhất quán dù có ghi đồng thời
+- Sinh output theo chunk EXPORT['chunk_rows'] dòng, lấy theo cột (không iterrows, không build cả response)
+- Tùy chọn kèm embedding: base64 của vector little-endian float16 / float32
+- since_generation: chỉ các sản phẩm thêm/sửa bởi change có seq > since_generation, kèm ID bị xóa sau đó
+  (generation = seq của change catalog, xem ProductStore.commit; header X-Catalog-Generation của lần export trước)
+"""
+
+import io
+import os
+import sys
+import csv
+import json
+import base64
+import numpy as np
+import pandas as pd
+from typing import Dict, Iterator, List, Optional
+
+# Add config path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'config'))
+from simple_config import EXPORT
+
+PRODUCT_FIELDS = ['id', 'name', 'brand', 'ingredients', 'categories', 'manufacturer', 'manufacturerNumber']
+FORMATS = ('ndjson', 'csv')
+VECTOR_DTYPES = {'float16': '<f2', 'float32': '<f4'}
+
+
+def product_records(frame: pd.DataFrame, fields: List[str] = PRODUCT_FIELDS) -> List[Dict]:
+    """Các dòng metadata → list dict (giá trị thiếu / NaN → '', id → int), build theo cột"""
+    columns = {}
+    for field in fields:
+        if field == 'id':
+            columns[field] = frame['id'].to_numpy(dtype=np.int64).tolist()
+        elif field in frame.columns:
+            values = frame[field]
+            columns[field] = values.astype(object).where(values.notna(), '').astype(str).tolist()
+        else:
+            columns[field] = [''] * len(frame)
+    return [dict(zip(fields, row)) for row in zip(*(columns[field] for field in fields))]
+
+
+class CatalogExport:
+    """Một lần export: thông tin cho header HTTP + generator các chunk output"""
+
+    def __init__(self, snapshot, file_format: str = 'ndjson', since_generation: Optional[int] = None,
+                 include_vectors: bool = False, vector_dtype: str = 'float16'):
+        if file_format not in FORMATS:
+            raise ValueError(f"format phải là một trong {list(FORMATS)}")
+        if vector_dtype not in VECTOR_DTYPES:
+            raise ValueError(f"vector_dtype phải là một trong {list(VECTOR_DTYPES)}")
+        self.snapshot = snapshot
+        self.format = file_format
+        self.since_generation = since_generation
+        self.include_vectors = include_vectors
+        self.vector_dtype = vector_dtype
+
+        if since_generation is None:
+            self.positions = None
+            self.deleted_ids = np.zeros(0, dtype=np.int64)
+        else:
+            self.positions = snapshot.updated_since(since_generation)
+            self.deleted_ids = snapshot.deleted_since(since_generation)
+
+    @property
+    def total(self) -> int:
+        """Số sản phẩm (thêm/sửa) trong export"""
+        return self.snapshot.num_products if self.positions is None else len(self.positions)
+
+    def headers(self) -> Dict[str, str]:
+        """Header HTTP mô tả export (generation dùng cho lần pull tăng dần sau)"""
+        headers = {
+            'X-Catalog-Generation': str(self.snapshot.log_seq),
+            'X-Total-Count': str(self.total),
+        }
+        if self.since_generation is not None:
+            # Xóa trước lần load catalog gần nhất không còn được ghi nhận → client cần pull toàn bộ
+            complete = self.since_generation >= self.snapshot.deletions_since
+            headers['X-Deleted-Count'] = str(len(self.deleted_ids))
+            headers['X-Deletions-Complete'] = 'true' if complete else 'false'
+        if self.include_vectors:
+            headers['X-Vector-Encoding'] = f"base64-{self.vector_dtype}-le"
+            headers['X-Vector-Dimension'] = str(self.snapshot.embeddings.shape[1])
+        return headers
+
+    def fields(self) -> List[str]:
+        """Cột / key của mỗi sản phẩm trong output"""
+        fields = PRODUCT_FIELDS + ['generation']
+        if self.include_vectors:
+            fields.append('embedding')
+        if self.since_generation is not None:
+            fields.append('deleted')
+        return fields
+
+    def _chunk_records(self, start: int, end: int) -> List[Dict]:
+        """Sản phẩm thứ start..end của export"""
+        snapshot = self.snapshot
+        if self.positions is None:
+            frame = snapshot.metadata_df.iloc[start:end]
+        else:
+            frame = snapshot.frame.iloc[self.positions[start:end]]
+        records = product_records(frame)
+
+        if 'updated_seq' in frame.columns:
+            generations = pd.to_numeric(frame['updated_seq'], errors='coerce').fillna(0).astype(np.int64).tolist()
+        else:
+            generations = [0] * len(frame)
+        for record, generation in zip(records, generations):
+            record['generation'] = generation
+
+        if self.include_vectors:
+            rows = snapshot.embedding_rows.lookup(frame['id'].to_numpy(dtype=np.int64))
+            dtype = VECTOR_DTYPES[self.vector_dtype]
+            vectors = np.asarray(snapshot.embeddings[rows.clip(min=0)]).astype(dtype)
+            for record, row, vector in zip(records, rows, vectors):
+                record['embedding'] = base64.b64encode(vector.tobytes()).decode('ascii') if row >= 0 else None
+        return records
+
+    def _deleted_records(self) -> Iterator[List[Dict]]:
+        """Record {'id', 'deleted': True} cho các ID bị xóa sau since_generation"""
+        deletions = dict(zip(*self.snapshot.deletions)) if len(self.deleted_ids) > 0 else {}
+        for start in range(0, len(self.deleted_ids), EXPORT['chunk_rows']):
+            yield [{'id': int(product_id), 'generation': int(deletions[product_id]), 'deleted': True}
+                   for product_id in self.deleted_ids[start:start + EXPORT['chunk_rows']]]
+
+    def chunks(self) -> Iterator[List[Dict]]:
+        """Các chunk record: sản phẩm thêm/sửa rồi tới ID đã xóa"""
+        for start in range(0, self.total, EXPORT['chunk_rows']):
+            records = self._chunk_records(start, start + EXPORT['chunk_rows'])
+            if self.since_generation is not None:
+                for record in records:
+                    record['deleted'] = False
+            yield records
+        yield from self._deleted_records()
+
+    def stream(self) -> Iterator[str]:
+        """Output theo từng chunk (NDJSON: một object mỗi dòng; CSV: header + các dòng)"""
+        if self.format == 'ndjson':
+            for records in self.chunks():
+                yield ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records)
+            return
+
+        fields = self.fields()
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=fields, restval='', lineterminator='\n')
+        writer.writeheader()
+        for records in self.chunks():
+            writer.writerows(records)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.getvalue():
+            yield buffer.getvalue()
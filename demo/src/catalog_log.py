@@ -0,0 +1,221 @@
+"""
+Write-ahead log cho các thay đổi catalog (add/update/delete)
+- Mỗi thay đổi được append vào data/catalog.wal (dòng metadata + vector + ID xóa) thay vì ghi lại
+  toàn bộ metadata CSV / embeddings / FAISS index → I/O mỗi thao tác tỉ lệ với kích thước thay đổi
+- Checkpoint: định kỳ (hoặc khi log vượt ngưỡng) ghi snapshot đầy đủ (snapshot_dir.py), manifest lưu seq
+  đã bao gồm, rồi cắt phần log đã checkpoint
+- Khởi động: load snapshot hiện tại rồi replay các record có seq > seq trong manifest
+- Group commit: các write đồng thời chờ chung một lần fsync
+
+Format mỗi record: header <payload_len u32, crc32 u32, seq u64> + payload (.npz: rows JSON, vectors, deleted_ids)
+Record cuối bị ghi dở (crash giữa chừng) bị phát hiện bằng độ dài/CRC và cắt bỏ khi replay.
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import zlib
+import struct
+import threading
+import numpy as np
+import pandas as pd
+from typing import Dict, Iterator, Optional, Tuple
+
+# Add config path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'config'))
+from simple_config import DATA_PATHS, WAL
+
+RECORD_HEADER = struct.Struct('<IIQ')
+
+
+def _encode_change(change) -> bytes:
+    """CatalogChange → payload .npz (không dùng pickle)"""
+    records = change.rows.to_dict(orient='records')
+    buffer = io.BytesIO()
+    np.savez(
+        buffer,
+        rows=np.frombuffer(json.dumps(records, default=lambda value: value.item()).encode('utf-8'), dtype=np.uint8),
+        columns=np.frombuffer(json.dumps(list(change.rows.columns)).encode('utf-8'), dtype=np.uint8),
+        vectors=change.vectors if change.vectors is not None else np.zeros((0, 0), dtype=np.float32),
+        has_vectors=np.bool_(change.vectors is not None),
+        deleted_ids=change.deleted_ids
+    )
+    return buffer.getvalue()
+
+
+def _decode_change(payload: bytes) -> Tuple[pd.DataFrame, Optional[np.ndarray], np.ndarray]:
+    """Payload → (rows, vectors, deleted_ids)"""
+    with np.load(io.BytesIO(payload), allow_pickle=False) as data:
+        columns = json.loads(data['columns'].tobytes().decode('utf-8'))
+        rows = pd.DataFrame(json.loads(data['rows'].tobytes().decode('utf-8')), columns=columns)
+        vectors = np.array(data['vectors']) if bool(data['has_vectors']) else None
+        return rows, vectors, np.array(data['deleted_ids'], dtype=np.int64)
+
+
+def fsync_path(path: str):
+    """fsync một file (và thư mục chứa nó để os.replace cũng bền vững)"""
+    if not WAL['fsync'] or not os.path.exists(path):
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    try:
+        dir_fd = os.open(os.path.dirname(path) or '.', os.O_RDONLY)
+    except OSError:
+        return  # Windows không mở được thư mục
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+def reset_catalog_log():
+    """Xóa log (khi catalog được build lại từ đầu bằng src/embedding.py)"""
+    if os.path.exists(DATA_PATHS['catalog_log']):
+        os.remove(DATA_PATHS['catalog_log'])
+
+
+class CatalogLog:
+    """Log append-only của CatalogChange, có group commit và cắt log sau checkpoint"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or DATA_PATHS['catalog_log']
+        self._file = None
+        self._lock = threading.Lock()              # append / cắt log
+        self._sync_cond = threading.Condition()    # group commit
+        self._syncing = False
+        self.last_seq = 0
+        self.synced_seq = 0
+        self.size = 0
+        self.fsync_count = 0
+
+    def records(self, after_seq: int = 0) -> Iterator[Tuple[int, pd.DataFrame, Optional[np.ndarray], np.ndarray]]:
+        """
+        Đọc các record có seq > after_seq: (seq, rows, vectors, deleted_ids)
+        Dừng ở record hỏng/ghi dở đầu tiên; self.size = độ dài phần log hợp lệ.
+        """
+        self.size = 0
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb') as f:
+            while True:
+                header = f.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    break
+                length, crc, seq = RECORD_HEADER.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length or zlib.crc32(payload) != crc:
+                    print(f"⚠️ Catalog log: record seq {seq} bị ghi dở - bỏ phần cuối log")
+                    break
+                self.size += RECORD_HEADER.size + length
+                self.last_seq = max(self.last_seq, seq)
+                if seq > after_seq:
+                    yield (seq, *_decode_change(payload))
+
+    def open(self, last_seq: int):
+        """Mở log để append sau khi replay (cắt phần ghi dở ở cuối nếu có)"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+            if os.path.exists(self.path) and os.path.getsize(self.path) > self.size:
+                with open(self.path, 'r+b') as f:
+                    f.truncate(self.size)
+            self._file = open(self.path, 'ab')
+            self.last_seq = max(self.last_seq, last_seq)
+        with self._sync_cond:
+            self.synced_seq = self.last_seq
+
+    def append(self, change) -> int:
+        """Append một CatalogChange, trả về seq (đã ghi vào OS, chưa fsync - xem sync)"""
+        payload = _encode_change(change)
+        with self._lock:
+            self.last_seq += 1
+            self._file.write(RECORD_HEADER.pack(len(payload), zlib.crc32(payload), self.last_seq))
+            self._file.write(payload)
+            self._file.flush()
+            self.size += RECORD_HEADER.size + len(payload)
+            return self.last_seq
+
+    def sync(self, seq: Optional[int] = None):
+        """
+        Chờ tới khi record seq (mặc định: mọi record đã append) được fsync
+        Thread đầu tiên làm leader: chờ group_commit_ms để gom thêm write rồi fsync một lần cho tất cả;
+        các thread khác chờ kết quả của leader thay vì tự fsync.
+        """
+        seq = self.last_seq if seq is None else seq
+        with self._sync_cond:
+            while self.synced_seq < seq and self._syncing:
+                self._sync_cond.wait()
+            if self.synced_seq >= seq:
+                return
+            self._syncing = True
+
+        synced = self.synced_seq
+        try:
+            if WAL['group_commit_ms']:
+                time.sleep(WAL['group_commit_ms'] / 1000)
+            with self._lock:
+                target = self.last_seq
+                fd = os.dup(self._file.fileno())  # fd riêng: truncate_through có thể mở lại file trong lúc fsync
+            try:
+                if WAL['fsync']:
+                    os.fsync(fd)
+                    self.fsync_count += 1
+            finally:
+                os.close(fd)
+            synced = target
+        finally:
+            with self._sync_cond:
+                self.synced_seq = max(self.synced_seq, synced)
+                self._syncing = False
+                self._sync_cond.notify_all()
+
+    def truncate_through(self, seq: int):
+        """Bỏ các record có seq ≤ seq (đã nằm trong checkpoint), giữ các record append trong lúc checkpoint"""
+        with self._lock:
+            self._file.flush()
+            tail = io.BytesIO()
+            with open(self.path, 'rb') as f:
+                while True:
+                    header = f.read(RECORD_HEADER.size)
+                    if len(header) < RECORD_HEADER.size:
+                        break
+                    length, _, record_seq = RECORD_HEADER.unpack(header)
+                    if record_seq > seq:
+                        tail.write(header)
+                        tail.write(f.read(length))
+                    else:
+                        f.seek(length, os.SEEK_CUR)
+
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(tail.getvalue())
+            fsync_path(tmp_path)
+            self._file.close()
+            os.replace(tmp_path, self.path)
+            fsync_path(self.path)
+            self._file = open(self.path, 'ab')
+            self.size = len(tail.getvalue())
+        with self._sync_cond:
+            self.synced_seq = max(self.synced_seq, self.last_seq)
+
+    def close(self):
+        """Đóng file log"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def stats(self) -> Dict:
+        """Thống kê cho /api/stats"""
+        return {
+            'bytes': self.size,
+            'last_seq': self.last_seq,
+            'synced_seq': self.synced_seq,
+            'fsyncs': self.fsync_count,
+            'checkpoint_bytes': WAL['checkpoint_bytes']
+        }
@@ -18,9 +18,10 @@ class DatabaseManager:
     
     def __init__(self):
         """Khởi tạo Database Manager"""
+        # Các manager dùng chung một ProductStore (index / metadata / embeddings chỉ load 1 lần)
         self.product_manager = ProductManager()
-        self.product_deleter = ProductDeleter()
-        self.product_updater = ProductUpdater()
+        self.product_deleter = ProductDeleter(store=self.product_manager.store)
+        self.product_updater = ProductUpdater(store=self.product_manager.store)
         
     def show_statistics(self):
         """Hiển thị thống kê database"""
@@ -99,7 +100,7 @@ class DatabaseManager:
             
             # Backup files
             files_to_backup = [
-                'metadata', 'embeddings', 'faiss_index'
+                'metadata', 'embeddings', 'faiss_index', 'tombstones'
             ]
             
             backed_up_files = []
@@ -113,6 +114,14 @@ class DatabaseManager:
                     backup_file = os.path.join(backup_dir, filename)
                     shutil.copy2(source_file, backup_file)
                     backed_up_files.append(filename)
+
+                    # Tham số giải mã khi embeddings được lưu dạng sq8 và product id theo dòng
+                    if file_key == 'embeddings':
+                        from src.vector_storage import sq8_params_path, embedding_ids_path
+                        for sidecar_file in (sq8_params_path(source_file), embedding_ids_path(source_file)):
+                            if os.path.exists(sidecar_file):
+                                shutil.copy2(sidecar_file, os.path.join(backup_dir, os.path.basename(sidecar_file)))
+                                backed_up_files.append(os.path.basename(sidecar_file))
             
             print(f"✅ Backup thành công!")
             print(f"   📁 Thư mục: {backup_dir}")
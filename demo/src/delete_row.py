@@ -1,15 +1,12 @@
 """
 Chức năng xóa sản phẩm khỏi cơ sở dữ liệu
 - Tương tác với product_metadata để chọn sản phẩm cần xóa
-- Xóa vector tương ứng khỏi FAISS index
-- Cập nhật lại index và ID mapping
+- Xóa = ghi tombstone: ID của sản phẩm khác giữ nguyên, FAISS index không bị build lại
+- Vector của ID đã xóa được dọn bằng compaction nền (src/tombstones.py)
 """
 
 import os
 import sys
-import pandas as pd
-import numpy as np
-import faiss
 import torch
 from sentence_transformers import SentenceTransformer
 from transformers import AutoTokenizer
@@ -19,30 +16,34 @@ from typing import List, Optional, Union
 # Add config path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'config'))
 from simple_config import (
-    EMBEDDING_MODEL_NAME, DATA_PATHS, MAX_LENGTH, BATCH_SIZE, get_device,
+    EMBEDDING_MODEL_NAME, MAX_LENGTH, get_device,
     get_global_embedding_model, monitor_gpu_memory
 )
+from product_store import ProductStore, CatalogView, CatalogChange
 
-class ProductDeleter:
-    """Quản lý xóa sản phẩm khỏi database"""
+class ProductDeleter(CatalogView):
+    """
+    Quản lý xóa sản phẩm khỏi database
+    Dữ liệu đọc từ snapshot của ProductStore dùng chung; xóa sửa trên bản copy rồi ghi file.
+    """
     
-    def __init__(self):
-        """Khởi tạo ProductDeleter"""
+    def __init__(self, score_cache=None, store: Optional[ProductStore] = None):
+        """
+        Khởi tạo ProductDeleter
+        - score_cache: CrossEncoderScoreCache cần invalidate khi xóa sản phẩm
+        - store: ProductStore dùng chung (tạo mới nếu không truyền)
+        """
         self.device = get_device()
+        self.score_cache = score_cache
         self.model = None
         self.tokenizer = None
-        self.index = None
-        self.metadata_df = None
+        self.store = store
         self._load_models_and_data()
     
     def reload_data(self):
         """Reload dữ liệu từ file (dùng khi có thay đổi từ module khác)"""
         try:
-            # Load FAISS index
-            self.index = faiss.read_index(DATA_PATHS['faiss_index'])
-            
-            # Load metadata
-            self.metadata_df = pd.read_csv(DATA_PATHS['metadata'])
+            self.store.reload()
             
             print(f"✅ Reloaded {len(self.metadata_df)} products")
             print(f"✅ Index has {self.index.ntotal} vectors")
@@ -59,11 +60,12 @@ class ProductDeleter:
             self.model, self.tokenizer = get_global_embedding_model()
             print("✅ Using global embedding model")
             
-            # Load FAISS index
-            self.index = faiss.read_index(DATA_PATHS['faiss_index'])
-            
-            # Load metadata
-            self.metadata_df = pd.read_csv(DATA_PATHS['metadata'])
+            # Index, metadata, delta, tombstone, binary codes dùng chung qua ProductStore
+            if self.store is None:
+                self.store = ProductStore()
+            if self.store.snapshot() is None:
+                print("Please run preprocess.py and embedding.py first")
+                return
             
             print(f"✅ Loaded {len(self.metadata_df)} products")
             print(f"✅ Index has {self.index.ntotal} vectors")
@@ -157,9 +159,8 @@ class ProductDeleter:
                 return None
             
             # Kiểm tra ID có tồn tại không
-            existing_ids = self.metadata_df['id'].tolist()
-            valid_ids = [id for id in id_list if id in existing_ids]
-            invalid_ids = [id for id in id_list if id not in existing_ids]
+            valid_ids = [id for id in id_list if id in self.id_index]
+            invalid_ids = [id for id in id_list if id not in self.id_index]
             
             if invalid_ids:
                 print(f"⚠️  ID không tồn tại: {invalid_ids}")
@@ -171,7 +172,7 @@ class ProductDeleter:
             # Hiển thị sản phẩm sẽ bị xóa
             print(f"\n📋 Sản phẩm sẽ bị xóa:")
             for product_id in valid_ids:
-                row = self.metadata_df[self.metadata_df['id'] == product_id].iloc[0]
+                row = self.get_product(product_id)
                 print(f"   • ID {product_id}: {row['name']} - {row['brand']}")
             
             confirm = input(f"\n⚠️  Xác nhận xóa {len(valid_ids)} sản phẩm? (y/n) [default: n]: ").strip().lower()
@@ -265,13 +266,12 @@ class ProductDeleter:
                     id_list = [int(x.strip()) for x in choice.split(',') if x.strip().isdigit()]
                     
                     if id_list:
-                        existing_ids = self.metadata_df['id'].tolist()
-                        valid_ids = [id for id in id_list if id in existing_ids]
+                        valid_ids = [id for id in id_list if id in self.id_index]
                         
                         if valid_ids:
                             print(f"\n📋 Sản phẩm sẽ bị xóa:")
                             for product_id in valid_ids:
-                                row = self.metadata_df[self.metadata_df['id'] == product_id].iloc[0]
+                                row = self.get_product(product_id)
                                 print(f"   • ID {product_id}: {row['name']} - {row['brand']}")
                             
                             confirm = input(f"\n⚠️  Xác nhận xóa {len(valid_ids)} sản phẩm? (y/n) [default: n]: ").strip().lower()
@@ -286,7 +286,8 @@ class ProductDeleter:
     
     def delete_products(self, product_ids: List[int]) -> bool:
         """Xóa sản phẩm khỏi database và vector index"""
-        if self.metadata_df is None or self.index is None:
+        snapshot = self.store.snapshot() if self.store is not None else None
+        if snapshot is None:
             print("❌ Database chưa được load")
             return False
         
@@ -294,81 +295,45 @@ class ProductDeleter:
             print(f"\n🔄 Đang xóa {len(product_ids)} sản phẩm...")
             
             # 1. Kiểm tra ID có tồn tại không và chuyển từ ID sang index
-            existing_ids = self.metadata_df['id'].tolist()
-            valid_ids = [id for id in product_ids if id in existing_ids]
+            valid_ids = [id for id in product_ids if id in snapshot.id_index]
             
             if not valid_ids:
                 print("❌ Không có ID hợp lệ để xóa")
                 return False
             
-            # 2. Chuyển từ ID sang index để xóa
-            indices_to_delete = []
+            # 2. Chuyển từ ID sang vị trí dòng metadata
+            rows_to_delete = []
             deleted_products = []
             
             for product_id in valid_ids:
-                # Tìm index của product_id trong DataFrame
-                idx = self.metadata_df[self.metadata_df['id'] == product_id].index[0]
-                indices_to_delete.append(idx)
+                idx = snapshot.id_index.get(product_id)
+                rows_to_delete.append(idx)
                 
                 # Lưu thông tin sản phẩm bị xóa (để log)
-                row = self.metadata_df.iloc[idx]
+                row = snapshot.get_product(product_id)
                 deleted_products.append({
                     'id': product_id,
                     'name': row['name'],
                     'brand': row['brand']
                 })
             
-            # 3. Load embeddings hiện tại
-            embeddings_file = DATA_PATHS['embeddings']
-            if os.path.exists(embeddings_file):
-                old_embeddings = np.load(embeddings_file)
-            else:
-                print("❌ Không tìm thấy file embeddings")
-                return False
-            
-            # 4. Kiểm tra consistency và tạo mask
-            print(f"🔍 Debug info:")
-            print(f"   Metadata rows: {len(self.metadata_df)}")
-            print(f"   Embeddings rows: {len(old_embeddings)}")
-            print(f"   Indices to delete: {indices_to_delete}")
-            
-            # Sử dụng kích thước nhỏ hơn để đảm bảo không có lỗi index
-            effective_size = min(len(self.metadata_df), len(old_embeddings))
-            
-            # Tạo mask để giữ lại các hàng không bị xóa
-            keep_mask = np.ones(effective_size, dtype=bool)
-            valid_indices = [idx for idx in indices_to_delete if idx < effective_size]
-            
-            if len(valid_indices) != len(indices_to_delete):
-                print(f"⚠️ Warning: Some indices are out of bounds. Valid: {valid_indices}")
-            
-            for idx in valid_indices:
-                keep_mask[idx] = False
-            
-            # 5. Xóa khỏi metadata và reset ID
-            # Đảm bảo chỉ giữ các hàng trong phạm vi hợp lệ
-            self.metadata_df = self.metadata_df.iloc[:effective_size][keep_mask].reset_index(drop=True)
-            # Cập nhật cột ID để khớp với index mới
-            self.metadata_df['id'] = range(len(self.metadata_df))
-            
-            # 6. Xóa khỏi embeddings
-            remaining_embeddings = old_embeddings[:effective_size][keep_mask]
+            # 3-5. Phát CatalogChange: store bỏ dòng metadata (ID của các sản phẩm còn lại giữ nguyên),
+            #      ghi tombstone - vector vẫn nằm trong main index / embeddings, search loại bằng IDSelector
+            #      tới khi compaction nền dọn (không build lại index) - lưu file và publish snapshot mới
+            snapshot = self.store.commit(CatalogChange(deleted_ids=valid_ids))
             
-            # 7. Rebuild FAISS index với embeddings mới
-            print("🔄 Rebuilding FAISS index...")
-            self._rebuild_faiss_index(remaining_embeddings)
+            # 6. Invalidate score cross-encoder của các sản phẩm đã xóa
+            if self.score_cache is not None:
+                self.score_cache.invalidate_products(valid_ids)
             
-            # 8. Lưu dữ liệu
-            self._save_data(remaining_embeddings)
-            
-            # 9. Report kết quả
+            # 7. Report kết quả
             print(f"✅ Đã xóa thành công {len(valid_ids)} sản phẩm:")
             for product in deleted_products:
                 print(f"   • ID {product['id']}: {product['name']} - {product['brand']}")
             
             print(f"📊 Database statistics:")
-            print(f"   • Sản phẩm còn lại: {len(self.metadata_df)}")
-            print(f"   • Vectors còn lại: {self.index.ntotal}")
+            print(f"   • Sản phẩm còn lại: {snapshot.num_products}")
+            print(f"   • Tombstones chờ compaction: {len(snapshot.tombstones)}")
             
             return True
             
@@ -377,106 +342,6 @@ class ProductDeleter:
             import traceback
             traceback.print_exc()
             return False
-    
-    def _rebuild_faiss_index(self, embeddings: np.ndarray):
-        """Rebuild FAISS index với embeddings mới"""
-        try:
-            if len(embeddings) == 0:
-                # Tạo index rỗng
-                dimension = self.index.d if self.index else 768  # Default dimension
-                base_index = faiss.IndexFlatIP(dimension)
-                self.index = faiss.IndexIDMap(base_index)
-                return
-            
-            # Normalize embeddings cho cosine similarity
-            normalized_embeddings = embeddings.copy()
-            faiss.normalize_L2(normalized_embeddings)
-            
-            # Tạo index mới
-            dimension = embeddings.shape[1]
-            base_index = faiss.IndexFlatIP(dimension)
-            new_index = faiss.IndexIDMap(base_index)
-            
-            # Thêm embeddings với ID mới (từ 0 đến n-1)
-            ids = np.arange(len(embeddings), dtype=np.int64)
-            new_index.add_with_ids(normalized_embeddings, ids)
-            
-            self.index = new_index
-            print(f"✅ Rebuilt FAISS index với {self.index.ntotal} vectors")
-                
-        except Exception as e:
-            print(f"❌ Lỗi khi rebuild index: {e}")
-            import traceback
-            traceback.print_exc()
-    
-    def _recreate_embeddings(self):
-        """Tạo lại embeddings cho tất cả sản phẩm còn lại"""
-        try:
-            print("🔄 Recreating embeddings for remaining products...")
-            
-            if len(self.metadata_df) == 0:
-                return
-            
-            embeddings_list = []
-            
-            for idx, row in self.metadata_df.iterrows():
-                text = row['text_corpus']
-                
-                # Tạo embedding
-                embedding = self.model.encode(
-                    text,
-                    batch_size=BATCH_SIZE,
-                    show_progress_bar=False,
-                    normalize_embeddings=True,
-                    max_length=MAX_LENGTH,
-                    device=self.device,
-                    convert_to_tensor=True
-                )
-                
-                embeddings_list.append(embedding.detach().cpu().numpy())
-                
-                if (idx + 1) % 50 == 0:
-                    print(f"   Processed {idx + 1}/{len(self.metadata_df)} products...")
-            
-            # Convert to numpy array
-            new_embeddings = np.array(embeddings_list)
-            
-            # Tạo index mới
-            dimension = new_embeddings.shape[1]
-            base_index = faiss.IndexFlatIP(dimension)
-            new_index = faiss.IndexIDMap(base_index)
-            
-            # Thêm embeddings với ID
-            product_ids = self.metadata_df['id'].values
-            new_index.add_with_ids(new_embeddings, product_ids)
-            
-            self.index = new_index
-            
-            # Lưu embeddings mới
-            np.save(DATA_PATHS['embeddings'], new_embeddings)
-            
-            print("✅ Embeddings recreated successfully")
-            
-        except Exception as e:
-            print(f"❌ Lỗi khi recreate embeddings: {e}")
-    
-    def _save_data(self, embeddings: np.ndarray = None):
-        """Lưu metadata, embeddings và FAISS index"""
-        try:
-            # Lưu metadata
-            self.metadata_df.to_csv(DATA_PATHS['metadata'], index=False)
-            
-            # Lưu embeddings nếu có
-            if embeddings is not None:
-                np.save(DATA_PATHS['embeddings'], embeddings)
-            
-            # Lưu FAISS index
-            faiss.write_index(self.index, DATA_PATHS['faiss_index'])
-            
-            print("💾 Đã lưu dữ liệu")
-            
-        except Exception as e:
-            print(f"❌ Lỗi khi lưu dữ liệu: {e}")
 
 def interactive_delete_product():
     """Giao diện tương tác để xóa sản phẩm"""
@@ -0,0 +1,235 @@
+"""
+Delta index (kiểu LSM) đặt trước main FAISS index
+- Add/update ghi vào một flat index nhỏ → main index không bị sửa/train lại
+  (delete ghi vào tombstones.py, vector cũ được dọn bằng compaction)
+- Search: main index (các ID có vector mới trong delta bị loại bằng IDSelector) + delta, merge theo score
+- Merge nền: fold delta vào bản copy của main index khi vượt ngưỡng, replay các thay đổi ghi trong lúc merge
+  rồi publish main index mới vào ProductStore. Flat / scalar quantizer: vector mới của ID đã có được ghi đè
+  tại slot trên bản copy đó (một lần copy cho cả delta thay vì mỗi update)
+Mỗi thay đổi mang một sequence number để merge chỉ xóa đúng các entry đã được fold.
+"""
+
+import os
+import sys
+import numpy as np
+import faiss
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+# Add config path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'config'))
+from simple_config import DATA_PATHS, DELTA_INDEX
+from index_factory import (
+    normalize_vectors, add_vectors, build_index, apply_search_params, supports_in_place_update, replace_vectors
+)
+from id_index import IdPositionIndex
+
+
+class DeltaIndex:
+    """Flat index cho các vector mới ghi (add/update) chưa merge vào main index"""
+
+    def __init__(self, dimension: Optional[int] = None):
+        """Khởi tạo delta rỗng (dimension xác định ở lần upsert đầu tiên nếu chưa biết)"""
+        self.dimension = dimension
+        self.index = None
+        self.vectors = {}     # product id → (seq, vector đã normalize)
+        self.seq = 0
+        if dimension is not None:
+            self._reset_index()
+
+    def _reset_index(self):
+        self.index = faiss.IndexIDMap(faiss.IndexFlatIP(self.dimension))
+
+    def __len__(self) -> int:
+        return len(self.vectors)
+
+    def masked_ids(self) -> np.ndarray:
+        """Các ID mà vector trong main index không còn đúng (đã có vector mới trong delta)"""
+        return np.fromiter(self.vectors, dtype=np.int64)
+
+    def copy(self) -> 'DeltaIndex':
+        """Bản copy độc lập (snapshot đã publish không bị sửa; vector là mảng chỉ đọc nên dùng chung được)"""
+        delta = DeltaIndex(self.dimension)
+        delta.seq = self.seq
+        delta.vectors = dict(self.vectors)
+        if self.index is not None:
+            delta.index = faiss.clone_index(self.index)
+        return delta
+
+    def upsert(self, vectors, ids: Iterable[int]):
+        """Thêm/ghi đè vector của các product id"""
+        ids = np.asarray(list(ids), dtype=np.int64)
+        vectors = normalize_vectors(np.asarray(vectors).reshape(len(ids), -1))
+        if self.index is None:
+            self.dimension = vectors.shape[1]
+            self._reset_index()
+
+        existing = ids[np.isin(ids, np.fromiter(self.vectors, dtype=np.int64))]
+        if len(existing) > 0:
+            self.index.remove_ids(existing)
+        self.index.add_with_ids(vectors, ids)
+
+        for product_id, vector in zip(ids, vectors):
+            self.seq += 1
+            self.vectors[int(product_id)] = (self.seq, vector)
+
+    def discard(self, ids: Iterable[int]):
+        """Bỏ vector chưa merge của các product id đã xóa (ID đã xóa được che bằng tombstone)"""
+        ids = np.asarray(list(ids), dtype=np.int64)
+        existing = ids[np.isin(ids, np.fromiter(self.vectors, dtype=np.int64))]
+        if len(existing) > 0:
+            self.index.remove_ids(existing)
+        for product_id in existing:
+            del self.vectors[int(product_id)]
+
+    def search(self, main_search: Callable[[np.ndarray, int], Tuple[np.ndarray, np.ndarray]],
+               query_embeddings: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Search main index + delta, trả về (scores, ids) [nq, k] giống faiss Index.search
+        main_search phải loại các ID trong masked_ids() (vd search_parameters(index, masked_ids())),
+        kết quả main index vẫn được lọc lại phòng trường hợp không loại được.
+        """
+        if len(self) == 0:
+            return main_search(query_embeddings, k)
+
+        masked = self.masked_ids()
+        main_scores, main_ids = main_search(query_embeddings, k)
+        main_scores = np.array(main_scores, dtype=np.float32)
+        main_ids = np.array(main_ids, dtype=np.int64)
+        hidden = np.isin(main_ids, masked)
+        main_scores[hidden] = -np.inf
+        main_ids[hidden] = -1
+
+        if self.vectors:
+            delta_scores, delta_ids = self.index.search(
+                normalize_vectors(query_embeddings), min(k, len(self.vectors))
+            )
+            main_scores = np.concatenate([main_scores, delta_scores], axis=1)
+            main_ids = np.concatenate([main_ids, delta_ids], axis=1)
+
+        main_scores[main_ids < 0] = -np.inf
+        order = np.argsort(-main_scores, axis=1)[:, :k]
+        return np.take_along_axis(main_scores, order, axis=1), np.take_along_axis(main_ids, order, axis=1)
+
+    def should_merge(self) -> bool:
+        """Delta đã vượt ngưỡng merge chưa"""
+        return len(self) >= DELTA_INDEX['merge_threshold']
+
+    def fold_into(self, index: faiss.Index,
+                  slots: Optional[IdPositionIndex] = None) -> Optional[Tuple[faiss.Index, Optional[IdPositionIndex]]]:
+        """
+        Fold delta vào bản copy của main index (main index đang phục vụ search không bị sửa), trả về (index, slots)
+        - Flat / scalar quantizer có bảng slot: ID đã có trong main index được ghi đè tại slot (O(1) mỗi vector),
+          ID mới được add vào các slot cuối - không remove_ids, bảng slot được nối tiếp (không đọc lại id_map)
+        - Loại khác: vector cũ của các ID trong delta bị remove rồi add vector mới (slots = None: đọc lại từ index)
+        Trả về None nếu loại index không hỗ trợ remove_ids (vd HNSW) - khi đó cần build lại.
+        """
+        merged = apply_search_params(faiss.clone_index(index))
+        if not self.vectors:
+            return merged, slots
+        ids = np.fromiter(self.vectors, dtype=np.int64)
+        vectors = np.stack([self.vectors[int(i)][1] for i in ids])
+
+        if slots is not None and supports_in_place_update(merged):
+            in_place = slots.lookup(ids) >= 0
+            if in_place.any():
+                replace_vectors(merged, vectors[in_place], ids[in_place], slots)
+            if (~in_place).any():
+                slots = slots.appended(ids[~in_place], merged.ntotal)
+                add_vectors(merged, vectors[~in_place], ids[~in_place])
+            return merged, slots
+
+        try:
+            merged.remove_ids(ids)
+        except RuntimeError:
+            return None
+        add_vectors(merged, vectors, ids)
+        return merged, None
+
+    def drop_through(self, seq: int):
+        """Xóa các entry có sequence ≤ seq (đã được fold vào main index)"""
+        merged_ids = [product_id for product_id, (entry_seq, _) in self.vectors.items() if entry_seq <= seq]
+        if merged_ids:
+            self.index.remove_ids(np.asarray(merged_ids, dtype=np.int64))
+            for product_id in merged_ids:
+                del self.vectors[product_id]
+
+    def clear(self):
+        """Xóa toàn bộ delta (sau khi main index được build lại từ embeddings)"""
+        self.vectors = {}
+        if self.dimension is not None:
+            self._reset_index()
+
+    def save(self, path: Optional[str] = None):
+        """Lưu delta ra .npz (ghi file tạm rồi os.replace)"""
+        path = path or DATA_PATHS['delta_index']
+        ids = np.fromiter(self.vectors, dtype=np.int64)
+        vectors = (np.stack([self.vectors[int(i)][1] for i in ids]) if len(ids) > 0
+                   else np.zeros((0, self.dimension or 0), dtype=np.float32))
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(
+            tmp_path,
+            ids=ids,
+            vector_seqs=np.asarray([self.vectors[int(i)][0] for i in ids], dtype=np.int64),
+            vectors=vectors,
+            seq=np.int64(self.seq),
+            dimension=np.int64(self.dimension or 0)
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: Optional[str] = None) -> 'DeltaIndex':
+        """Load delta từ file (delta rỗng nếu chưa có file)"""
+        path = path or DATA_PATHS['delta_index']
+        if not os.path.exists(path):
+            return cls()
+        with np.load(path) as data:
+            delta = cls(int(data['dimension']) or None)
+            delta.seq = int(data['seq'])
+            if len(data['ids']) > 0:
+                delta.index.add_with_ids(np.ascontiguousarray(data['vectors'], dtype=np.float32), data['ids'])
+            delta.vectors = {
+                int(product_id): (int(entry_seq), vector)
+                for product_id, entry_seq, vector in zip(data['ids'], data['vector_seqs'], data['vectors'])
+            }
+        return delta
+
+    def stats(self) -> Dict:
+        """Thống kê cho /api/stats"""
+        return {
+            'vectors': len(self.vectors),
+            'seq': self.seq,
+            'merge_threshold': DELTA_INDEX['merge_threshold']
+        }
+
+
+def build_merged_index(snapshot):
+    """
+    Bước chậm của merge (chạy nền, không giữ lock): snapshot mới từ snapshot (journal.base) với delta đã fold
+    vào bản copy của main index và delta rỗng. Không đọc gì từ đĩa. Kết quả truyền cho commit_merged_index.
+    """
+    folded = snapshot.delta.fold_into(snapshot.index, snapshot.slots)
+    if folded is None:
+        # Index không hỗ trợ remove_ids: build lại từ embeddings (đã chứa mọi thay đổi tới snapshot này)
+        print("🔄 Main index không hỗ trợ remove_ids - build lại từ embeddings")
+        folded = build_index(np.asarray(snapshot.embeddings), snapshot.embedding_ids), None
+    merged, slots = folded
+    delta = snapshot.delta.copy()
+    delta.drop_through(snapshot.delta.seq)
+    if slots is not None:
+        return snapshot.replace(index=merged, delta=delta, slots=slots)
+    return snapshot.replace(index=merged, delta=delta)
+
+
+def commit_merged_index(store, journal, merged) -> bool:
+    """
+    Bước nhanh của merge (gọi khi giữ lock ghi): publish snapshot đã merge sau khi replay các add/update/delete
+    commit trong lúc merge (store.rebase) - vector ghi sau base nằm lại trong delta của snapshot mới.
+    Trả về False nếu journal không còn hợp lệ (compaction / reload / rebuild đã publish trong lúc merge).
+    """
+    snapshot = store.rebase(journal, merged, persist=True)
+    if snapshot is None:
+        print("⚠️ Catalog đã được thay trong lúc merge (compaction / reload / rebuild) - bỏ kết quả merge")
+        return False
+    print(f"✅ Delta merged: main index {snapshot.index.ntotal} vectors, delta còn {len(snapshot.delta)} entries "
+          f"(replay {len(journal.changes)} changes)")
+    return True
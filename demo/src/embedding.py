@@ -11,14 +11,22 @@ import ast
 import json
 from typing import List, Dict, Tuple
 import re
-import torch.nn as nn
 from preprocess import create_text_corpus
+from index_factory import build_index, evaluate_index, evaluate_storage, save_index_report, print_index_report
+from vector_storage import save_embeddings
+from binary_index import BinaryIndex
+from projection import Projection, remove_projection
+from attention_pooling import load_attention_pooling, pool_chunks
+from embedding_cache import cache_keys, get_embedding_cache
+from tombstones import remove_tombstones
+from catalog_log import reset_catalog_log
+from snapshot_dir import reset_snapshots
 
 # Add config path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'config'))
 from simple_config import (
-    EMBEDDING_MODEL_NAME, DATA_PATHS, BATCH_SIZE, MAX_LENGTH, get_device,
-    get_global_embedding_model, monitor_gpu_memory
+    EMBEDDING_MODEL_NAME, DATA_PATHS, BATCH_SIZE, MAX_LENGTH, EMBEDDING_BUILD, EMBEDDING_CACHE, BINARY_SEARCH,
+    PROJECTION, get_device, get_global_embedding_model, monitor_gpu_memory
 )
 
 
@@ -28,164 +36,307 @@ def load_embedding_model():
     return get_global_embedding_model()
 
 
-def split_text_into_chunks(text, tokenizer, max_length):
+CHUNK_OVERLAP = 20  # Số token chồng lấn giữa hai chunk liên tiếp để giữ context
+
+
+def token_windows(input_ids, window, overlap=CHUNK_OVERLAP):
     """
-    Chia text thành các chunks với độ dài tối đa max_length tokens
+    Chia token ids thành các cửa sổ tối đa window tokens, chồng lấn overlap tokens
+    (cửa sổ cuối kết thúc ở token cuối cùng, không sinh cửa sổ chỉ gồm phần chồng lấn)
     """
-    tokens = tokenizer.tokenize(text)
-    chunks = []
-    
-    if len(tokens) <= max_length:
-        return [text]  # Không cần chia nếu text đã ngắn
-    
-    for i in range(0, len(tokens), max_length - 20):  # Overlap 20 tokens để giữ context
-        chunk = tokens[i:i+max_length]
-        chunk_text = tokenizer.convert_tokens_to_string(chunk)
-        chunks.append(chunk_text)
-    
-    return chunks
+    if len(input_ids) <= window:
+        return [list(input_ids)]
+    stride = max(window - overlap, 1)
+    windows = []
+    for start in range(0, len(input_ids), stride):
+        windows.append(list(input_ids[start:start + window]))
+        if start + window >= len(input_ids):
+            break
+    return windows
+
+
+def special_token_ids(tokenizer):
+    """(prefix, suffix): special token ids tokenizer thêm quanh một câu ([CLS] ... [SEP] với BGE/BERT)"""
+    plain = tokenizer('a', add_special_tokens=False)['input_ids']
+    full = tokenizer('a', add_special_tokens=True)['input_ids']
+    for start in range(len(full) - len(plain) + 1):
+        if full[start:start + len(plain)] == plain:
+            return full[:start], full[start + len(plain):]
+    return [], []
 
-class AttentionPooling(nn.Module):
+
+def encode_token_windows(windows, model, tokenizer, device, batch_size=None) -> torch.Tensor:
     """
-    Attention pooling layer để kết hợp embeddings từ nhiều chunks
+    Encode các cửa sổ token ids (chưa có special tokens) qua transformer, không detokenize / tokenize lại
+    Cửa sổ được sắp theo độ dài, mỗi batch pad tới cửa sổ dài nhất của batch kèm attention mask.
+    Trả về tensor [len(windows), embed_dim] đã normalize, theo đúng thứ tự windows.
     """
-    def __init__(self, embed_dim):
-        super().__init__()
-        self.attention = nn.Sequential(
-            nn.Linear(embed_dim, 128),
-            nn.Tanh(),
-            nn.Linear(128, 1)
-        )
+    if batch_size is None:
+        batch_size = BATCH_SIZE
+    prefix, suffix = special_token_ids(tokenizer)
+    with_token_types = 'token_type_ids' in getattr(tokenizer, 'model_input_names', [])
+
+    order = sorted(range(len(windows)), key=lambda i: len(windows[i]))
+    encoded = [None] * len(windows)
+    with torch.no_grad():
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            padded = tokenizer.pad({'input_ids': [prefix + list(windows[i]) + suffix for i in batch]},
+                                   return_tensors='pt')
+            features = {'input_ids': padded['input_ids'].to(device),
+                        'attention_mask': padded['attention_mask'].to(device)}
+            if with_token_types:
+                features['token_type_ids'] = torch.zeros_like(features['input_ids'])
+
+            embeddings = model(features)['sentence_embedding']
+            embeddings = torch.nn.functional.normalize(embeddings.float(), p=2, dim=1)
+            for row, i in enumerate(batch):
+                encoded[i] = embeddings[row]
+    return torch.stack(encoded)
 
-    def forward(self, embeddings):
-        # embeddings: [batch_size, num_chunks, embed_dim]
-        scores = self.attention(embeddings)  # [batch_size, num_chunks, 1]
-        weights = torch.softmax(scores, dim=1)  # [batch_size, num_chunks, 1]
-        weighted = embeddings * weights  # [batch_size, num_chunks, embed_dim]
-        pooled = weighted.sum(dim=1)  # [batch_size, embed_dim]
-        return pooled
 
 def embed_text_with_attention(text, model, tokenizer, max_length, device, batch_size=None):
     """
-    Embed text với attention pooling cho text dài
+    Embed text với attention pooling cho text dài (một text - xem embed_texts)
     """
-    if batch_size is None:
-        batch_size = BATCH_SIZE
-        
-    # Chia chunk
-    chunks = split_text_into_chunks(text, tokenizer, max_length)
-    
-    if len(chunks) == 1:
-        # Text ngắn, embed bình thường với các tham số nhất quán
-        return model.encode(
-            text, 
-            batch_size=batch_size,
-            show_progress_bar=False,
-            normalize_embeddings=True,
-            max_length=max_length,
-            device=device,
-            convert_to_tensor=True
-        )
-    
-    # Embed từng chunk
-    chunk_embeddings = []
-    for chunk in chunks:
-        emb = model.encode(
-            chunk, 
+    return torch.from_numpy(embed_texts([text], model, tokenizer, max_length, device, batch_size)[0])
+
+
+def token_lengths(texts, tokenizer) -> np.ndarray:
+    """
+    Số token (không tính special tokens) của từng text
+    Tokenize theo batch lớn: fast tokenizer xử lý cả batch trong Rust thay vì từng text một
+    """
+    step = EMBEDDING_BUILD['tokenize_batch_size']
+    lengths = []
+    for start in range(0, len(texts), step):
+        encoded = tokenizer(list(texts[start:start + step]), add_special_tokens=False,
+                            return_attention_mask=False, return_token_type_ids=False)
+        lengths.extend(len(ids) for ids in encoded['input_ids'])
+    return np.array(lengths, dtype=np.int64)
+
+
+def _encode_sorted(texts, model, max_length, device, batch_size, show_progress=False) -> torch.Tensor:
+    """
+    Encode texts (đã sắp theo độ dài token) theo từng bucket EMBEDDING_BUILD['bucket_size'] text
+    Mỗi batch chỉ gồm text dài gần bằng nhau → padding ít; trả về tensor [len(texts), embed_dim]
+    """
+    bucket_size = max(EMBEDDING_BUILD['bucket_size'], 1)
+    encoded = []
+    for start in range(0, len(texts), bucket_size):
+        encoded.append(model.encode(
+            texts[start:start + bucket_size],
             batch_size=batch_size,
             show_progress_bar=False,
             normalize_embeddings=True,
             max_length=max_length,
             device=device,
             convert_to_tensor=True
-        ).unsqueeze(0)  # [1, embed_dim]
-        chunk_embeddings.append(emb)
-    
-    all_chunks = torch.cat(chunk_embeddings, dim=0).unsqueeze(0)  # [1, num_chunks, embed_dim]
-    
-    # Attention Pooling
-    attn_pool = AttentionPooling(embed_dim=all_chunks.shape[-1]).to(device)
-    pooled_embedding = attn_pool(all_chunks.to(device))  # [1, embed_dim]
-    
-    # Normalize final embedding
-    pooled_embedding = torch.nn.functional.normalize(pooled_embedding, p=2, dim=1)
-    
-    return pooled_embedding.squeeze(0)
+        ).detach())
+        if show_progress:
+            print(f"   Encoded {min(start + bucket_size, len(texts))}/{len(texts)}...")
+    return torch.cat(encoded, dim=0)
+
+
+def _encode_texts(texts, model, tokenizer, max_length, device, batch_size=None, lengths=None,
+                  show_progress=False) -> np.ndarray:
+    """
+    Encode nhiều text một lượt (không qua cache)
+    - Text ngắn: sắp theo độ dài token, encode theo batch (padding ít)
+    - Text dài hơn max_length: cửa sổ token ids (chồng lấn CHUNK_OVERLAP) của mọi text dài được
+      đưa qua transformer theo batch (encode_token_windows), rồi pool bằng attention pooling head
+      đã lưu (attention_pooling.py) - cùng text luôn cho cùng vector ở build lẫn add/update
+    lengths: số token của từng text nếu đã có (token_lengths), tránh tokenize lại
+    Trả về mảng [len(texts), embed_dim] float32 theo đúng thứ tự texts.
+    """
+    if batch_size is None:
+        batch_size = BATCH_SIZE
+    texts = list(texts)
+    if lengths is None:
+        lengths = token_lengths(texts, tokenizer)
+    lengths = np.asarray(lengths)
+
+    order = np.argsort(lengths, kind='stable')
+    short = order[lengths[order] <= max_length]
+    long = order[lengths[order] > max_length]
+
+    embeddings = None
+    if len(short) > 0:
+        if show_progress:
+            print(f"🔄 Encoding {len(short)} short texts (batch {batch_size})...")
+        encoded = _encode_sorted([texts[i] for i in short], model, max_length, device, batch_size, show_progress)
+        encoded = encoded.cpu().numpy()
+        embeddings = np.empty((len(texts), encoded.shape[1]), dtype=np.float32)
+        embeddings[short] = encoded
+
+    if len(long) > 0:
+        # Cửa sổ token ids của mọi text dài (chỉ text dài được tokenize lại), encode chung theo batch
+        window = max_length - tokenizer.num_special_tokens_to_add()
+        long_ids = tokenizer([texts[i] for i in long], add_special_tokens=False,
+                             return_attention_mask=False, return_token_type_ids=False)['input_ids']
+        windows, spans = [], []
+        for input_ids in long_ids:
+            text_windows = token_windows(input_ids, window)
+            spans.append((len(windows), len(text_windows)))
+            windows.extend(text_windows)
+        if show_progress:
+            print(f"🔄 Encoding {len(windows)} chunks of {len(long)} long texts (batch {batch_size})...")
+        chunk_embeddings = encode_token_windows(windows, model, tokenizer, device, batch_size)
+        if embeddings is None:
+            embeddings = np.empty((len(texts), chunk_embeddings.shape[1]), dtype=np.float32)
+
+        # Attention pooling bằng head đã lưu (data/attention_pooling.pt), cả batch text một lần
+        pooling = load_attention_pooling(chunk_embeddings.shape[-1], chunk_embeddings.device)
+        embeddings[long] = pool_chunks(chunk_embeddings, spans, pooling).cpu().numpy()
+
+    if embeddings is None:
+        return np.zeros((0, model.get_sentence_embedding_dimension()), dtype=np.float32)
+    return embeddings
+
+
+def embedding_namespace(model, max_length, device) -> bytes:
+    """
+    Phần cấu hình của key embedding cache: model, MAX_LENGTH, overlap chunk, trọng số attention pooling
+    (cùng namespace + cùng text → cùng vector)
+    """
+    pooling = load_attention_pooling(model.get_sentence_embedding_dimension(), device)
+    return pooling_namespace(pooling, max_length)
+
+
+def pooling_namespace(pooling, max_length) -> bytes:
+    """embedding_namespace theo head pooling đã load (không cần model, vd process cha của parallel_build)"""
+    return f"{EMBEDDING_MODEL_NAME}|{max_length}|{CHUNK_OVERLAP}|{pooling.fingerprint}|normalize".encode('utf-8')
+
+
+def embed_texts(texts, model, tokenizer, max_length, device, batch_size=None, lengths=None,
+                show_progress=False, use_cache=None) -> np.ndarray:
+    """
+    Embed nhiều text một lượt (build index, add/update, bulk, import, rebuild)
+    Tra embedding cache trước (EMBEDDING_CACHE): chỉ text chưa có trong cache được encode
+    (text trùng nhau chỉ encode một lần), vector mới được ghi vào cache.
+    Trả về mảng [len(texts), embed_dim] float32 theo đúng thứ tự texts.
+    """
+    texts = list(texts)
+    if use_cache is None:
+        use_cache = EMBEDDING_CACHE['enabled']
+    if not use_cache or not texts:
+        return _encode_texts(texts, model, tokenizer, max_length, device, batch_size, lengths, show_progress)
+
+    cache = get_embedding_cache()
+    keys = cache_keys(texts, embedding_namespace(model, max_length, device))
+    found, cached = cache.get(keys)
+    missing_keys, first, inverse = np.unique(keys[~found], return_index=True, return_inverse=True)
+    missing = np.flatnonzero(~found)[first]
+    if show_progress or len(texts) > 1:
+        print(f"🗃️ Embedding cache: {found.sum()}/{len(texts)} hit, encode {len(missing)} text")
+
+    encoded = None
+    if len(missing) > 0:
+        encoded = _encode_texts([texts[i] for i in missing], model, tokenizer, max_length, device, batch_size,
+                                None if lengths is None else np.asarray(lengths)[missing], show_progress)
+        cache.put(missing_keys, encoded)
+
+    dimension = cached.shape[1] if encoded is None else encoded.shape[1]
+    embeddings = np.empty((len(texts), dimension), dtype=np.float32)
+    if found.any():
+        embeddings[found] = cached
+    if encoded is not None:
+        embeddings[~found] = encoded[inverse.reshape(-1)]
+    return embeddings
+
+
+def build_batch_size(device) -> int:
+    """Batch size khi build embeddings trên device (EMBEDDING_BUILD['cpu_batch_size'] với CPU)"""
+    return EMBEDDING_BUILD['cpu_batch_size'] if str(device) == 'cpu' else EMBEDDING_BUILD['batch_size']
 
 
 def create_embeddings_with_attention_pooling(model, tokenizer, max_length=None, batch_size=None):
     """
-    Tạo embeddings với attention pooling cho các text vượt quá max_length
+    Tạo embeddings cho toàn bộ catalog với attention pooling cho các text vượt quá max_length
+    Tokenize một lượt (batch), encode theo bucket độ dài token (xem embed_texts)
     """
     # Use config defaults if not specified
     if max_length is None:
         max_length = MAX_LENGTH
-    if batch_size is None:
-        batch_size = BATCH_SIZE
-        
+
     # Sử dụng create_text_corpus để đảm bảo nhất quán với các module khác
     df = create_text_corpus()
+    texts = df['text_corpus'].tolist()
 
-    # Tokenize dữ liệu text_corpus để lấy độ dài
-    df['token_length'] = df['text_corpus'].apply(lambda x: len(tokenizer.tokenize(x)))
+    device = get_device()
+    if batch_size is None:
+        batch_size = build_batch_size(device)
+    print(f"🔄 Creating embeddings with attention pooling (device: {device}, batch {batch_size})")
 
-    # Kiểm tra các thống kê
-    print("Max token length:", df['token_length'].max())
-    print("Min token length:", df['token_length'].min())
-    print("Average token length:", df['token_length'].mean())
+    # Tokenize một lượt để lấy độ dài (dùng lại khi chia bucket)
+    start_time = time.time()
+    lengths = token_lengths(texts, tokenizer)
+    long_texts = lengths > max_length
 
-    # Optional: Kiểm tra số mẫu vượt quá giới hạn mặc định
-    print(f"Số mẫu vượt quá {max_length} token:", (df['token_length'] > max_length).sum())
+    print(f"📊 Text length analysis ({time.time() - start_time:.1f}s):")
+    print(f"   • Total texts: {len(texts)}")
+    if len(texts) > 0:
+        print(f"   • Long texts (>{max_length} tokens): {long_texts.sum()} ({long_texts.mean()*100:.1f}%)")
+        print(f"   • Max token length: {lengths.max()}")
+        print(f"   • Min token length: {lengths.min()}")
+        print(f"   • Average token length: {lengths.mean():.1f}")
+
+    start_time = time.time()
+    embeddings = embed_texts(texts, model, tokenizer, max_length, device, batch_size,
+                             lengths=lengths, show_progress=True)
+    elapsed = time.time() - start_time
+    print(f"✅ Embeddings created: shape {embeddings.shape} in {elapsed:.1f}s "
+          f"({len(texts) / max(elapsed, 1e-9):.1f} texts/s)")
 
-    device = get_device()
-    print(f"🔄 Creating embeddings with attention pooling (device: {device})")
-    
-    # Phân tích độ dài text
-    token_lengths = df['text_corpus'].apply(lambda x: len(tokenizer.tokenize(x)))
-    long_texts = token_lengths > max_length
-    
-    print(f"📊 Text length analysis:")
-    print(f"   • Total texts: {len(df)}")
-    print(f"   • Long texts (>{max_length} tokens): {long_texts.sum()} ({long_texts.mean()*100:.1f}%)")
-    print(f"   • Max token length: {token_lengths.max()}")
-    print(f"   • Average token length: {token_lengths.mean():.1f}")
-    
-    embeddings_list = []
-    
-    # Xử lý từng text
-    for idx, (_, row) in enumerate(df.iterrows()):
-        text = row['text_corpus']
-        text_length = token_lengths.iloc[idx]
-        
-        if text_length <= max_length:
-            # Text ngắn - embed bình thường với các tham số giống embedding gốc
-            embedding = model.encode(
-                text,
-                batch_size=batch_size,
-                show_progress_bar=False,
-                normalize_embeddings=True,
-                max_length=max_length,
-                device=device,
-                convert_to_tensor=True
-            )
-        else:
-            # Text dài - sử dụng attention pooling
-            embedding = embed_text_with_attention(
-                text, model, tokenizer, max_length, device, batch_size
-            )
-        
-        embeddings_list.append(embedding.detach().cpu().numpy())
-        
-        # Progress bar
-        if (idx + 1) % 50 == 0:
-            print(f"   Processed {idx + 1}/{len(df)} texts...")
-    
-    # Convert to numpy array
-    embeddings = np.array(embeddings_list)
-    print(f"✅ Embeddings created: shape {embeddings.shape}")
-    
     return embeddings
 
+def build_catalog_index(embeddings, ids, storage_dtype, report_storage=True):
+    """
+    Build FAISS index (+ projection, binary index, báo cáo recall) từ embeddings đã lưu ở DATA_PATHS['embeddings']
+    và bỏ tombstones / catalog log / snapshots cũ - dùng chung cho embedding.py và parallel_build.py
+    (embeddings có thể là memmap: mọi bước đọc theo block)
+    """
+    # Index mới chỉ chứa sản phẩm còn tồn tại - bỏ tombstone cũ, catalog log và các generation trong data/snapshots/
+    remove_tombstones()
+    reset_catalog_log()
+    reset_snapshots()
+    
+    # Create FAISS index (loại index theo FAISS_CONFIG) with ID mapping for individual vector updates
+    dimension = embeddings.shape[1]
+
+    # Projection giảm chiều (lưu cạnh faiss index, dùng chung cho add/update/search)
+    if PROJECTION['enabled']:
+        projection = Projection.fit(embeddings)
+        print(f"✅ Projection saved: {projection.save()} ({projection.method}, {projection.output_dim} dims)")
+    else:
+        remove_projection()
+
+    # Add embeddings with their IDs
+    index = build_index(embeddings, ids)
+
+    # Save index
+    faiss.write_index(index, DATA_PATHS['faiss_index'])
+
+    # Recall-vs-latency report so với exact search
+    report = evaluate_index(index, embeddings, ids)
+    report['storage_dtype'] = storage_dtype
+    if report_storage:
+        report['storage'] = evaluate_storage(embeddings, ids)
+    print_index_report(report)
+    print(f"✅ Index report saved: {save_index_report(report)}")
+
+    # Binary codes cho first stage Hamming
+    if BINARY_SEARCH['enabled']:
+        binary_index = BinaryIndex().build(embeddings, ids)
+        binary_index.save()
+        print(f"✅ Binary index created: {binary_index.ntotal} codes ({dimension // 8} bytes/vector)")
+
+    print(f"✅ FAISS {type(index).__name__} created: {index.ntotal} vectors, {index.d} dimensions (embeddings: {dimension})")
+    print(f"✅ Supports individual vector updates by ID")
+    print(f"✅ Files saved: {DATA_PATHS['embeddings']}, {DATA_PATHS['faiss_index']}")
+    return index
+
+
 if __name__ == "__main__":
     # Tạo embeddings mới với attention pooling
     print("🚀 Starting advanced embedding creation...")
@@ -196,25 +347,11 @@ if __name__ == "__main__":
         model, tokenizer
     )
 
-    # Save embeddings
-    np.save(DATA_PATHS['embeddings'], embeddings_attention)
-    
-    # Create FAISS index with ID mapping for individual vector updates
-    dimension = embeddings_attention.shape[1]
-
-    # Create base index
-    base_index = faiss.IndexFlatIP(dimension)  # Inner Product for cosine similarity
-
-    # Wrap with IndexIDMap to allow individual vector updates by ID
-    index = faiss.IndexIDMap(base_index)
-
-    # Add embeddings with their IDs
+    # Product id của từng dòng (ID trong metadata = vị trí dòng khi build từ đầu)
     ids = np.arange(len(embeddings_attention))  # Create ID array [0, 1, 2, ...]
-    index.add_with_ids(embeddings_attention, ids)
 
-    # Save index
-    faiss.write_index(index, DATA_PATHS['faiss_index'])
+    # Save embeddings (float32 / float16 / sq8 theo EMBEDDING_STORAGE)
+    storage_dtype = save_embeddings(DATA_PATHS['embeddings'], embeddings_attention, ids=ids)
 
-    print(f"✅ FAISS IndexIDMap created: {index.ntotal} vectors, {dimension} dimensions")
-    print(f"✅ Supports individual vector updates by ID")
-    print(f"✅ Files saved: {DATA_PATHS['embeddings']}, {DATA_PATHS['faiss_index']}")
\ No newline at end of file
+    # FAISS index, projection, binary index + báo cáo; reset tombstones / log / snapshots
+    build_catalog_index(embeddings_attention, ids, storage_dtype)
@@ -0,0 +1,240 @@
+"""
+Cache embedding theo nội dung (content-addressed) dùng chung cho build, add / update / bulk / import và rebuild
+- Key: blake2b 16 bytes của (namespace, text_corpus); namespace gồm tên model, MAX_LENGTH, overlap chunk
+  và fingerprint trọng số attention pooling head → đổi model / cấu hình pooling thì key cũ không còn khớp
+- Lưu trong data/embedding_cache/: vectors.bin (các dòng vector liền nhau, đọc bằng memory-map),
+  keys.bin (key của từng dòng, cùng thứ tự), meta.json (dimension, dtype)
+- Chỉ append: ghi vector trước rồi tới key; lần mở sau cắt phần ghi dở (số dòng = min của hai file)
+- Append giữ flock trên data/embedding_cache/lock: dòng của key mới tính theo kích thước file dưới lock
+  (không theo count trong process), key process khác đã append được đọc thêm trước khi ghi
+- Tra cứu: key đã có lúc mở được sắp xếp (searchsorted), key mới append trong process nằm trong dict
+  và được gộp vào mảng đã sắp khi vượt EMBEDDING_CACHE['merge_threshold']
+- Nhiều process có thể ghi (app đang chạy + src/embedding.py); các thread trong process dùng chung qua get_embedding_cache().
+  Worker của parallel_build mở cache chỉ đọc (không cắt file, put() bỏ qua) - process cha ghi vector của shard
+"""
+
+import os
+import sys
+import json
+import shutil
+import hashlib
+import threading
+import contextlib
+import numpy as np
+from typing import Iterable, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: không khóa giữa các process
+    fcntl = None
+
+# Add config path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'config'))
+from simple_config import DATA_PATHS, EMBEDDING_CACHE
+
+KEY_BYTES = 16
+KEY_DTYPE = f'S{KEY_BYTES}'
+CACHE_DTYPES = ('float32', 'float16')
+
+# Cache đã mở theo thư mục (mọi đường embed trong process dùng chung một object)
+_open_caches = {}
+_open_lock = threading.Lock()
+
+
+def cache_keys(texts: Iterable[str], namespace: bytes) -> np.ndarray:
+    """Key của từng text trong namespace (mảng S16)"""
+    return np.array([hashlib.blake2b(namespace + b'\0' + str(text).encode('utf-8'), digest_size=KEY_BYTES).digest()
+                     for text in texts], dtype=KEY_DTYPE)
+
+
+class EmbeddingCache:
+    """Kho vector theo key nội dung, append-only trên đĩa"""
+
+    def __init__(self, directory: Optional[str] = None, dtype: Optional[str] = None, readonly: bool = False):
+        self.directory = directory or DATA_PATHS['embedding_cache']
+        self.readonly = readonly
+        self.dtype = dtype or EMBEDDING_CACHE['dtype']
+        if self.dtype not in CACHE_DTYPES:
+            raise ValueError(f"EMBEDDING_CACHE['dtype'] phải là một trong {list(CACHE_DTYPES)}")
+        self.keys_path = os.path.join(self.directory, 'keys.bin')
+        self.vectors_path = os.path.join(self.directory, 'vectors.bin')
+        self.meta_path = os.path.join(self.directory, 'meta.json')
+        self.lock_path = os.path.join(self.directory, 'lock')
+        self.dimension = None
+        self.count = 0
+        self._sorted_keys = np.zeros(0, dtype=KEY_DTYPE)
+        self._sorted_rows = np.zeros(0, dtype=np.int64)
+        self._recent = {}               # key → dòng, cho key append sau lần mở / gộp gần nhất
+        self._vectors = None            # memmap vectors.bin (mở lại khi count đổi)
+        self._lock = threading.RLock()
+        self._open()
+
+    def _open(self):
+        """Đọc meta + keys, cắt dòng ghi dở, build mảng key đã sắp"""
+        if not os.path.exists(self.meta_path):
+            return
+        with open(self.meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('dtype') != self.dtype:
+            print(f"⚠️ Embedding cache dtype {meta.get('dtype')} ≠ {self.dtype} - tạo cache mới")
+            if not self.readonly:
+                self.clear()
+            return
+        self.dimension = int(meta['dimension'])
+        if self.readonly:
+            # Cache chỉ đọc không cắt file / không lấy lock: process ghi có thể đang append
+            self.count = self._disk_rows()
+        else:
+            with self._file_lock():
+                self.count = self._trim_to_disk_rows()
+
+        keys = np.fromfile(self.keys_path, dtype=KEY_DTYPE, count=self.count) if self.count else self._sorted_keys
+        order = np.argsort(keys, kind='stable')
+        self._sorted_keys = keys[order]
+        self._sorted_rows = order.astype(np.int64)
+        print(f"✅ Embedding cache: {self.count} vectors ({self.dimension} dims, {self.dtype})")
+
+    def _disk_rows(self) -> int:
+        """Số dòng đã ghi đủ cả vector lẫn key trên đĩa"""
+        row_bytes = self.dimension * np.dtype(self.dtype).itemsize
+        key_rows = os.path.getsize(self.keys_path) // KEY_BYTES if os.path.exists(self.keys_path) else 0
+        vector_rows = os.path.getsize(self.vectors_path) // row_bytes if os.path.exists(self.vectors_path) else 0
+        return min(key_rows, vector_rows)
+
+    def _trim_to_disk_rows(self) -> int:
+        """Cắt phần ghi dở của process bị dừng giữa chừng (gọi khi giữ file lock), trả về số dòng"""
+        rows = self._disk_rows()
+        row_bytes = self.dimension * np.dtype(self.dtype).itemsize
+        for path, size in ((self.keys_path, rows * KEY_BYTES), (self.vectors_path, rows * row_bytes)):
+            if os.path.exists(path) and os.path.getsize(path) != size:
+                with open(path, 'r+b') as f:
+                    f.truncate(size)
+        return rows
+
+    @contextlib.contextmanager
+    def _file_lock(self):
+        """Khóa độc quyền giữa các process ghi cùng thư mục cache"""
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.lock_path, 'a+b') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _catch_up(self, rows: int):
+        """Nhận các key process khác đã append (dòng self.count..rows) vào bảng tra cứu"""
+        if rows <= self.count:
+            return
+        keys = np.fromfile(self.keys_path, dtype=KEY_DTYPE, count=rows - self.count,
+                           offset=self.count * KEY_BYTES)
+        for offset, key in enumerate(keys):
+            self._recent.setdefault(key, self.count + offset)
+        self.count = rows
+
+    def clear(self):
+        """Xóa toàn bộ cache (thư mục cache)"""
+        with self._lock:
+            if os.path.exists(self.directory):
+                shutil.rmtree(self.directory)
+            self.dimension = None
+            self.count = 0
+            self._sorted_keys = np.zeros(0, dtype=KEY_DTYPE)
+            self._sorted_rows = np.zeros(0, dtype=np.int64)
+            self._recent = {}
+            self._vectors = None
+
+    def __len__(self) -> int:
+        return self.count
+
+    def lookup(self, keys: np.ndarray) -> np.ndarray:
+        """Dòng của từng key trong vectors.bin (-1 nếu chưa có)"""
+        keys = np.asarray(keys, dtype=KEY_DTYPE)
+        with self._lock:
+            rows = np.full(len(keys), -1, dtype=np.int64)
+            if len(self._sorted_keys) > 0:
+                positions = np.searchsorted(self._sorted_keys, keys).clip(max=len(self._sorted_keys) - 1)
+                hit = self._sorted_keys[positions] == keys
+                rows[hit] = self._sorted_rows[positions[hit]]
+            if self._recent:
+                for i in np.flatnonzero(rows < 0):
+                    rows[i] = self._recent.get(keys[i], -1)
+            return rows
+
+    def get(self, keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """(mask key có trong cache, vectors float32 [mask.sum(), dimension] theo thứ tự key có trong cache)"""
+        rows = self.lookup(keys)
+        found = rows >= 0
+        if not found.any():
+            return found, np.zeros((0, self.dimension or 0), dtype=np.float32)
+        with self._lock:
+            if self._vectors is None or len(self._vectors) != self.count:
+                self._vectors = np.memmap(self.vectors_path, dtype=self.dtype, mode='r',
+                                          shape=(self.count, self.dimension))
+            return found, np.asarray(self._vectors[rows[found]], dtype=np.float32)
+
+    def put(self, keys: np.ndarray, vectors: np.ndarray) -> int:
+        """Thêm vector cho các key chưa có (trả về số vector được ghi; cache chỉ đọc → 0)"""
+        keys = np.asarray(keys, dtype=KEY_DTYPE)
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(keys), -1)
+        if len(keys) == 0 or self.readonly:
+            return 0
+        with self._lock:
+            if self.dimension is not None and vectors.shape[1] != self.dimension:
+                print(f"⚠️ Embedding cache có dimension {self.dimension} ≠ {vectors.shape[1]} - tạo cache mới")
+                self.clear()
+            _, first = np.unique(keys, return_index=True)
+            new = np.sort(first)
+            new = new[self.lookup(keys[new]) < 0]
+            if len(new) == 0:
+                return 0
+
+            with self._file_lock():
+                if self.dimension is None:
+                    self.dimension = vectors.shape[1]
+                    if not os.path.exists(self.meta_path):
+                        tmp_path = f"{self.meta_path}.{os.getpid()}.tmp"
+                        with open(tmp_path, 'w', encoding='utf-8') as f:
+                            json.dump({'dimension': self.dimension, 'dtype': self.dtype}, f)
+                        os.replace(tmp_path, self.meta_path)
+
+                # Process khác có thể đã append từ lần ghi trước: dòng mới bắt đầu từ cuối file, không từ self.count
+                self._catch_up(self._trim_to_disk_rows())
+                new = new[self.lookup(keys[new]) < 0]
+                if len(new) == 0:
+                    return 0
+
+                # Vector trước, key sau: key chỉ tồn tại khi vector của nó đã được ghi đủ
+                with open(self.vectors_path, 'ab') as f:
+                    f.write(np.ascontiguousarray(vectors[new], dtype=self.dtype).tobytes())
+                with open(self.keys_path, 'ab') as f:
+                    f.write(keys[new].tobytes())
+            for offset, key in enumerate(keys[new]):
+                self._recent[key] = self.count + offset
+            self.count += len(new)
+            if len(self._recent) >= EMBEDDING_CACHE['merge_threshold']:
+                self._merge_recent()
+            return len(new)
+
+    def _merge_recent(self):
+        """Gộp key mới vào mảng đã sắp (tra cứu lại hoàn toàn bằng searchsorted)"""
+        keys = np.array(list(self._recent.keys()), dtype=KEY_DTYPE)
+        rows = np.array(list(self._recent.values()), dtype=np.int64)
+        all_keys = np.concatenate([self._sorted_keys, keys])
+        order = np.argsort(all_keys, kind='stable')
+        self._sorted_keys = all_keys[order]
+        self._sorted_rows = np.concatenate([self._sorted_rows, rows])[order]
+        self._recent = {}
+
+
+def get_embedding_cache(directory: Optional[str] = None, readonly: bool = False) -> EmbeddingCache:
+    """Cache dùng chung trong process (mở một lần cho mỗi thư mục, readonly theo lần mở đầu tiên)"""
+    directory = directory or DATA_PATHS['embedding_cache']
+    with _open_lock:
+        cache = _open_caches.get(directory)
+        if cache is None:
+            cache = EmbeddingCache(directory, readonly=readonly)
+            _open_caches[directory] = cache
+        return cache
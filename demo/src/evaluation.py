@@ -4,12 +4,16 @@ import pandas as pd
 import numpy as np
 import ast
 import json
+import time
 from typing import List, Dict
-from search import bi_encoder_search, hybrid_search
+from search import bi_encoder_search, hybrid_search, search_batch, get_global_searcher
+from index_factory import build_index
+from id_index import IdPositionIndex
+from binary_index import load_or_build_binary_index
 
 # Add config path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'config'))
-from simple_config import DATA_PATHS, TARGETS
+from simple_config import DATA_PATHS, TARGETS, BINARY_SEARCH
 
 def parse_doc_ids(doc_ids_str):
     """Parse document IDs string to list of integers"""
@@ -90,6 +94,99 @@ def run_evaluation(gt_df: pd.DataFrame, search_func, k: int = 10) -> Dict:
     }
 
 
+def run_evaluation_batch(gt_df: pd.DataFrame, method: str = 'hybrid', k: int = 10) -> Dict:
+    """Run complete evaluation với toàn bộ query gửi qua search_batch (một lần encode / search / re-rank)"""
+    queries = gt_df['query'].tolist()
+    batch_results = search_batch(queries, method=method, top_k=k)
+    
+    results = []
+    for query, relevant_ids, query_results in zip(queries, gt_df['relevant_doc_ids'], batch_results):
+        retrieved_ids = [int(res['id']) for res in query_results]
+        results.append({
+            'query': query,
+            'retrieved_ids': retrieved_ids,
+            'relevant_ids': relevant_ids,
+            'hit_at_3': calculate_hit_at_k(retrieved_ids, relevant_ids, k=3),
+            'mrr': calculate_mrr(retrieved_ids, relevant_ids),
+            'precision_at_3': calculate_precision_at_k(retrieved_ids, relevant_ids, k=3),
+            'response_time_ms': query_results[0]['time'] if query_results else 0,
+            'num_relevant': len(relevant_ids),
+            'num_retrieved': len(retrieved_ids)
+        })
+    
+    total_queries = len(results)
+    return {
+        'total_queries': total_queries,
+        'hit_at_3': sum(r['hit_at_3'] for r in results) / total_queries * 100,
+        'mrr': sum(r['mrr'] for r in results) / total_queries * 100,
+        'precision_at_3': sum(r['precision_at_3'] for r in results) / total_queries * 100,
+        'avg_response_time': sum(r['response_time_ms'] for r in results) / total_queries,
+        'detailed_results': results
+    }
+
+
+def run_binary_search_evaluation(gt_df: pd.DataFrame, k: int = 10) -> Dict:
+    """
+    So sánh binary first stage + rescoring với flat index (exact) trên gt.csv
+    - recall@k của binary so với top-k của flat
+    - QPS của phần vector search (không tính encode query), Hit@3 / MRR theo ground truth
+    """
+    searcher = get_global_searcher()
+    queries = gt_df['query'].tolist()
+    query_embeddings = searcher._encode_queries(queries)
+    
+    # Dùng embeddings (memory-mapped) của snapshot searcher đang phục vụ thay vì load thêm một bản
+    snapshot = searcher.store.snapshot()
+    embeddings = snapshot.embeddings
+    product_ids = snapshot.embedding_ids
+    flat_index = build_index(embeddings, product_ids, {'index_type': 'flat'}, project=False)
+    binary_index = snapshot.binary_index or load_or_build_binary_index(embeddings, product_ids)
+    
+    start_time = time.time()
+    _, flat_ids = flat_index.search(query_embeddings, k)
+    flat_seconds = time.time() - start_time
+    
+    start_time = time.time()
+    _, binary_ids = binary_index.search(query_embeddings, k, embeddings, IdPositionIndex(product_ids).lookup)
+    binary_seconds = time.time() - start_time
+    
+    def quality(retrieved):
+        rows = [[int(doc_id) for doc_id in row if doc_id >= 0] for row in retrieved]
+        return {
+            'hit_at_3': float(np.mean([calculate_hit_at_k(r, rel, k=3) for r, rel in zip(rows, gt_df['relevant_doc_ids'])]) * 100),
+            'mrr': float(np.mean([calculate_mrr(r, rel) for r, rel in zip(rows, gt_df['relevant_doc_ids'])]) * 100)
+        }
+    
+    recall = np.mean([
+        len(set(binary_row[binary_row >= 0]) & set(flat_row[flat_row >= 0])) / max(1, int((flat_row >= 0).sum()))
+        for binary_row, flat_row in zip(binary_ids, flat_ids)
+    ])
+    
+    report = {
+        'total_queries': len(queries),
+        'num_products': int(len(product_ids)),
+        'k': k,
+        'candidates': binary_index.candidate_count(k),
+        f'recall_at_{k}_vs_flat': float(recall) * 100,
+        'flat': {'qps': len(queries) / flat_seconds if flat_seconds > 0 else None, **quality(flat_ids)},
+        'binary': {'qps': len(queries) / binary_seconds if binary_seconds > 0 else None, **quality(binary_ids)},
+        'bytes_per_vector': {'float32': int(embeddings.shape[1] * 4), 'binary': int(embeddings.shape[1] // 8)}
+    }
+    
+    print(f"\n📊 BINARY FIRST STAGE vs FLAT ({len(queries)} queries, {report['candidates']} candidates)")
+    print("="*50)
+    print(f"Recall@{k} vs flat: {report[f'recall_at_{k}_vs_flat']:.1f}%")
+    print(f"QPS:             flat {report['flat']['qps']:.1f} | binary {report['binary']['qps']:.1f}")
+    print(f"Hit@3:           flat {report['flat']['hit_at_3']:.1f}% | binary {report['binary']['hit_at_3']:.1f}%")
+    print(f"MRR:             flat {report['flat']['mrr']:.1f}% | binary {report['binary']['mrr']:.1f}%")
+    
+    with open(BINARY_SEARCH['report_file'], 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"✅ Results saved to '{os.path.basename(BINARY_SEARCH['report_file'])}'")
+    
+    return report
+
+
 def display_results(results, method_name):
     """Display evaluation results"""
     print(f"\n📊 {method_name.upper()} RESULTS")
@@ -198,4 +295,9 @@ def run_complete_evaluation():
     }
 
 if __name__ == "__main__":
-    run_complete_evaluation()
\ No newline at end of file
+    if len(sys.argv) > 1 and sys.argv[1] == '--binary':
+        gt_df = pd.read_csv(DATA_PATHS['ground_truth'])
+        gt_df['relevant_doc_ids'] = gt_df['relevant_doc_ids'].apply(parse_doc_ids)
+        run_binary_search_evaluation(gt_df)
+    else:
+        run_complete_evaluation()
\ No newline at end of file
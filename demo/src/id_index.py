@@ -0,0 +1,162 @@
+"""
+Bảng tra cứu product id → vị trí dòng
+- Thay cho việc quét `metadata_df[metadata_df['id'] == idx]` trên toàn bộ DataFrame
+- Tra cứu O(1) cho từng id và vectorized cho cả mảng id trả về từ FAISS
+- appended(): bảng mới cho các dòng append vào cuối, dùng chung mảng với bảng cũ (amortized O(số id thêm))
+- without(): bảng mới bỏ một số id (dòng bị xóa), bảng cũ không bị đổi
+"""
+
+import numpy as np
+from typing import Iterable, Optional
+
+
+class IdPositionIndex:
+    """Ánh xạ product id (số nguyên không âm) → vị trí dòng trong metadata/embeddings"""
+
+    def __init__(self, ids: Optional[Iterable[int]] = None, positions: Optional[Iterable[int]] = None):
+        """Khởi tạo bảng tra cứu, build ngay nếu truyền vào danh sách id"""
+        self._table = np.full(0, -1, dtype=np.int64)
+        self._count = 0
+        self._limit = 0        # Vị trí ≥ limit thuộc về bảng mới hơn dùng chung mảng → coi như không tồn tại
+        self._shared = None    # [limit của bảng mới nhất] dùng chung giữa các bảng cùng mảng (None: mảng riêng)
+        if ids is not None:
+            self.rebuild(ids, positions)
+
+    def rebuild(self, ids: Iterable[int], positions: Optional[Iterable[int]] = None):
+        """
+        Build lại toàn bộ bảng từ danh sách id theo thứ tự dòng
+        positions: chỉ các dòng này được đưa vào bảng (vd bỏ dòng đã xóa chưa compaction)
+        """
+        ids = np.asarray(ids if hasattr(ids, '__len__') else list(ids), dtype=np.int64)
+        limit = len(ids)
+        if positions is None:
+            positions = np.arange(len(ids), dtype=np.int64)
+        else:
+            positions = np.asarray(positions, dtype=np.int64)
+            ids = ids[positions]
+        size = int(ids.max()) + 1 if len(ids) > 0 else 0
+        self._table = np.full(size, -1, dtype=np.int64)
+        self._table[ids] = positions
+        self._count = len(ids)
+        self._limit = limit
+        self._shared = None
+
+    def _own(self):
+        """Copy mảng trước khi sửa nếu đang dùng chung với bảng khác (copy-on-write)"""
+        if self._shared is not None:
+            self._table = np.where(self._table < self._limit, self._table, -1)
+            self._shared = None
+
+    def _ensure_capacity(self, product_id: int):
+        """Mở rộng bảng theo kiểu nhân đôi để set() có chi phí amortized O(1)"""
+        if product_id < len(self._table):
+            return
+        new_size = max(product_id + 1, 2 * len(self._table), 16)
+        table = np.full(new_size, -1, dtype=np.int64)
+        table[:len(self._table)] = self._table
+        self._table = table
+
+    def set(self, product_id: int, position: int):
+        """Gán vị trí cho một product id"""
+        product_id = int(product_id)
+        if product_id < 0:
+            raise ValueError(f"Product id phải không âm: {product_id}")
+        self._own()
+        self._ensure_capacity(product_id)
+        if self._table[product_id] < 0:
+            self._count += 1
+        self._table[product_id] = position
+        self._limit = max(self._limit, int(position) + 1)
+
+    def remove(self, product_id: int):
+        """Xóa một product id khỏi bảng"""
+        product_id = int(product_id)
+        self._own()
+        if 0 <= product_id < len(self._table) and self._table[product_id] >= 0:
+            self._table[product_id] = -1
+            self._count -= 1
+
+    def remove_many(self, ids):
+        """Xóa nhiều product id (vectorized)"""
+        ids = np.asarray(ids, dtype=np.int64)
+        self._own()
+        ids = ids[(ids >= 0) & (ids < len(self._table))]
+        ids = np.unique(ids[self._table[ids] >= 0])
+        self._table[ids] = -1
+        self._count -= len(ids)
+
+    def without(self, ids) -> 'IdPositionIndex':
+        """Bảng mới không còn các id này - bảng này không bị đổi (copy mảng một lần, không build lại)"""
+        ids = np.asarray(ids, dtype=np.int64)
+        ids = np.unique(ids[self.lookup(ids) >= 0])
+        if len(ids) == 0:
+            return self
+        table = IdPositionIndex()
+        table._table = np.where(self._table < self._limit, self._table, -1) if self._shared is not None \
+            else self._table.copy()
+        table._table[ids] = -1
+        table._count = self._count - len(ids)
+        table._limit = self._limit
+        return table
+
+    def get(self, product_id: int, default: Optional[int] = None) -> Optional[int]:
+        """Lấy vị trí của một product id (default nếu không tồn tại)"""
+        product_id = int(product_id)
+        if 0 <= product_id < len(self._table):
+            position = self._table[product_id]
+            if 0 <= position < self._limit:
+                return int(position)
+        return default
+
+    def lookup(self, ids) -> np.ndarray:
+        """Tra cứu vectorized cho mảng id, trả về -1 với id không tồn tại (kể cả id -1 của FAISS)"""
+        ids = np.asarray(ids, dtype=np.int64)
+        positions = np.full(ids.shape, -1, dtype=np.int64)
+        in_range = (ids >= 0) & (ids < len(self._table))
+        positions[in_range] = self._table[ids[in_range]]
+        positions[positions >= self._limit] = -1
+        return positions
+
+    def appended(self, ids, start: int) -> 'IdPositionIndex':
+        """
+        Bảng mới = bảng này + ids (id mới) ở vị trí start, start + 1, ... - bảng này không bị đổi
+        Nếu bảng này là bảng mới nhất trên mảng của nó thì bảng mới ghi thẳng vào mảng đó:
+        ô của id mới đang là -1 và bảng cũ bỏ qua vị trí ≥ limit của nó → amortized O(len(ids)).
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        if len(ids) == 0:
+            return self
+        if ids.min() < 0:
+            raise ValueError(f"Product id phải không âm: {int(ids.min())}")
+        if (self.lookup(ids) >= 0).any():
+            raise ValueError("appended() chỉ nhận id chưa có trong bảng")
+
+        if self._shared is None:
+            self._shared = [self._limit]
+        table = IdPositionIndex()
+        if self._shared[0] == self._limit and start >= self._limit:
+            table._table, table._shared = self._table, self._shared
+        else:
+            # Đã có bảng mới hơn append vào mảng này: copy (bỏ các vị trí của bảng đó)
+            table._table, table._shared = np.where(self._table < self._limit, self._table, -1), [0]
+
+        size = int(ids.max()) + 1
+        if size > len(table._table):
+            grown = np.full(max(size, 2 * len(table._table), 16), -1, dtype=np.int64)
+            grown[:len(table._table)] = table._table
+            table._table, table._shared = grown, [0]
+
+        table._table[ids] = start + np.arange(len(ids), dtype=np.int64)
+        table._count = self._count + len(ids)
+        table._limit = start + len(ids)
+        table._shared[0] = table._limit
+        return table
+
+    def __contains__(self, product_id) -> bool:
+        try:
+            return self.get(product_id) is not None
+        except (TypeError, ValueError):
+            return False
+
+    def __len__(self) -> int:
+        return self._count
@@ -0,0 +1,287 @@
+"""
+Import catalog từ file CSV / JSONL lớn (/api/import) chạy nền theo job
+- File upload được copy xuống data/imports/ theo từng block (không đọc cả file vào RAM)
+- Worker đọc file từng dòng, gom IMPORT['chunk_rows'] dòng → embed một lượt + commit một CatalogChange
+  (ProductBulkWriter), rồi mới đọc tiếp: RAM tối đa một chunk bất kể kích thước file
+- Mỗi lúc chỉ một job chạy; hàng chờ giới hạn IMPORT['max_pending_jobs'] (đầy thì từ chối job mới)
+- Dòng lỗi (parse, thiếu trường bắt buộc, ID không tồn tại) được ghi vào status của job và bỏ qua
+
+Mỗi dòng: các trường name, brand, ingredients, categories, manufacturer, manufacturerNumber;
+có 'id' → sửa sản phẩm đó, không có → thêm mới; 'op': 'delete' + 'id' → xóa.
+"""
+
+import os
+import sys
+import csv
+import json
+import uuid
+import queue
+import shutil
+import threading
+import traceback
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+# Add config path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'config'))
+from simple_config import DATA_PATHS, IMPORT
+from bulk_row import PRODUCT_FIELDS
+
+FORMATS = ('csv', 'jsonl')
+
+
+def detect_format(filename: str = '', content_type: str = '') -> Optional[str]:
+    """csv / jsonl theo đuôi file hoặc content type (None nếu không nhận ra)"""
+    extension = os.path.splitext(filename or '')[1].lower()
+    if extension == '.csv' or 'csv' in (content_type or ''):
+        return 'csv'
+    if extension in ('.jsonl', '.ndjson') or any(name in (content_type or '') for name in ('ndjson', 'jsonl')):
+        return 'jsonl'
+    return None
+
+
+def _clean(value) -> str:
+    """Giá trị trường sản phẩm → chuỗi đã strip ('' nếu trống / null)"""
+    if value is None or (isinstance(value, float) and value != value):
+        return ''
+    return str(value).strip()
+
+
+def record_to_operation(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Một dòng của feed → thao tác cho ProductBulkWriter (raise ValueError nếu id / op không hợp lệ)"""
+    op = _clean(record.get('op')).lower()
+    product_id = _clean(record.get('id'))
+    if product_id:
+        try:
+            product_id = int(float(product_id)) if '.' in product_id else int(product_id)
+        except ValueError:
+            raise ValueError(f"id không phải số nguyên: {product_id!r}")
+    if op == 'delete':
+        if product_id == '':
+            raise ValueError("op delete cần id")
+        return {'op': 'delete', 'id': product_id}
+    if op not in ('', 'add', 'update', 'upsert'):
+        raise ValueError(f"op không hợp lệ: {op!r}")
+
+    product = {field: _clean(record[field]) for field in PRODUCT_FIELDS if field in record}
+    if product_id == '':
+        return {'op': 'add', 'product': product}
+    return {'op': 'update', 'id': product_id, 'product': product}
+
+
+class ImportJob:
+    """Trạng thái một lần import (đọc bởi /api/import/<job_id> trong lúc worker đang chạy)"""
+
+    def __init__(self, path: str, file_format: str, filename: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.path = path
+        self.format = file_format
+        self.filename = filename
+        self.status = 'queued'          # queued → running → completed / failed
+        self.total_bytes = 0
+        self.bytes_read = 0
+        self.rows_read = 0
+        self.counts = {'add': 0, 'update': 0, 'delete': 0}
+        self.rows_failed = 0
+        self.chunks_committed = 0
+        self.errors = []                # [{'line': n, 'error': ...}] tối đa IMPORT['max_errors']
+        self.message = None
+        self.created_at = datetime.now().isoformat()
+        self.started_at = None
+        self.finished_at = None
+
+    def add_error(self, line: Optional[int], error: str):
+        """Ghi lỗi của một dòng (dòng đó bị bỏ qua)"""
+        self.rows_failed += 1
+        if len(self.errors) < IMPORT['max_errors']:
+            self.errors.append({'line': line, 'error': str(error)})
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ('completed', 'failed')
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Status cho API"""
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'filename': self.filename,
+            'format': self.format,
+            'progress': round(self.bytes_read / self.total_bytes, 4) if self.total_bytes else (1.0 if self.finished else 0.0),
+            'bytes_read': self.bytes_read,
+            'total_bytes': self.total_bytes,
+            'rows_read': self.rows_read,
+            'rows_imported': sum(self.counts.values()),
+            'counts': dict(self.counts),
+            'rows_failed': self.rows_failed,
+            'chunks_committed': self.chunks_committed,
+            'errors': list(self.errors),
+            'errors_truncated': self.rows_failed > len(self.errors),
+            'message': self.message,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at
+        }
+
+
+class ImportJobRunner:
+    """Hàng đợi job import + một worker thread nền"""
+
+    def __init__(self, writer, write_context: Callable, on_commit: Optional[Callable] = None):
+        """
+        - writer: ProductBulkWriter dùng chung (embed + commit từng chunk)
+        - write_context: context manager giữ lock ghi catalog trong lúc validate + commit một chunk
+        - on_commit: gọi sau mỗi chunk commit thành công (bump generation, xóa result cache...)
+        """
+        self.writer = writer
+        self.write_context = write_context
+        self.on_commit = on_commit
+        self.jobs = OrderedDict()       # job_id → ImportJob
+        self._queue = queue.Queue(maxsize=IMPORT['max_pending_jobs'])
+        self._lock = threading.Lock()
+        self._worker = None
+
+    def submit(self, stream, file_format: str, filename: str = '') -> Optional[ImportJob]:
+        """
+        Lưu stream upload xuống đĩa (copy từng block) và đưa job vào hàng đợi
+        Trả về None nếu hàng đợi đã đầy (bên gọi trả 429 / thử lại sau).
+        """
+        if self._queue.full():
+            return None
+        os.makedirs(DATA_PATHS['imports'], exist_ok=True)
+        job = ImportJob('', file_format, filename)
+        job.path = os.path.join(DATA_PATHS['imports'], f"{job.id}.{file_format}")
+        with open(job.path, 'wb') as f:
+            shutil.copyfileobj(stream, f, 1 << 20)
+        job.total_bytes = os.path.getsize(job.path)
+
+        with self._lock:
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                os.remove(job.path)
+                return None
+            self.jobs[job.id] = job
+            self._prune_jobs()
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run_worker, daemon=True)
+                self._worker.start()
+        print(f"📥 Import job {job.id}: {filename or 'upload'} ({job.total_bytes} bytes, {file_format}) đã vào hàng đợi")
+        return job
+
+    def get(self, job_id: str) -> Optional[ImportJob]:
+        return self.jobs.get(job_id)
+
+    def list_jobs(self) -> List[ImportJob]:
+        with self._lock:
+            return list(self.jobs.values())
+
+    def _prune_jobs(self):
+        """Giữ IMPORT['keep_jobs'] job đã xong gần nhất (job đang chờ / đang chạy không bị bỏ)"""
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished]
+        for job_id in finished[:max(len(finished) - IMPORT['keep_jobs'], 0)]:
+            del self.jobs[job_id]
+
+    def _run_worker(self):
+        """Chạy lần lượt các job trong hàng đợi"""
+        while True:
+            self.run(self._queue.get())
+
+    def run(self, job: ImportJob):
+        """Đọc file của job từng dòng, commit theo chunk"""
+        job.status = 'running'
+        job.started_at = datetime.now().isoformat()
+        print(f"🔄 Import job {job.id}: bắt đầu")
+        try:
+            chunk = []
+            with open(job.path, 'rb') as f:
+                records = read_csv(f, job) if job.format == 'csv' else read_jsonl(f, job)
+                for line, record in records:
+                    job.rows_read += 1
+                    if isinstance(record, Exception):
+                        job.add_error(line, record)
+                        continue
+                    try:
+                        chunk.append((line, record_to_operation(record)))
+                    except ValueError as e:
+                        job.add_error(line, e)
+                        continue
+                    if len(chunk) >= IMPORT['chunk_rows']:
+                        self._commit_chunk(job, chunk)
+                        chunk = []
+            if chunk:
+                self._commit_chunk(job, chunk)
+            job.status = 'completed'
+        except Exception as e:
+            # Chunk đã commit vẫn giữ nguyên; phần còn lại của file không được import
+            job.status = 'failed'
+            job.message = f"{type(e).__name__}: {e}"
+            traceback.print_exc()
+        finally:
+            job.finished_at = datetime.now().isoformat()
+            if os.path.exists(job.path):
+                os.remove(job.path)
+        print(f"{'✅' if job.status == 'completed' else '❌'} Import job {job.id} {job.status}: "
+              f"{job.rows_read} dòng, {job.counts}, {job.rows_failed} lỗi, {job.chunks_committed} chunks")
+
+    def _commit_chunk(self, job: ImportJob, chunk: List[Tuple[int, Dict[str, Any]]]):
+        """Validate trên snapshot mới nhất, bỏ dòng lỗi, embed + commit phần còn lại (giữ lock ghi)"""
+        with self.write_context():
+            snapshot = self.writer.store.snapshot()
+            touched = set()
+            operations = []
+            for line, operation in chunk:
+                error = self.writer.operation_error(operation, snapshot, touched)
+                if error is not None:
+                    job.add_error(line, error)
+                else:
+                    operations.append(operation)
+            if not operations:
+                return
+            result = self.writer.apply(operations)
+            if not result['success']:
+                raise RuntimeError(f"Chunk bị từ chối: {result['errors'][:3]}")
+            if self.on_commit is not None:
+                self.on_commit()
+        for op, count in result['counts'].items():
+            job.counts[op] += count
+        job.chunks_committed += 1
+
+
+def _decoded_lines(f, job: ImportJob) -> Iterator[str]:
+    """Dòng của file nhị phân → str, cập nhật số byte đã đọc (progress)"""
+    for number, raw in enumerate(f):
+        job.bytes_read += len(raw)
+        line = raw.decode('utf-8', errors='replace')
+        yield line.lstrip('\ufeff') if number == 0 else line
+
+
+def read_csv(f, job: ImportJob) -> Iterator[Tuple[int, Any]]:
+    """(số dòng, dict các cột | Exception) cho từng record CSV - đọc tăng dần, không load cả file"""
+    reader = csv.DictReader(_decoded_lines(f, job))
+    while True:
+        try:
+            record = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as e:
+            yield reader.line_num, e
+            continue
+        yield reader.line_num, record
+
+
+def read_jsonl(f, job: ImportJob) -> Iterator[Tuple[int, Any]]:
+    """(số dòng, object | Exception) cho từng dòng JSONL (bỏ dòng trống)"""
+    for number, line in enumerate(_decoded_lines(f, job), 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield number, ValueError(f"JSON không hợp lệ: {e}")
+            continue
+        if not isinstance(record, dict):
+            yield number, ValueError("mỗi dòng phải là một JSON object")
+            continue
+        yield number, record
@@ -0,0 +1,475 @@
+"""
+FAISS index factory
+- Tạo index theo FAISS_CONFIG: flat, IVF-Flat, HNSW, IVF-PQ, scalar quantizer fp16/8-bit
+  (IVF lưu product id trực tiếp, các loại khác bọc IndexIDMap để update theo ID)
+- Train trên một sample, set tham số lúc search (nprobe / efSearch)
+- Giảm chiều (PCA / truncation) tùy chọn: index build trên vector đã project, rescore bằng vector đầy đủ
+- Bảng product id → slot (vị trí lưu vector trong index) để ghi đè vector tại chỗ khi update
+- Loại các ID đã xóa (tombstone) ngay trong lúc search bằng IDSelector (bitmap theo product id, ExcludedIds)
+- Báo cáo recall-vs-latency so với exact search khi build
+"""
+
+import os
+import sys
+import json
+import time
+import numpy as np
+import faiss
+from datetime import datetime
+from typing import Dict, Optional
+
+# Add config path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'config'))
+from simple_config import FAISS_CONFIG, EMBEDDING_STORAGE, PROJECTION
+from vector_storage import round_trip, BYTES_PER_DIM
+from projection import load_projection
+from id_index import IdPositionIndex
+
+# Tên index_type được chấp nhận (kể cả tên kiểu FAISS trong config/config.py)
+INDEX_TYPE_ALIASES = {
+    'flat': 'flat', 'indexflatip': 'flat',
+    'ivf_flat': 'ivf_flat', 'ivfflat': 'ivf_flat', 'ivf': 'ivf_flat',
+    'hnsw': 'hnsw', 'hnswflat': 'hnsw',
+    'ivf_pq': 'ivf_pq', 'ivfpq': 'ivf_pq',
+    'sq_fp16': 'sq_fp16', 'sqfp16': 'sq_fp16', 'fp16': 'sq_fp16', 'float16': 'sq_fp16',
+    'sq8': 'sq8', 'sq_8bit': 'sq8', 'indexscalarquantizer': 'sq8'
+}
+
+# Loại quantizer của IndexScalarQuantizer
+SCALAR_QUANTIZER_TYPES = {
+    'sq_fp16': faiss.ScalarQuantizer.QT_fp16,
+    'sq8': faiss.ScalarQuantizer.QT_8bit
+}
+
+# Số điểm train tối thiểu cho mỗi centroid (theo khuyến nghị của FAISS)
+MIN_POINTS_PER_CENTROID = 39
+
+
+def normalize_index_type(index_type: str) -> str:
+    """Chuẩn hóa tên index_type về flat | ivf_flat | hnsw | ivf_pq | sq_fp16 | sq8"""
+    key = str(index_type).lower().replace('-', '_')
+    if key not in INDEX_TYPE_ALIASES:
+        raise ValueError(f"index_type không hỗ trợ: {index_type}")
+    return INDEX_TYPE_ALIASES[key]
+
+
+def _resolve_nlist(num_vectors: int, config: Dict) -> int:
+    """Số cluster IVF: theo config hoặc 4*sqrt(N), giới hạn để mỗi centroid đủ điểm train"""
+    nlist = config.get('nlist') or int(4 * np.sqrt(max(num_vectors, 1)))
+    max_nlist = max(1, num_vectors // MIN_POINTS_PER_CENTROID)
+    return max(1, min(nlist, max_nlist))
+
+
+def _resolve_pq_m(dimension: int, pq_m: int) -> int:
+    """Số sub-quantizer PQ: ước số lớn nhất của dimension không vượt quá pq_m"""
+    for m in range(min(pq_m, dimension), 0, -1):
+        if dimension % m == 0:
+            return m
+    return 1
+
+
+def create_index(dimension: int, num_vectors: int, config: Optional[Dict] = None) -> faiss.Index:
+    """
+    Tạo index rỗng (chưa train) theo config
+    IVF tự lưu ID của từng vector nên không bọc IndexIDMap: IndexIDMap.remove_ids giả định index bên trong
+    đánh lại số thứ tự sau khi xóa (flat, HNSW), IVF thì không nên ID sẽ bị lệch.
+    Catalog quá nhỏ để train IVF-PQ (< 2^pq_nbits vectors) sẽ dùng IVF-Flat.
+    """
+    config = {**FAISS_CONFIG, **(config or {})}
+    index_type = normalize_index_type(config['index_type'])
+    metric = faiss.METRIC_INNER_PRODUCT  # Inner Product for cosine similarity
+
+    if index_type == 'ivf_pq' and num_vectors < 2 ** config['pq_nbits']:
+        print(f"⚠️ Chỉ có {num_vectors} vectors, không đủ train IVF-PQ - dùng IVF-Flat")
+        index_type = 'ivf_flat'
+
+    if index_type == 'flat':
+        base_index = faiss.IndexFlatIP(dimension)
+    elif index_type in SCALAR_QUANTIZER_TYPES:
+        base_index = faiss.IndexScalarQuantizer(dimension, SCALAR_QUANTIZER_TYPES[index_type], metric)
+    elif index_type == 'hnsw':
+        base_index = faiss.IndexHNSWFlat(dimension, config['hnsw_m'], metric)
+        base_index.hnsw.efConstruction = config['ef_construction']
+    else:
+        nlist = _resolve_nlist(num_vectors, config)
+        quantizer = faiss.IndexFlatIP(dimension)
+        if index_type == 'ivf_flat':
+            base_index = faiss.IndexIVFFlat(quantizer, dimension, nlist, metric)
+        else:
+            pq_m = _resolve_pq_m(dimension, config['pq_m'])
+            base_index = faiss.IndexIVFPQ(quantizer, dimension, nlist, pq_m, config['pq_nbits'], metric)
+        return base_index
+
+    return faiss.IndexIDMap(base_index)
+
+
+def has_product_ids(index: faiss.Index) -> bool:
+    """Index trả về product id (IndexIDMap hoặc IVF) thay vì vị trí dòng"""
+    return hasattr(index, 'id_map') or faiss.try_extract_index_ivf(index) is not None
+
+
+def apply_search_params(index: faiss.Index, config: Optional[Dict] = None) -> faiss.Index:
+    """Set tham số lúc search (nprobe cho IVF, efSearch cho HNSW) - gọi sau build và sau read_index"""
+    if index is None:
+        return index
+    config = {**FAISS_CONFIG, **(config or {})}
+    params = faiss.ParameterSpace()
+
+    if faiss.try_extract_index_ivf(index) is not None:
+        params.set_index_parameter(index, 'nprobe', config['nprobe'])
+    else:
+        base_index = faiss.downcast_index(index.index) if hasattr(index, 'id_map') else index
+        if isinstance(base_index, faiss.IndexHNSW):
+            params.set_index_parameter(index, 'efSearch', config['ef_search'])
+
+    return index
+
+
+class ExcludedIds:
+    """
+    Tập product id bị loại khỏi kết quả main index, lưu dạng bitmap (bit i của byte i >> 3 = ID i)
+    - IDSelectorBitmap đọc thẳng bitmap, không phải build hash set như IDSelectorBatch
+    - with_ids(): tập mới có thêm ID - copy bitmap (max ID / 8 byte), tập cũ không bị đổi
+    """
+
+    def __init__(self, ids=None):
+        ids = np.unique(np.asarray(ids if ids is not None else [], dtype=np.int64))
+        ids = ids[ids >= 0]
+        self.bitmap = np.zeros((int(ids.max()) >> 3) + 1 if len(ids) > 0 else 0, dtype=np.uint8)
+        np.bitwise_or.at(self.bitmap, ids >> 3, (1 << (ids & 7)).astype(np.uint8))
+        self._count = len(ids)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def contains(self, ids) -> np.ndarray:
+        """Mask vectorized: ID nào nằm trong tập"""
+        ids = np.asarray(ids, dtype=np.int64)
+        found = np.zeros(ids.shape, dtype=bool)
+        in_range = (ids >= 0) & ((ids >> 3) < len(self.bitmap))
+        values = ids[in_range]
+        found[in_range] = (self.bitmap[values >> 3] >> (values & 7).astype(np.uint8)) & 1 == 1
+        return found
+
+    def with_ids(self, ids) -> 'ExcludedIds':
+        """Tập mới = tập này + ids"""
+        ids = np.asarray(ids, dtype=np.int64)
+        ids = np.unique(ids[(ids >= 0) & ~self.contains(ids)])
+        if len(ids) == 0:
+            return self
+        excluded = ExcludedIds()
+        excluded.bitmap = np.zeros(max(len(self.bitmap), (int(ids.max()) >> 3) + 1), dtype=np.uint8)
+        excluded.bitmap[:len(self.bitmap)] = self.bitmap
+        np.bitwise_or.at(excluded.bitmap, ids >> 3, (1 << (ids & 7)).astype(np.uint8))
+        excluded._count = self._count + len(ids)
+        return excluded
+
+    def selector(self) -> faiss.IDSelector:
+        """IDSelector chọn các ID không nằm trong tập (giữ tham chiếu tới bitmap)"""
+        return faiss.IDSelectorNot(faiss.IDSelectorBitmap(self.bitmap))
+
+
+def search_parameters(index: faiss.Index, exclude_ids=None) -> Optional[faiss.SearchParameters]:
+    """
+    SearchParameters bỏ qua các ID trong exclude_ids (IDSelector, IndexIDMap tự dịch sang ID thực)
+    exclude_ids: ExcludedIds (bitmap) hoặc mảng product id.
+    Giữ nprobe / efSearch đang set trên index vì tham số truyền vào thay thế giá trị của index.
+    Trả về None nếu không có ID nào cần loại.
+    """
+    if index is None or exclude_ids is None or len(exclude_ids) == 0:
+        return None
+    if isinstance(exclude_ids, ExcludedIds):
+        selector = exclude_ids.selector()
+    else:
+        selector = faiss.IDSelectorNot(faiss.IDSelectorBatch(np.asarray(exclude_ids, dtype=np.int64)))
+
+    ivf_index = faiss.try_extract_index_ivf(index)
+    if ivf_index is not None:
+        return faiss.SearchParametersIVF(sel=selector, nprobe=ivf_index.nprobe)
+    base_index = faiss.downcast_index(index.index) if hasattr(index, 'id_map') else index
+    if isinstance(base_index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=base_index.hnsw.efSearch)
+    return faiss.SearchParameters(sel=selector)
+
+
+def normalize_vectors(vectors) -> np.ndarray:
+    """Copy sang float32 C-contiguous (chấp nhận float16 / memmap) và normalize L2"""
+    vectors = np.array(vectors, dtype=np.float32, order='C', copy=True)
+    if len(vectors) > 0:
+        faiss.normalize_L2(vectors)
+    return vectors
+
+
+def prepare_vectors(index: faiss.Index, vectors) -> np.ndarray:
+    """
+    Normalize vectors và project về số chiều của index nếu index được build trên vector đã giảm chiều
+    (projection đọc từ DATA_PATHS['projection'], cùng transform cho build/add/update/search)
+    """
+    vectors = normalize_vectors(vectors)
+    if vectors.shape[1] == index.d:
+        return vectors
+    projection = load_projection()
+    if projection is None or projection.output_dim != index.d or projection.input_dim != vectors.shape[1]:
+        raise ValueError(f"Index có {index.d} chiều nhưng vectors có {vectors.shape[1]} chiều "
+                         f"và không có projection phù hợp")
+    return projection.apply(vectors)
+
+
+def add_vectors(index: faiss.Index, vectors, ids, slots: Optional[IdPositionIndex] = None) -> None:
+    """
+    Thêm vectors (normalize cho cosine similarity, project nếu cần) với ID tương ứng vào index
+    slots: bảng id → slot của index, được cập nhật cho các vector vừa thêm (slot mới luôn nằm cuối)
+    """
+    vectors = prepare_vectors(index, np.asarray(vectors).reshape(len(ids), -1))
+    first_slot = index.ntotal
+    index.add_with_ids(vectors, np.asarray(ids, dtype=np.int64))
+    if slots is not None:
+        for offset, product_id in enumerate(ids):
+            slots.set(product_id, first_slot + offset)
+
+
+def build_slot_table(index: faiss.Index) -> IdPositionIndex:
+    """
+    Bảng product id → slot đọc từ id_map của IndexIDMap (slot i giữ vector của id_map[i])
+    Phải build lại sau remove_ids vì FAISS dồn các slot phía sau lên.
+    """
+    if index is None:
+        return IdPositionIndex()
+    if hasattr(index, 'id_map'):
+        return IdPositionIndex(faiss.vector_to_array(index.id_map))
+    if faiss.try_extract_index_ivf(index) is not None:
+        # IVF lưu vector theo inverted list, không có slot cố định
+        return IdPositionIndex()
+    return IdPositionIndex(np.arange(index.ntotal, dtype=np.int64))
+
+
+def supports_in_place_update(index: faiss.Index) -> bool:
+    """Index lưu code theo slot liên tục (flat, scalar quantizer) → ghi đè được tại chỗ"""
+    base_index = faiss.downcast_index(index.index) if hasattr(index, 'id_map') else index
+    return isinstance(base_index, faiss.IndexFlatCodes)
+
+
+def replace_vectors(index: faiss.Index, vectors, ids, slots: IdPositionIndex) -> bool:
+    """
+    Ghi đè vector của các product id đã có trong index tại đúng slot của chúng (O(1) mỗi vector)
+    Trả về False (không sửa gì) nếu loại index không hỗ trợ (IVF, HNSW) hoặc có id chưa nằm trong index.
+    """
+    if not supports_in_place_update(index):
+        return False
+    positions = slots.lookup(np.asarray(ids, dtype=np.int64))
+    if len(positions) == 0 or (positions < 0).any():
+        return False
+
+    base_index = faiss.downcast_index(index.index) if hasattr(index, 'id_map') else index
+    codes = faiss.rev_swig_ptr(base_index.codes.data(), base_index.ntotal * base_index.code_size)
+    codes = codes.reshape(base_index.ntotal, base_index.code_size)
+    codes[positions] = base_index.sa_encode(prepare_vectors(index, np.asarray(vectors).reshape(len(ids), -1)))
+    return True
+
+
+def build_index(embeddings, ids=None, config: Optional[Dict] = None, project: Optional[bool] = None) -> faiss.Index:
+    """
+    Build index đầy đủ từ embeddings
+    - Train trên sample tối đa train_sample_size vectors
+    - Add theo từng block để không phải copy toàn bộ embeddings cùng lúc (hỗ trợ memmap)
+    - project (mặc định PROJECTION['enabled']): build trên vector đã giảm chiều bằng projection đã lưu
+    """
+    config = {**FAISS_CONFIG, **(config or {})}
+    num_vectors, dimension = embeddings.shape
+    if ids is None:
+        ids = np.arange(num_vectors, dtype=np.int64)
+    ids = np.asarray(ids, dtype=np.int64)
+
+    project = PROJECTION['enabled'] if project is None else project
+    projection = load_projection() if project else None
+    if project and projection is None:
+        print("⚠️ PROJECTION bật nhưng chưa có file projection - build index đủ chiều")
+    index_dimension = projection.output_dim if projection is not None else dimension
+
+    index = create_index(index_dimension, num_vectors, config)
+
+    if not index.is_trained:
+        sample_size = min(num_vectors, config['train_sample_size'])
+        rng = np.random.default_rng(0)
+        sample_rows = np.sort(rng.choice(num_vectors, size=sample_size, replace=False))
+        start_time = time.time()
+        index.train(prepare_vectors(index, embeddings[sample_rows]))
+        print(f"🏋️ Trained {normalize_index_type(config['index_type'])} index on {sample_size} vectors "
+              f"in {(time.time() - start_time):.1f}s")
+
+    block_size = config['add_block_size']
+    for start in range(0, num_vectors, block_size):
+        end = min(start + block_size, num_vectors)
+        add_vectors(index, embeddings[start:end], ids[start:end])
+
+    return apply_search_params(index, config)
+
+
+def rescore_candidates(query_embeddings: np.ndarray, candidate_ids: np.ndarray, k: int,
+                       embeddings, positions_of):
+    """
+    Rescore exact các candidate bằng vector đầy đủ, trả về (scores, ids) [nq, k] (thiếu thì id = -1)
+    - embeddings: vector float theo vị trí dòng (memmap được, chỉ đọc các dòng candidate)
+    - positions_of: hàm ánh xạ mảng product id → vị trí dòng (-1 nếu không tồn tại)
+    """
+    query_embeddings = normalize_vectors(query_embeddings)
+    num_queries = len(query_embeddings)
+    scores = np.full((num_queries, k), -np.inf, dtype=np.float32)
+    ids = np.full((num_queries, k), -1, dtype=np.int64)
+
+    for i in range(num_queries):
+        row_ids = candidate_ids[i][candidate_ids[i] >= 0]
+        positions = positions_of(row_ids)
+        row_ids = row_ids[positions >= 0]
+        positions = positions[positions >= 0]
+        if len(positions) == 0:
+            continue
+        # Đọc các dòng theo thứ tự vị trí để memmap truy cập tuần tự
+        order = np.argsort(positions)
+        row_ids, positions = row_ids[order], positions[order]
+        row_scores = normalize_vectors(embeddings[positions]) @ query_embeddings[i]
+        top = np.argsort(-row_scores)[:k]
+        scores[i, :len(top)] = row_scores[top]
+        ids[i, :len(top)] = row_ids[top]
+
+    return scores, ids
+
+
+def search_with_rescoring(index: faiss.Index, query_embeddings: np.ndarray, k: int,
+                          embeddings=None, positions_of=None, rescore_k: Optional[int] = None,
+                          params: Optional[faiss.SearchParameters] = None):
+    """
+    Search index với query đủ chiều
+    - Index đủ chiều: index.search trực tiếp
+    - Index giảm chiều: project query, lấy max(k, rescore_k) candidates rồi rescore bằng vector đầy đủ
+    - params: SearchParameters từ search_parameters() (loại ID đã xóa)
+    """
+    queries = normalize_vectors(query_embeddings)
+    if queries.shape[1] == index.d:
+        return index.search(queries, k, params=params)
+    if embeddings is None or positions_of is None:
+        raise ValueError("Index giảm chiều cần embeddings đầy đủ để rescore")
+    candidate_k = max(k, rescore_k or PROJECTION['rescore_k'])
+    _, candidate_ids = index.search(prepare_vectors(index, queries), candidate_k, params=params)
+    return rescore_candidates(queries, candidate_ids, k, embeddings, positions_of)
+
+
+def exact_search(queries: np.ndarray, embeddings, ids, k: int, block_size: int):
+    """Exact inner-product search duyệt embeddings theo block, trả về (scores, ids) top-k"""
+    num_vectors, dimension = embeddings.shape
+    exact_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+    exact_ids = np.full((len(queries), k), -1, dtype=np.int64)
+    for start in range(0, num_vectors, block_size):
+        end = min(start + block_size, num_vectors)
+        flat = faiss.IndexFlatIP(dimension)
+        flat.add(normalize_vectors(embeddings[start:end]))
+        scores, positions = flat.search(queries, min(k, end - start))
+        merged_scores = np.concatenate([exact_scores, scores], axis=1)
+        merged_ids = np.concatenate([exact_ids, ids[start:end][positions]], axis=1)
+        order = np.argsort(-merged_scores, axis=1)[:, :k]
+        exact_scores = np.take_along_axis(merged_scores, order, axis=1)
+        exact_ids = np.take_along_axis(merged_ids, order, axis=1)
+    return exact_scores, exact_ids
+
+
+def _recall(approx_ids: np.ndarray, exact_ids: np.ndarray, k: int) -> float:
+    """Recall@k trung bình của approx so với exact"""
+    return float(np.mean([
+        len(set(approx_row[approx_row >= 0]) & set(exact_row)) / k
+        for approx_row, exact_row in zip(approx_ids, exact_ids)
+    ]))
+
+
+def evaluate_index(index: faiss.Index, embeddings, ids=None, config: Optional[Dict] = None) -> Dict:
+    """
+    So sánh index với exact search (IndexFlatIP) trên một sample query lấy từ chính embeddings
+    Trả về recall@k và latency trung bình mỗi query của hai bên (index giảm chiều tính cả bước rescore).
+    """
+    config = {**FAISS_CONFIG, **(config or {})}
+    num_vectors, dimension = embeddings.shape
+    k = min(config['report_k'], num_vectors)
+    if ids is None:
+        ids = np.arange(num_vectors, dtype=np.int64)
+    ids = np.asarray(ids, dtype=np.int64)
+
+    rng = np.random.default_rng(1)
+    num_queries = min(config['report_queries'], num_vectors)
+    queries = normalize_vectors(embeddings[np.sort(rng.choice(num_vectors, size=num_queries, replace=False))])
+
+    # Exact search theo block để không phải giữ toàn bộ embeddings float32 trong RAM
+    start_time = time.time()
+    _, exact_ids = exact_search(queries, embeddings, ids, k, config['add_block_size'])
+    exact_ms = (time.time() - start_time) * 1000 / num_queries
+
+    start_time = time.time()
+    _, approx_ids = search_with_rescoring(index, queries, k, embeddings, IdPositionIndex(ids).lookup)
+    approx_ms = (time.time() - start_time) * 1000 / num_queries
+
+    recall = _recall(approx_ids, exact_ids, k)
+
+    return {
+        'index_type': normalize_index_type(config['index_type']),
+        'faiss_description': type(faiss.downcast_index(index.index) if hasattr(index, 'id_map') else index).__name__,
+        'num_vectors': int(num_vectors),
+        'dimension': int(dimension),
+        'num_queries': int(num_queries),
+        'k': int(k),
+        'nprobe': config['nprobe'],
+        'ef_search': config['ef_search'],
+        'index_dimension': int(index.d),
+        f'recall_at_{k}': float(recall),
+        'exact_latency_ms': float(exact_ms),
+        'index_latency_ms': float(approx_ms),
+        'speedup': float(exact_ms / approx_ms) if approx_ms > 0 else None,
+        'timestamp': datetime.now().isoformat()
+    }
+
+
+def evaluate_storage(embeddings, ids=None, dtypes=None, config: Optional[Dict] = None) -> Dict:
+    """
+    Đo recall delta khi lưu embeddings dạng float16 / sq8 so với float32
+    Query float32 gốc được search exact trên bản embeddings đã lưu-rồi-đọc-lại của từng kiểu.
+    """
+    config = {**FAISS_CONFIG, **(config or {})}
+    dtypes = dtypes or EMBEDDING_STORAGE['report_dtypes']
+    num_vectors, dimension = embeddings.shape
+    k = min(config['report_k'], num_vectors)
+    if ids is None:
+        ids = np.arange(num_vectors, dtype=np.int64)
+    ids = np.asarray(ids, dtype=np.int64)
+
+    rng = np.random.default_rng(1)
+    num_queries = min(config['report_queries'], num_vectors)
+    queries = normalize_vectors(embeddings[np.sort(rng.choice(num_vectors, size=num_queries, replace=False))])
+    _, exact_ids = exact_search(queries, embeddings, ids, k, config['add_block_size'])
+
+    report = {}
+    for dtype in dtypes:
+        _, stored_ids = exact_search(queries, round_trip(embeddings, dtype), ids, k, config['add_block_size'])
+        recall = _recall(stored_ids, exact_ids, k)
+        report[dtype] = {
+            'bytes_per_vector': BYTES_PER_DIM[dtype] * int(dimension),
+            f'recall_at_{k}': recall,
+            'recall_delta': recall - 1.0
+        }
+    report['float32'] = {'bytes_per_vector': 4 * int(dimension), f'recall_at_{k}': 1.0, 'recall_delta': 0.0}
+    return report
+
+
+def save_index_report(report: Dict, report_file: Optional[str] = None) -> str:
+    """Lưu báo cáo recall-vs-latency ra JSON"""
+    report_file = report_file or FAISS_CONFIG['report_file']
+    with open(report_file, 'w') as f:
+        json.dump(report, f, indent=2)
+    return report_file
+
+
+def print_index_report(report: Dict) -> None:
+    """In tóm tắt báo cáo"""
+    recall_key = f"recall_at_{report['k']}"
+    print(f"📊 Index report ({report['index_type']}, {report['num_vectors']} vectors, {report['num_queries']} queries):")
+    print(f"   • Recall@{report['k']} vs exact: {report[recall_key] * 100:.1f}%")
+    print(f"   • Latency: {report['index_latency_ms']:.2f}ms/query (exact: {report['exact_latency_ms']:.2f}ms/query)")
+    for dtype, stats in report.get('storage', {}).items():
+        print(f"   • Storage {dtype}: {stats['bytes_per_vector']} bytes/vector, "
+              f"recall@{report['k']} {stats[recall_key] * 100:.1f}%")
@@ -0,0 +1,238 @@
+"""
+Build embeddings + FAISS index cho cả catalog bằng nhiều process CPU, resume được sau khi bị dừng
+- Corpus: data/product_metadata.csv (output của src/preprocess.py), chia shard PARALLEL_BUILD['shard_rows'] dòng
+- Pool PARALLEL_BUILD['workers'] process, mỗi process giữ một bản model trên CPU,
+  torch dùng threads_per_worker thread intra-op (mặc định số CPU / workers, không tranh nhau core)
+- Shard xong được ghi ra data/build/shard-<n>.npy (float32) rồi ghi nhận vào data/build/manifest.json
+  → chạy lại sau crash / Ctrl+C chỉ embed các shard còn thiếu (khi manifest khớp corpus + cấu hình,
+  kể cả namespace embedding: MAX_LENGTH, CHUNK_OVERLAP, trọng số attention pooling)
+- Mỗi shard ghi kèm namespace của worker; khác namespace của manifest thì dừng (không trộn vector hai cấu hình)
+- Merge: các shard được ghi lần lượt vào file embeddings (memmap), FAISS index build theo block từ file đó
+  (build_catalog_index) - không giữ toàn bộ vectors trong RAM
+- Worker đọc embedding cache (chỉ đọc), process cha ghi vector của từng shard vào cache
+
+Chạy: python src/parallel_build.py [--workers N] [--fresh]   (--fresh: bỏ checkpoint, build lại từ đầu)
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import multiprocessing
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+# Add config path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'config'))
+from simple_config import (
+    DATA_PATHS, EMBEDDING_MODEL_NAME, EMBEDDING_CACHE, MAX_LENGTH, PARALLEL_BUILD,
+    get_global_embedding_model
+)
+from embedding import embed_texts, embedding_namespace, pooling_namespace, build_catalog_index, build_batch_size
+from attention_pooling import load_attention_pooling, saved_pooling_dim
+from embedding_cache import cache_keys, get_embedding_cache
+from vector_storage import save_embedding_blocks, load_embeddings
+
+MANIFEST_FILE = 'manifest.json'
+
+# Model của worker process (load một lần trong _init_worker)
+_worker = {}
+
+
+def load_corpus(path: Optional[str] = None) -> Tuple[np.ndarray, List[str]]:
+    """(product id, text_corpus) của từng dòng metadata đã tiền xử lý"""
+    df = pd.read_csv(path or DATA_PATHS['metadata'], usecols=['id', 'text_corpus'], keep_default_na=False)
+    return df['id'].to_numpy(dtype=np.int64), df['text_corpus'].astype(str).tolist()
+
+
+def current_namespace() -> Optional[str]:
+    """
+    Namespace embedding (model, MAX_LENGTH, CHUNK_OVERLAP, fingerprint head pooling) tính trong process cha
+    từ head đã lưu, không load model. None nếu chưa có head: worker đầu tiên tạo head, namespace lấy từ shard đầu.
+    """
+    embed_dim = saved_pooling_dim()
+    if embed_dim is None:
+        return None
+    return pooling_namespace(load_attention_pooling(embed_dim, 'cpu'), MAX_LENGTH).decode('utf-8')
+
+
+def build_config(ids: np.ndarray, texts: List[str], shard_rows: int) -> Dict:
+    """Thông tin xác định một lần build: checkpoint chỉ được dùng lại khi tất cả khớp"""
+    digest = hashlib.sha256(np.ascontiguousarray(ids, dtype=np.int64).tobytes())
+    for text in texts:
+        digest.update(text.encode('utf-8'))
+        digest.update(b'\0')
+    return {
+        'corpus_rows': len(texts),
+        'corpus_sha256': digest.hexdigest(),
+        'model': EMBEDDING_MODEL_NAME,
+        'max_length': MAX_LENGTH,
+        'namespace': current_namespace(),
+        'shard_rows': shard_rows
+    }
+
+
+def shard_path(directory: str, shard: int) -> str:
+    return os.path.join(directory, f"shard-{shard:05d}.npy")
+
+
+def read_manifest(directory: str) -> Optional[Dict]:
+    """Manifest checkpoint (None nếu chưa có / hỏng)"""
+    try:
+        with open(os.path.join(directory, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_manifest(directory: str, manifest: Dict):
+    """Ghi manifest (file tạm rồi os.replace)"""
+    manifest['updated_at'] = datetime.now().isoformat()
+    path = os.path.join(directory, MANIFEST_FILE)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def completed_shards(directory: str, manifest: Dict) -> set:
+    """Shard đã ghi nhận trong manifest và file vẫn đủ số dòng"""
+    done = set()
+    for shard, info in manifest.get('shards', {}).items():
+        try:
+            if np.load(shard_path(directory, int(shard)), mmap_mode='r').shape[0] == info['rows']:
+                done.add(int(shard))
+        except (OSError, ValueError):
+            pass
+    return done
+
+
+def _init_worker(threads: int):
+    """Khởi tạo worker: chỉ dùng CPU, giới hạn thread của torch, load model một lần"""
+    os.environ['CUDA_VISIBLE_DEVICES'] = ''
+    import torch
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass
+    if EMBEDDING_CACHE['enabled']:
+        get_embedding_cache(readonly=True)
+    model, tokenizer = get_global_embedding_model()
+    _worker['model'] = model.to('cpu')
+    _worker['tokenizer'] = tokenizer
+
+
+def _embed_shard(task: Tuple[int, List[str], str]) -> Tuple[int, int, float, str]:
+    """Embed một shard trong worker và ghi ra file (file tạm rồi os.replace), trả về kèm namespace của worker"""
+    shard, texts, path = task
+    start_time = time.time()
+    model, tokenizer = _worker['model'], _worker['tokenizer']
+    vectors = embed_texts(texts, model, tokenizer, MAX_LENGTH, 'cpu', build_batch_size('cpu'))
+    tmp_path = f"{path}.{os.getpid()}.tmp.npy"
+    np.save(tmp_path, np.asarray(vectors, dtype=np.float32))
+    os.replace(tmp_path, path)
+    namespace = embedding_namespace(model, MAX_LENGTH, 'cpu').decode('utf-8')
+    return shard, len(texts), time.time() - start_time, namespace
+
+
+def run_shards(texts: List[str], directory: str, manifest: Dict, workers: int, threads: int):
+    """Embed các shard chưa xong bằng pool worker, ghi nhận từng shard vào manifest ngay khi xong"""
+    shard_rows = manifest['shard_rows']
+    num_shards = (len(texts) + shard_rows - 1) // shard_rows
+    done = completed_shards(directory, manifest)
+    pending = [shard for shard in range(num_shards) if shard not in done]
+    print(f"📦 {num_shards} shards × {shard_rows} dòng: {len(done)} đã xong, còn {len(pending)}")
+    if not pending:
+        return
+
+    cache = get_embedding_cache() if EMBEDDING_CACHE['enabled'] else None
+    tasks = ((shard, texts[shard * shard_rows:(shard + 1) * shard_rows], shard_path(directory, shard))
+             for shard in pending)
+    remaining_rows = sum(len(texts[shard * shard_rows:(shard + 1) * shard_rows]) for shard in pending)
+
+    print(f"🔄 Embedding với {workers} workers × {threads} threads (CPU)...")
+    start_time = time.time()
+    rows_done = 0
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(workers, initializer=_init_worker, initargs=(threads,)) as pool:
+        for shard, rows, seconds, namespace in pool.imap_unordered(_embed_shard, tasks):
+            if manifest.get('namespace') is None:
+                manifest['namespace'] = namespace
+            elif namespace != manifest['namespace']:
+                # Head pooling / cấu hình chunk bị đổi giữa chừng: vector của shard này không trộn được với các shard khác
+                raise RuntimeError(f"Shard {shard} có namespace {namespace!r} khác checkpoint "
+                                   f"{manifest['namespace']!r} - chạy lại với --fresh")
+            manifest['shards'][str(shard)] = {
+                'rows': rows, 'file': os.path.basename(shard_path(directory, shard)), 'seconds': round(seconds, 1)
+            }
+            write_manifest(directory, manifest)
+            if cache is not None:
+                shard_texts = texts[shard * shard_rows:(shard + 1) * shard_rows]
+                cache.put(cache_keys(shard_texts, namespace.encode('utf-8')), np.load(shard_path(directory, shard)))
+
+            rows_done += rows
+            elapsed = time.time() - start_time
+            rate = rows_done / max(elapsed, 1e-9)
+            print(f"   ✅ Shard {shard}: {rows} dòng trong {seconds:.1f}s | {len(manifest['shards'])}/{num_shards} shards, "
+                  f"{rate:.1f} texts/s, còn ~{(remaining_rows - rows_done) / max(rate, 1e-9) / 60:.1f} phút")
+
+
+def merge_shards(ids: np.ndarray, directory: str, manifest: Dict):
+    """Ghi các shard vào file embeddings theo thứ tự rồi build FAISS index theo block từ memmap"""
+    num_shards = (len(ids) + manifest['shard_rows'] - 1) // manifest['shard_rows']
+    files = [shard_path(directory, shard) for shard in range(num_shards)]
+    dimension = np.load(files[0], mmap_mode='r').shape[1]
+
+    print(f"🔗 Merge {num_shards} shards → {DATA_PATHS['embeddings']} ({len(ids)} × {dimension})")
+    storage_dtype = save_embedding_blocks(DATA_PATHS['embeddings'],
+                                          lambda: (np.load(path, mmap_mode='r') for path in files),
+                                          len(ids), dimension, ids=ids)
+
+    # Build từ file vừa ghi (memmap); bỏ qua báo cáo storage vì round_trip cần cả embeddings trong RAM
+    build_catalog_index(load_embeddings(DATA_PATHS['embeddings']), ids, storage_dtype, report_storage=False)
+
+
+def main():
+    args = sys.argv[1:]
+    workers = PARALLEL_BUILD['workers']
+    if '--workers' in args:
+        workers = int(args[args.index('--workers') + 1])
+    workers = max(1, workers)
+    threads = PARALLEL_BUILD['threads_per_worker'] or max(1, (os.cpu_count() or 1) // workers)
+    directory = DATA_PATHS['build']
+
+    print("🚀 PARALLEL INDEX BUILD")
+    print("=" * 60)
+    start_time = time.time()
+    ids, texts = load_corpus()
+    if not texts:
+        print(f"❌ {DATA_PATHS['metadata']} không có sản phẩm - chạy src/preprocess.py trước")
+        return
+    config = build_config(ids, texts, PARALLEL_BUILD['shard_rows'])
+
+    manifest = read_manifest(directory)
+    if manifest is not None and '--fresh' not in args and all(manifest.get(key) == value for key, value in config.items()):
+        print(f"♻️ Resume checkpoint {directory} (bắt đầu {manifest.get('started_at')})")
+    else:
+        if manifest is not None and '--fresh' not in args:
+            print("⚠️ Checkpoint không khớp corpus / cấu hình hiện tại - build lại từ đầu")
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory, exist_ok=True)
+        manifest = {**config, 'shards': {}, 'started_at': datetime.now().isoformat()}
+        write_manifest(directory, manifest)
+
+    run_shards(texts, directory, manifest, workers, threads)
+    merge_shards(ids, directory, manifest)
+
+    # Index đã build xong - checkpoint không còn cần
+    shutil.rmtree(directory, ignore_errors=True)
+    print(f"✅ Parallel build xong: {len(texts)} sản phẩm trong {(time.time() - start_time) / 60:.1f} phút")
+
+
+if __name__ == "__main__":
+    main()
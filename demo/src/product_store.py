@@ -0,0 +1,793 @@
+"""
+Kho dữ liệu catalog dùng chung (một bản index / metadata / embeddings cho cả process)
+- ProductSearcher, ProductManager, ProductDeleter, ProductUpdater cùng đọc từ một ProductStore
+- Reader lấy CatalogSnapshot hiện tại và dùng nó suốt một request: không cần lock, không thấy trạng thái ghi dở
+- Writer phát ra CatalogChange (dòng + vector thêm/sửa, ID xóa); store áp dụng thay đổi trong bộ nhớ
+  (copy-on-write: chỉ copy phần bị sửa), ghi các file bị đổi rồi publish snapshot mới bằng một phép gán tham chiếu
+- Chỉ đọc lại toàn bộ từ đĩa lúc khởi động hoặc khi admin yêu cầu (ProductStore.reload)
+- WAL bật: thay đổi chỉ được append vào catalog log; file đầy đủ được ghi lúc checkpoint (catalog_log.py)
+- Checkpoint ghi một thư mục snapshot mới rồi đổi con trỏ data/CURRENT (snapshot_dir.py)
+- Merge / compaction nền build trên một snapshot rồi replay các change commit trong lúc build (ChangeJournal)
+"""
+
+import os
+import sys
+import time
+import threading
+import numpy as np
+import pandas as pd
+import faiss
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional
+
+# Add config path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'config'))
+from simple_config import BINARY_SEARCH, DELTA_INDEX, WAL, SNAPSHOTS
+from id_index import IdPositionIndex
+from append_buffer import AppendBuffer, same_start
+from index_factory import (
+    apply_search_params, build_slot_table, search_parameters, add_vectors, build_index,
+    replace_vectors, supports_in_place_update, ExcludedIds
+)
+from vector_storage import (
+    load_embeddings, load_embedding_ids, save_embeddings, OverlayEmbeddings, embeddings_base, is_memory_mapped
+)
+from binary_index import load_or_build_binary_index
+from delta_index import DeltaIndex
+from tombstones import TombstoneSet
+from catalog_log import CatalogLog
+from snapshot_dir import (
+    COMPONENT_FILES, legacy_paths, snapshot_paths, read_current, verify_manifest,
+    begin_snapshot, carry_over, publish_snapshot
+)
+
+# Các cột metadata được trả về trong kết quả search
+RESULT_COLUMNS = [
+    'id', 'name', 'brand', 'ingredients', 'categories',
+    'manufacturer', 'manufacturerNumber', 'text_corpus'
+]
+
+
+class CatalogChange:
+    """
+    Thay đổi catalog do một thao tác ghi phát ra
+    - rows: các dòng metadata đầy đủ của sản phẩm thêm mới / sửa (cột 'id' là product id)
+    - vectors: embedding [len(rows), d] theo thứ tự rows (None nếu chỉ đổi metadata)
+    - deleted_ids: product id bị xóa (áp dụng sau rows)
+    """
+
+    def __init__(self, rows: Optional[pd.DataFrame] = None, vectors=None, deleted_ids: Optional[Iterable[int]] = None):
+        self.rows = rows.reset_index(drop=True) if rows is not None else pd.DataFrame(columns=['id'])
+        self.vectors = np.asarray(vectors).reshape(len(self.rows), -1) if vectors is not None else None
+        self.deleted_ids = np.asarray(list(deleted_ids) if deleted_ids is not None else [], dtype=np.int64)
+        self._upserted_ids = None
+
+    @property
+    def upserted_ids(self) -> np.ndarray:
+        """Product id của các dòng thêm mới / sửa (đọc cột 'id' một lần)"""
+        if self._upserted_ids is None:
+            self._upserted_ids = self.rows['id'].to_numpy(dtype=np.int64)
+        return self._upserted_ids
+
+    def __len__(self) -> int:
+        return len(self.rows) + len(self.deleted_ids)
+
+    @staticmethod
+    def batches(changes: Iterable['CatalogChange']) -> Iterator['CatalogChange']:
+        """
+        Gộp các change liên tiếp thành ít change lớn (replay log: mỗi lần apply build lại bảng tra cứu O(N))
+        Tách batch khi cột của rows / việc có vector khác nhau, hoặc khi một ID bị xóa rồi được ghi lại.
+        """
+        batch: List[CatalogChange] = []
+        deleted, shape = set(), None
+        for change in changes:
+            change_shape = (tuple(change.rows.columns), change.vectors is not None) if len(change.rows) > 0 else None
+            conflict = (change_shape is not None and shape is not None and change_shape != shape) or \
+                not deleted.isdisjoint(change.upserted_ids.tolist())
+            if batch and conflict:
+                yield CatalogChange._concat(batch)
+                batch, deleted, shape = [], set(), None
+            batch.append(change)
+            deleted.update(change.deleted_ids.tolist())
+            shape = shape or change_shape
+        if batch:
+            yield CatalogChange._concat(batch)
+
+    @staticmethod
+    def _concat(changes: List['CatalogChange']) -> 'CatalogChange':
+        """Một change tương đương áp dụng lần lượt các change (dòng ghi sau cùng của mỗi ID thắng)"""
+        if len(changes) == 1:
+            return changes[0]
+        with_rows = [change for change in changes if len(change.rows) > 0]
+        rows = pd.concat([change.rows for change in with_rows], ignore_index=True) if with_rows else None
+        vectors = None
+        if with_rows and with_rows[0].vectors is not None:
+            vectors = np.vstack([change.vectors for change in with_rows])
+        if rows is not None:
+            keep = ~rows['id'].duplicated(keep='last').to_numpy()
+            rows = rows[keep]
+            vectors = vectors[keep] if vectors is not None else None
+        return CatalogChange(rows, vectors, np.concatenate([change.deleted_ids for change in changes]))
+
+
+class CatalogSnapshot:
+    """
+    Trạng thái catalog tại một thời điểm, không bị sửa sau khi publish
+    Các bảng tra cứu (id → dòng, id → slot, IDSelector của search) được tính khi tạo snapshot;
+    previous: snapshot trước đó, bảng nào có thành phần nguồn không đổi (cùng object) thì dùng lại,
+    thành phần chỉ được append thêm dòng (cùng AppendBuffer) thì bảng được nối tiếp thay vì build lại.
+    frame: DataFrame metadata vật lý; dead_rows: vị trí các dòng đã xóa (chỉ bị bỏ khỏi frame lúc compaction),
+    metadata_df: các dòng còn tồn tại.
+    """
+
+    def __init__(self, index: faiss.Index, frame: pd.DataFrame, embeddings, embedding_ids,
+                 delta: Optional[DeltaIndex] = None, tombstones: Optional[TombstoneSet] = None,
+                 binary_index=None, previous: Optional['CatalogSnapshot'] = None,
+                 slots: Optional[IdPositionIndex] = None, dead_rows=None, excluded: Optional[ExcludedIds] = None):
+        self.index = index
+        self.frame = frame
+        self.dead_rows = np.asarray(dead_rows if dead_rows is not None else [], dtype=np.int64)
+        self._metadata_df = None
+        self.embeddings = embeddings
+        self.embedding_ids = np.asarray(embedding_ids, dtype=np.int64)
+        self.delta = delta
+        self.tombstones = tombstones if tombstones is not None else TombstoneSet()
+        self.binary_index = binary_index
+        self.version = 0  # Gán bởi ProductStore.publish
+        self.log_seq = previous.log_seq if previous is not None else 0  # Seq của change cuối đã áp dụng
+        # Product id đã xóa + seq của change xóa, biết đầy đủ từ seq deletions_since (lúc load) trở đi
+        if previous is not None:
+            self.deletions, self.deletions_since = previous.deletions, previous.deletions_since
+        else:
+            self.deletions, self.deletions_since = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)), 0
+
+        # Buffer dư dung lượng của embeddings / product id / cột metadata (append amortized O(1))
+        self.buffers = dict(previous.buffers) if previous is not None else {}
+
+        # product id → dòng của frame (chỉ dòng còn tồn tại), và các cột dùng để hydrate kết quả
+        ids = previous.frame_ids if previous is not None and frame is previous.frame else frame['id'].to_numpy()
+        self.frame_ids = ids
+        id_index = None
+        if previous is not None and frame is previous.frame:
+            id_index = previous.id_index
+        elif previous is not None and _extends(ids, previous.frame_ids):
+            start = len(previous.frame)
+            id_index = previous.id_index.appended(ids[start:], start)
+        if id_index is not None and self.dead_rows is not previous.dead_rows:
+            # Dòng mới bị xóa: bỏ ID khỏi bảng (dead_rows chỉ được thêm khi frame giữ nguyên / được append)
+            dead = np.setdiff1d(self.dead_rows, previous.dead_rows, assume_unique=True)
+            if len(dead) + len(previous.dead_rows) == len(self.dead_rows):
+                id_index = id_index.without(ids[dead])
+            else:
+                id_index = None
+        if id_index is None:
+            live = np.setdiff1d(np.arange(len(ids)), self.dead_rows) if len(self.dead_rows) > 0 else None
+            id_index = IdPositionIndex(ids, live)
+        self.id_index = id_index
+        self._columns = previous._columns if previous is not None and frame is previous.frame else None
+        # ID kế tiếp cho sản phẩm mới - không bao giờ giảm, kể cả khi ID lớn nhất bị xóa / compaction
+        if previous is not None:
+            self.next_id = previous.next_id
+        else:
+            self.next_id = int(max([-1] + [int(values.max()) for values in (ids, self.embedding_ids, self.tombstones.ids())
+                                           if len(values) > 0])) + 1
+
+        # product id → dòng embeddings / slot trong FAISS index
+        same_rows = previous is not None and embedding_ids is previous.embedding_ids
+        if same_rows:
+            self.embedding_rows = previous.embedding_rows
+        elif previous is not None and _extends(self.embedding_ids, previous.embedding_ids):
+            start = len(previous.embedding_ids)
+            self.embedding_rows = previous.embedding_rows.appended(self.embedding_ids[start:], start)
+        else:
+            self.embedding_rows = IdPositionIndex(self.embedding_ids)
+        # slots truyền vào: index là bản copy chỉ bị ghi đè tại slot (cùng bố cục với index của previous)
+        same_index = previous is not None and index is previous.index
+        same_layout = same_index or (previous is not None and slots is not None and slots is previous.slots)
+        self.slots = slots if slots is not None else (previous.slots if same_index else build_slot_table(index))
+
+        # ID đã xóa và ID có vector mới trong delta bị loại khỏi kết quả main index
+        # (excluded truyền vào: tập của previous + các ID vừa xóa / vừa ghi vào delta)
+        if excluded is None:
+            if previous is not None and tombstones is previous.tombstones and delta is previous.delta:
+                excluded = previous.excluded
+            else:
+                excluded_ids = self.tombstones.ids()
+                if delta is not None:
+                    excluded_ids = np.concatenate([excluded_ids, delta.masked_ids()])
+                excluded = ExcludedIds(excluded_ids)
+        self.excluded = excluded
+        if same_layout and excluded is previous.excluded:
+            self.search_params = previous.search_params
+        else:
+            self.search_params = search_parameters(index, excluded)
+
+    @property
+    def metadata_df(self) -> pd.DataFrame:
+        """Các dòng metadata còn tồn tại (frame bỏ dead_rows) - tính lần đầu khi cần rồi giữ lại"""
+        if len(self.dead_rows) == 0:
+            return self.frame
+        if self._metadata_df is None:
+            live = np.ones(len(self.frame), dtype=bool)
+            live[self.dead_rows] = False
+            self._metadata_df = self.frame[live].reset_index(drop=True)
+        return self._metadata_df
+
+    @property
+    def columns(self) -> Dict[str, np.ndarray]:
+        """Các cột RESULT_COLUMNS của frame dạng numpy (hydrate kết quả) - tính lần đầu khi cần rồi giữ lại"""
+        if self._columns is None:
+            self._columns = {
+                column: self.frame[column].to_numpy()
+                for column in RESULT_COLUMNS if column in self.frame.columns
+            }
+        return self._columns
+
+    @property
+    def num_products(self) -> int:
+        """Số sản phẩm còn tồn tại (không cần tạo metadata_df)"""
+        return len(self.frame) - len(self.dead_rows)
+
+    def record_deletions(self, ids, seq: int):
+        """Ghi nhận các ID bị xóa bởi change seq (gọi trước khi publish snapshot)"""
+        ids = np.asarray(ids, dtype=np.int64)
+        self.deletions = (np.concatenate([self.deletions[0], ids]),
+                          np.concatenate([self.deletions[1], np.full(len(ids), seq, dtype=np.int64)]))
+
+    def updated_since(self, seq: int) -> np.ndarray:
+        """Vị trí dòng của frame được thêm / sửa bởi change có seq > seq (cột updated_seq, bỏ dòng đã xóa)"""
+        if 'updated_seq' not in self.frame.columns:
+            return np.zeros(0, dtype=np.int64)
+        updated = pd.to_numeric(self.frame['updated_seq'], errors='coerce').fillna(0).to_numpy()
+        return np.setdiff1d(np.flatnonzero(updated > seq), self.dead_rows, assume_unique=True)
+
+    def deleted_since(self, seq: int) -> np.ndarray:
+        """Product id bị xóa bởi change có seq > seq (chỉ đầy đủ khi seq ≥ deletions_since)"""
+        ids, seqs = self.deletions
+        return ids[seqs > seq]
+
+    def search_rows(self, ids) -> np.ndarray:
+        """product id → dòng embeddings dùng để rescore, -1 với ID bị loại (tombstone / vector mới trong delta)"""
+        rows = self.embedding_rows.lookup(ids)
+        if len(self.excluded) > 0:
+            rows[self.excluded.contains(ids)] = -1
+        return rows
+
+    def replace(self, **components) -> 'CatalogSnapshot':
+        """Snapshot mới với một số thành phần được thay (index, frame, embeddings, embedding_ids, delta...)"""
+        parts = {name: getattr(self, name) for name in SNAPSHOT_COMPONENTS}
+        parts.update(components)
+        return CatalogSnapshot(previous=self, **parts)
+
+    def apply(self, change: CatalogChange) -> 'CatalogSnapshot':
+        """
+        Áp dụng một CatalogChange trong bộ nhớ, trả về snapshot mới (snapshot hiện tại không bị sửa)
+        - Metadata: sửa dòng đã có, thêm dòng mới; dòng bị xóa chỉ được đánh dấu trong dead_rows
+        - Vector: dòng embeddings (overlay cho dòng bị sửa) + vector index (delta nếu bật; không có delta thì
+          ghi đè tại slot nếu index hỗ trợ) + binary codes
+        - Xóa: ghi tombstone, bỏ vector chưa merge trong delta
+        Tập ID bị loại khỏi search được nối tiếp từ snapshot này (không build lại từ tombstone + delta).
+        """
+        buffers = dict(self.buffers)
+        frame = _apply_rows(self.frame, self.id_index, change, buffers)
+        parts = {'frame': frame}
+        excluded_ids = []
+
+        if change.vectors is not None and len(change.rows) > 0:
+            parts.update(self._apply_vectors(change.upserted_ids, change.vectors, buffers))
+            if self.delta is not None:
+                excluded_ids.append(change.upserted_ids)
+
+        if len(change.deleted_ids) > 0:
+            parts['dead_rows'] = self._dead_rows_after(frame, change.deleted_ids)
+            excluded_ids.append(change.deleted_ids)
+            tombstones = self.tombstones.copy()
+            tombstones.add(change.deleted_ids)
+            parts['tombstones'] = tombstones
+            delta = parts.get('delta', self.delta)
+            if delta is not None:
+                delta = delta.copy() if delta is self.delta else delta
+                delta.discard(change.deleted_ids)
+                parts['delta'] = delta
+
+        if excluded_ids:
+            parts['excluded'] = self.excluded.with_ids(np.concatenate(excluded_ids))
+        snapshot = self.replace(**parts)
+        snapshot.buffers.update(buffers)
+        if len(change.rows) > 0:
+            snapshot.next_id = max(snapshot.next_id, int(change.upserted_ids.max()) + 1)
+        return snapshot
+
+    def _dead_rows_after(self, frame: pd.DataFrame, deleted_ids: np.ndarray) -> np.ndarray:
+        """dead_rows + vị trí trong frame (frame của snapshot mới) của các ID bị xóa"""
+        positions = self.id_index.lookup(deleted_ids)
+        added = positions < 0
+        if added.any() and len(frame) > len(self.frame):
+            # ID thêm mới rồi bị xóa trong cùng một change: tìm trong các dòng vừa append
+            appended = IdPositionIndex(frame['id'].to_numpy()[len(self.frame):]).lookup(deleted_ids[added])
+            positions[added] = np.where(appended >= 0, appended + len(self.frame), -1)
+        return np.union1d(self.dead_rows, positions[positions >= 0])
+
+    def _apply_vectors(self, ids: np.ndarray, vectors: np.ndarray, buffers: Dict) -> Dict:
+        """Ghi vector mới của các product id vào embeddings, vector index và binary codes (trên bản copy)"""
+        rows = self.embedding_rows.lookup(ids)
+        existing = rows >= 0
+        embeddings, embedding_ids = self.embeddings, self.embedding_ids
+        if existing.any():
+            # Dòng bị sửa vào overlay của snapshot mới: không copy cả ma trận, memmap giữ nguyên
+            embeddings = OverlayEmbeddings.write(embeddings, rows[existing], vectors[existing])
+        if (~existing).any():
+            # Dòng mới được append vào buffer dư dung lượng (không vstack / concatenate cả catalog)
+            base = embeddings_base(embeddings)
+            buffers['embeddings'], base = AppendBuffer.extend(
+                buffers.get('embeddings'), base, vectors[~existing].astype(base.dtype))
+            embeddings = embeddings.with_base(base) if isinstance(embeddings, OverlayEmbeddings) else base
+            buffers['embedding_ids'], embedding_ids = AppendBuffer.extend(
+                buffers.get('embedding_ids'), embedding_ids, ids[~existing])
+
+        index, delta, slots = self.index, self.delta, None
+        if delta is not None:
+            # Delta bật: mọi vector mới vào delta, vector cũ trong main index bị che tới lần merge (main index giữ nguyên)
+            delta = delta.copy()
+            delta.upsert(vectors, ids)
+        else:
+            in_place = (self.slots.lookup(ids) >= 0) & supports_in_place_update(index)
+            rest = ~in_place
+            # Không có delta: sửa trên bản copy của main index (snapshot đang được đọc không bị đổi) - O(N·d) mỗi lần
+            # ghi; ghi đè slot O(1) thật sự chỉ có qua delta (merge ghi đè tại slot trên một bản copy cho cả delta)
+            index = apply_search_params(faiss.clone_index(index))
+            if in_place.any():
+                # Flat / scalar quantizer: ghi đè code tại slot của ID, không remove/add, không đổi slot
+                replace_vectors(index, vectors[in_place], ids[in_place], self.slots)
+                slots = self.slots
+            if rest.any():
+                # Remove/add theo product id
+                replaced = rest & existing
+                try:
+                    if replaced.any():
+                        index.remove_ids(ids[replaced])
+                        slots = None
+                    elif supports_in_place_update(index):
+                        # Chỉ thêm: vector mới nằm ở các slot cuối, bảng slot được nối tiếp
+                        slots = self.slots.appended(ids[rest], index.ntotal)
+                    add_vectors(index, vectors[rest], ids[rest])
+                except RuntimeError as e:
+                    # HNSW không hỗ trợ remove_ids: build lại từ embeddings (đã chứa vector mới)
+                    print(f"⚠️ Quick update failed: {e} - build lại index")
+                    index, slots = build_index(embeddings, embedding_ids), None
+
+        binary_index = self.binary_index
+        if binary_index is not None:
+            binary_index = binary_index.copy()
+            if existing.any():
+                binary_index.remove(ids[existing])
+            binary_index.add(vectors, ids)
+
+        parts = {'index': index, 'delta': delta, 'embeddings': embeddings,
+                 'embedding_ids': embedding_ids, 'binary_index': binary_index}
+        if slots is not None:
+            parts['slots'] = slots
+        return parts
+
+    def get_product(self, product_id: int) -> Optional[pd.Series]:
+        """Dòng metadata của sản phẩm theo ID (None nếu không tồn tại)"""
+        position = self.id_index.get(product_id)
+        if position is None:
+            return None
+        return self.frame.iloc[position]
+
+    def stats(self) -> Dict:
+        """Thống kê cho /api/stats"""
+        return {
+            'version': self.version,
+            'products': self.num_products,
+            'dead_rows': len(self.dead_rows),
+            'vectors': int(self.index.ntotal),
+            'embedding_rows': len(self.embedding_ids),
+            'next_id': self.next_id,
+            'log_seq': self.log_seq,
+            'embeddings_memory_mapped': is_memory_mapped(self.embeddings),
+            'embedding_overlay_rows': len(self.embeddings.rows) if isinstance(self.embeddings, OverlayEmbeddings) else 0,
+            'metadata_bytes': int(self.frame.memory_usage(deep=False).sum())
+        }
+
+
+# Các thành phần nguồn của snapshot (tham số của CatalogSnapshot)
+SNAPSHOT_COMPONENTS = ('index', 'frame', 'dead_rows', 'embeddings', 'embedding_ids', 'delta', 'tombstones',
+                       'binary_index')
+
+
+def _extends(values: np.ndarray, previous: np.ndarray) -> bool:
+    """values = previous + các dòng append phía sau (view dài hơn của cùng một buffer)"""
+    return len(values) >= len(previous) and (len(previous) == 0 or same_start(values, previous))
+
+
+def _apply_rows(metadata_df: pd.DataFrame, id_index: IdPositionIndex, change: CatalogChange,
+                buffers: Dict) -> pd.DataFrame:
+    """Metadata sau khi sửa/thêm các dòng của change.rows (dòng bị xóa được đánh dấu bằng dead_rows)"""
+    if len(change.rows) > 0:
+        positions = id_index.lookup(change.upserted_ids)
+        existing = positions >= 0
+        if existing.any():
+            rows = change.rows if existing.all() else change.rows[existing]
+            metadata_df = _update_rows(metadata_df, positions[existing], rows)
+        if (~existing).any():
+            rows = change.rows if not existing.any() else change.rows[~existing]
+            metadata_df = _append_rows(metadata_df, rows, buffers)
+    return metadata_df
+
+
+def _update_rows(metadata_df: pd.DataFrame, positions: np.ndarray, rows: pd.DataFrame) -> pd.DataFrame:
+    """
+    Metadata với các dòng ở positions được ghi giá trị của rows (theo thứ tự)
+    Chỉ cột có trong rows được copy, các cột còn lại (kể cả 'id') dùng chung với DataFrame cũ (copy=False).
+    """
+    columns = {}
+    for column in list(metadata_df.columns) + [c for c in rows.columns if c not in metadata_df.columns]:
+        if column not in rows.columns or column == 'id':
+            columns[column] = metadata_df[column]
+            continue
+        values = rows[column].to_numpy()
+        if column in metadata_df.columns:
+            array = metadata_df[column].to_numpy()
+        else:
+            array = np.full(len(metadata_df), np.nan, dtype=object)
+        if array.dtype != values.dtype and not np.can_cast(values.dtype, array.dtype, casting='same_kind'):
+            array = array.astype(object)  # Kiểu của cột không chứa được giá trị mới (vd cột số nhận chuỗi)
+        else:
+            array = array.copy()
+        array[positions] = values
+        columns[column] = pd.Series(array, index=metadata_df.index, dtype=array.dtype, copy=False)
+    return pd.DataFrame(columns, index=metadata_df.index, copy=False)
+
+
+def _append_rows(metadata_df: pd.DataFrame, rows: pd.DataFrame, buffers: Dict) -> pd.DataFrame:
+    """
+    Metadata + các dòng mới: mỗi cột là view của một AppendBuffer (thay cho pd.concat copy cả DataFrame)
+    DataFrame mới được tạo với copy=False nên chi phí là O(số cột + số dòng thêm).
+    metadata_df do lần append trước tạo ra (buffers['frame']): cột lấy thẳng từ buffer, không đọc lại qua pandas.
+    """
+    columns = {}
+    index = pd.RangeIndex(len(metadata_df) + len(rows))
+    from_buffers = buffers.get('frame') is metadata_df
+    for column in list(metadata_df.columns) + [c for c in rows.columns if c not in metadata_df.columns]:
+        values = rows[column].to_numpy() if column in rows.columns else np.full(len(rows), np.nan, dtype=object)
+        key = f"column:{column}"
+        buffer = buffers.get(key)
+        if from_buffers and buffer is not None and len(buffer) == len(metadata_df):
+            base = buffer.view()
+        elif column in metadata_df.columns:
+            base = metadata_df[column].to_numpy()
+        else:
+            base = np.full(len(metadata_df), np.nan, dtype=object)
+        if base.dtype != values.dtype and not np.can_cast(values.dtype, base.dtype, casting='same_kind'):
+            base = base.astype(object)  # vd cột số đọc từ CSV nhận giá trị chuỗi
+        buffers[key], view = AppendBuffer.extend(buffer, base, values)
+        columns[column] = pd.Series(view, index=index, dtype=view.dtype, copy=False)
+    buffers['frame'] = pd.DataFrame(columns, index=index, copy=False)
+    return buffers['frame']
+
+
+def save_snapshot_files(snapshot: CatalogSnapshot, paths: Dict[str, str],
+                        previous: Optional[CatalogSnapshot] = None) -> List[str]:
+    """
+    Ghi vào paths file của những thành phần đã đổi so với previous (None: ghi tất cả)
+    Trả về các key (theo snapshot_dir.COMPONENT_FILES) đã ghi; thành phần còn lại được carry_over từ generation trước.
+    """
+    def changed(name):
+        return previous is None or getattr(snapshot, name) is not getattr(previous, name)
+
+    written = []
+    if changed('frame') or changed('dead_rows'):
+        snapshot.metadata_df.to_csv(paths['metadata'], index=False)
+        written.append('metadata')
+    if changed('embeddings') or changed('embedding_ids'):
+        save_embeddings(paths['embeddings'], snapshot.embeddings, ids=snapshot.embedding_ids)
+        written.append('embeddings')
+    if changed('index'):
+        faiss.write_index(snapshot.index, paths['faiss_index'])
+        written.append('faiss_index')
+    if snapshot.delta is not None and changed('delta'):
+        snapshot.delta.save(paths['delta_index'])
+        written.append('delta_index')
+    if changed('tombstones'):
+        snapshot.tombstones.save(paths['tombstones'])
+        written.append('tombstones')
+    if snapshot.binary_index is not None and changed('binary_index'):
+        snapshot.binary_index.save(paths['binary_index'])
+        written.append('binary_index')
+    return written
+
+
+def load_snapshot(paths: Optional[Dict[str, str]] = None) -> CatalogSnapshot:
+    """Đọc toàn bộ catalog từ các file trong paths (mặc định: file trong data/), embeddings memory-mapped"""
+    paths = paths or legacy_paths()
+    index = apply_search_params(faiss.read_index(paths['faiss_index']))
+    metadata_df = pd.read_csv(paths['metadata'])
+    # Cột chuỗi giữ dạng object: to_numpy() (hydrate kết quả, update / append dòng) không phải chuyển đổi cả cột
+    for column in metadata_df.columns:
+        if isinstance(metadata_df[column].dtype, pd.StringDtype):
+            metadata_df[column] = metadata_df[column].astype(object)
+    embeddings = load_embeddings(paths['embeddings'])
+    embedding_ids = load_embedding_ids(paths['embeddings'], metadata_df['id'].values)
+    delta = DeltaIndex.load(paths['delta_index']) if DELTA_INDEX['enabled'] else None
+    binary_index = (load_or_build_binary_index(embeddings, embedding_ids, paths['binary_index'])
+                    if BINARY_SEARCH['enabled'] else None)
+    return CatalogSnapshot(index, metadata_df, embeddings, embedding_ids, delta,
+                           TombstoneSet.load(paths['tombstones']), binary_index)
+
+
+class ChangeJournal:
+    """Các change được commit sau snapshot base (merge / compaction build trên base, replay phần này lúc publish)"""
+
+    def __init__(self, base: CatalogSnapshot):
+        self.base = base
+        self.changes: List[CatalogChange] = []
+        self.valid = True   # False: thành phần của snapshot đã bị thay bằng đường khác (reload, replace, rebase)
+
+
+class ProductStore:
+    """
+    Giữ snapshot catalog hiện tại; publish snapshot mới là một phép gán tham chiếu (atomic)
+    WAL bật: commit chỉ append change vào log, checkpoint() ghi thư mục snapshot mới và cắt log.
+    """
+
+    def __init__(self, load: bool = True):
+        """Khởi tạo store (load=True: đọc catalog từ đĩa ngay)"""
+        self._snapshot = None
+        self._version = 0
+        self._publish_lock = threading.Lock()
+        self._commit_lock = threading.RLock()       # apply + append log + publish là một bước
+        self._checkpoint_lock = threading.Lock()    # Thứ tự lock: _checkpoint_lock rồi mới _commit_lock
+        self._checkpointed = None                   # Snapshot tương ứng với generation trên đĩa
+        self._manifest = None                       # Manifest của generation đó (None: file trong data/)
+        self._checkpoint_time = time.time()
+        self._checkpoint_pending = False
+        self._journals: List[ChangeJournal] = []    # Journal của các merge / compaction đang build
+        self.log = CatalogLog() if WAL['enabled'] else None
+        # True: commit không tự fsync log, bên gọi gọi sync() sau khi nhả lock ghi (group commit)
+        self.defer_sync = False
+        # True: replace(persist=True) chỉ đánh dấu cần checkpoint, thread nền của bên gọi chạy checkpoint()
+        self.background_checkpoint = False
+        if load:
+            self.reload()
+
+    def snapshot(self) -> Optional[CatalogSnapshot]:
+        """Snapshot hiện tại (None nếu chưa load được dữ liệu)"""
+        return self._snapshot
+
+    def publish(self, snapshot: CatalogSnapshot) -> CatalogSnapshot:
+        """Thay snapshot hiện tại; reader đang giữ snapshot cũ vẫn dùng được tới khi xong request"""
+        with self._publish_lock:
+            self._version += 1
+            snapshot.version = self._version
+            self._snapshot = snapshot
+        return snapshot
+
+    def commit(self, change: CatalogChange, persist: bool = True) -> CatalogSnapshot:
+        """
+        Áp dụng change trong bộ nhớ, ghi bền vững rồi publish (không đọc lại gì từ đĩa)
+        - WAL bật: append change vào log (fsync ngay, hoặc ở sync() nếu defer_sync)
+        - WAL tắt: checkpoint ngay (ghi generation mới với các file bị đổi)
+        Mỗi change có seq tăng dần (bền vững qua restart): dòng được ghi kèm cột updated_seq, ID xóa
+        được ghi vào snapshot.deletions - dùng cho export tăng dần (since_generation).
+        Gọi khi giữ lock ghi (các writer commit lần lượt).
+        """
+        with self._commit_lock:
+            seq = (self.log.last_seq if persist and self.log is not None else self._snapshot.log_seq) + 1
+            if len(change.rows) > 0:
+                change.rows['updated_seq'] = seq
+            snapshot = self._snapshot.apply(change)
+            snapshot.log_seq = self.log.append(change) if persist and self.log is not None else seq
+            if len(change.deleted_ids) > 0:
+                snapshot.record_deletions(change.deleted_ids, snapshot.log_seq)
+            snapshot = self.publish(snapshot)
+            for journal in self._journals:
+                journal.changes.append(change)
+        if persist and self.log is None:
+            self.checkpoint()
+        elif persist and not self.defer_sync:
+            self.log.sync(snapshot.log_seq)
+        return snapshot
+
+    def sync(self):
+        """Chờ mọi change đã commit được fsync vào log (group commit: nhiều writer dùng chung một fsync)"""
+        if self.log is not None:
+            self.log.sync()
+
+    def replace(self, persist: bool = False, **components) -> CatalogSnapshot:
+        """
+        Publish snapshot với một số thành phần được thay (vd index / embeddings build lại từ metadata)
+        Merge / compaction nền dùng rebase() để giữ các change commit trong lúc build.
+        persist=True: checkpoint snapshot mới (background_checkpoint: để thread nền ghi).
+        Chưa checkpoint mà crash thì load lại generation trước + replay log - chỉ mất kết quả merge / compaction.
+        """
+        with self._commit_lock:
+            self._invalidate_journals()
+            self.publish(self._snapshot.replace(**components))
+        self._persist_replaced(persist)
+        return self._snapshot
+
+    @contextmanager
+    def rebuild(self) -> Iterator[ChangeJournal]:
+        """
+        Journal cho một merge / compaction chạy nền: base = snapshot hiện tại, ghi lại mọi change commit sau đó
+        Kết quả build từ journal.base được publish bằng rebase(); journal bị bỏ khi ra khỏi with.
+        """
+        with self._commit_lock:
+            journal = ChangeJournal(self._snapshot)
+            self._journals.append(journal)
+        try:
+            yield journal
+        finally:
+            with self._commit_lock:
+                if journal in self._journals:
+                    self._journals.remove(journal)
+
+    def rebase(self, journal: ChangeJournal, snapshot: CatalogSnapshot,
+               persist: bool = False) -> Optional[CatalogSnapshot]:
+        """
+        Publish snapshot (build từ journal.base, vd main index đã merge / đã compaction) sau khi replay
+        các change commit trong lúc build - không bỏ kết quả chỉ vì có add/update/delete chen vào.
+        Trả về None nếu journal không còn hợp lệ (reload / replace / rebase khác đã publish trong lúc build).
+        """
+        with self._commit_lock:
+            if not journal.valid:
+                return None
+            current = self._snapshot
+            for change in CatalogChange.batches(journal.changes):
+                snapshot = snapshot.apply(change)
+            snapshot.log_seq = current.log_seq
+            snapshot.deletions, snapshot.deletions_since = current.deletions, current.deletions_since
+            snapshot.next_id = max(snapshot.next_id, current.next_id)
+            self._invalidate_journals()
+            snapshot = self.publish(snapshot)
+        self._persist_replaced(persist)
+        return snapshot
+
+    def _invalidate_journals(self):
+        """Snapshot sắp publish không đi từ base của các journal đang mở → replay không còn đúng"""
+        for journal in self._journals:
+            journal.valid = False
+
+    def _persist_replaced(self, persist: bool):
+        """Checkpoint sau replace / rebase (background_checkpoint: chỉ đánh dấu cho thread nền)"""
+        if persist and self.background_checkpoint and self.log is not None:
+            self._checkpoint_pending = True
+        elif persist:
+            self.checkpoint()
+
+    def should_checkpoint(self) -> bool:
+        """
+        Có thay đổi chưa nằm trong generation trên đĩa và: replace(persist=True) đang chờ, log đã vượt
+        checkpoint_bytes, hoặc checkpoint gần nhất đã quá checkpoint_interval_s
+        """
+        if self._checkpoint_pending:
+            return True
+        if self.log is None or self.log.size == 0:
+            return False
+        return (self.log.size >= WAL['checkpoint_bytes']
+                or time.time() - self._checkpoint_time >= WAL['checkpoint_interval_s'])
+
+    def checkpoint(self) -> bool:
+        """
+        Ghi snapshot hiện tại thành generation mới rồi đổi con trỏ CURRENT, sau đó cắt log
+        - Chỉ thành phần đổi từ generation trước được ghi, còn lại hard-link
+        - Writer vẫn commit được trong lúc ghi; record append sau snapshot được giữ lại trong log
+        - Crash trước khi đổi CURRENT: generation cũ + log vẫn nguyên vẹn, thư mục dở dang bị dọn lần sau
+        """
+        with self._checkpoint_lock:
+            self._checkpoint_pending = False
+            snapshot = self._snapshot
+            if snapshot is None or snapshot is self._checkpointed:
+                return False
+            start = time.time()
+            previous = self._manifest
+            generation = (previous['generation'] if previous else 0) + 1
+            directory = begin_snapshot(generation)
+            paths = snapshot_paths(directory)
+            written = save_snapshot_files(snapshot, paths, self._checkpointed)
+            linked = [key for key in COMPONENT_FILES if key not in written]
+            source = snapshot_paths(previous['directory']) if previous else legacy_paths()
+            # File trong data/ có thể bị preprocess.py / embedding.py ghi đè tại chỗ nên copy thay vì link
+            carry_over(linked, source, paths, link=previous is not None)
+            self._manifest = publish_snapshot(
+                directory, generation, snapshot.log_seq, previous, linked,
+                products=snapshot.num_products, vectors=int(snapshot.index.ntotal), next_id=snapshot.next_id
+            )
+            if self.log is not None:
+                self.log.truncate_through(snapshot.log_seq)
+
+            checkpointed = snapshot
+            if 'embeddings' in written:
+                # Embeddings vừa ghi được memory-map lại (snapshot hiện tại vẫn dùng cùng embeddings thì thay luôn)
+                mapped = load_embeddings(snapshot_paths(self._manifest['directory'])['embeddings'])
+                checkpointed = snapshot.replace(embeddings=mapped)
+                with self._commit_lock:
+                    current = self._snapshot
+                    if current.embeddings is snapshot.embeddings:
+                        self.publish(current.replace(embeddings=mapped))
+                    elif (current.embedding_ids is snapshot.embedding_ids
+                          and isinstance(current.embeddings, OverlayEmbeddings)
+                          and current.embeddings.base is embeddings_base(snapshot.embeddings)):
+                        # Chỉ có update sau snapshot đã ghi: đặt các dòng đó lên bản memory-map mới
+                        self.publish(current.replace(embeddings=current.embeddings.rebased(snapshot.embeddings, mapped)))
+            self._checkpointed = checkpointed
+            self._checkpoint_time = time.time()
+            print(f"💾 Checkpoint gen {generation} (log seq {snapshot.log_seq}): {snapshot.num_products} products, "
+                  f"ghi {written or 'không file nào'} ({(time.time() - start) * 1000:.0f}ms)")
+            return True
+
+    def reload(self) -> Optional[CatalogSnapshot]:
+        """Đọc lại catalog từ đĩa: generation hiện tại (data/CURRENT) + replay phần log sau nó, rồi publish"""
+        try:
+            with self._checkpoint_lock, self._commit_lock:
+                self._invalidate_journals()
+                manifest = read_current()
+                if manifest is not None and SNAPSHOTS['verify_checksums']:
+                    verify_manifest(manifest)
+                paths = snapshot_paths(manifest['directory']) if manifest else legacy_paths()
+                base = snapshot = load_snapshot(paths)
+                base.log_seq = base.deletions_since = manifest['log_seq'] if manifest else 0
+                if manifest is not None:
+                    # ID lớn nhất có thể đã bị xóa + compaction trước checkpoint: không cấp lại ID đó
+                    base.next_id = max(base.next_id, manifest.get('next_id', 0))
+                if self.log is not None:
+                    records = list(self.log.records(after_seq=base.log_seq))
+                    changes = (CatalogChange(rows, vectors, deleted_ids) for _, rows, vectors, deleted_ids in records)
+                    for change in CatalogChange.batches(changes):
+                        snapshot = snapshot.apply(change)
+                    for seq, _, _, deleted_ids in records:
+                        if len(deleted_ids) > 0:
+                            snapshot.record_deletions(deleted_ids, seq)
+                    if records:
+                        snapshot.log_seq = records[-1][0]
+                        print(f"📜 Replayed {len(records)} catalog log records "
+                              f"(seq {base.log_seq + 1}..{snapshot.log_seq})")
+                    self.log.open(snapshot.log_seq)
+                self._checkpointed, self._manifest = base, manifest
+                self._checkpoint_time = time.time()
+                snapshot = self.publish(snapshot)
+            print(f"✅ ProductStore loaded v{snapshot.version} (gen {manifest['generation'] if manifest else 0}): "
+                  f"{snapshot.index.ntotal} vectors, {snapshot.num_products} products")
+            if snapshot.delta is None:
+                print("⚠️ DELTA_INDEX tắt: mỗi lần add/update vector copy cả main index - bật delta để ghi O(1)")
+            return snapshot
+        except (FileNotFoundError, ValueError) as e:
+            print(f"❌ Error loading catalog: {e}")
+            return self._snapshot
+
+    def stats(self) -> Optional[Dict]:
+        """Thống kê của snapshot hiện tại"""
+        if self._snapshot is None:
+            return None
+        stats = self._snapshot.stats()
+        stats['generation'] = self._manifest['generation'] if self._manifest else 0
+        stats['log'] = self.log.stats() if self.log is not None else None
+        return stats
+
+
+class CatalogView:
+    """
+    Thuộc tính chỉ đọc trỏ vào snapshot hiện tại của self.store (searcher / manager không giữ bản copy riêng)
+    Code chạy nhiều bước nên lấy snapshot một lần (self.store.snapshot()) thay vì đọc thuộc tính nhiều lần.
+    """
+
+    def _snapshot_attr(self, name: str):
+        snapshot = self.store.snapshot() if getattr(self, 'store', None) is not None else None
+        return getattr(snapshot, name) if snapshot is not None else None
+
+    index = property(lambda self: self._snapshot_attr('index'))
+    metadata_df = property(lambda self: self._snapshot_attr('metadata_df'))
+    embeddings = property(lambda self: self._snapshot_attr('embeddings'))
+    embedding_ids = property(lambda self: self._snapshot_attr('embedding_ids'))
+    delta = property(lambda self: self._snapshot_attr('delta'))
+    tombstones = property(lambda self: self._snapshot_attr('tombstones'))
+    binary_index = property(lambda self: self._snapshot_attr('binary_index'))
+    id_index = property(lambda self: self._snapshot_attr('id_index'))
+    slots = property(lambda self: self._snapshot_attr('slots'))
+
+    def get_product(self, product_id: int) -> Optional[pd.Series]:
+        """Dòng metadata của sản phẩm theo ID trên snapshot hiện tại (None nếu không tồn tại)"""
+        snapshot = self.store.snapshot() if getattr(self, 'store', None) is not None else None
+        return snapshot.get_product(product_id) if snapshot is not None else None
@@ -0,0 +1,119 @@
+"""
+Giảm chiều vector cho FAISS index
+- PCA train lúc build index, hoặc cắt prefix (Matryoshka truncation)
+- Lưu cạnh faiss_index.index (data/projection.npz), mọi đường build/add/update/search dùng cùng một transform
+- Kết quả top candidates được rescore bằng vector đầy đủ (xem index_factory.search_with_rescoring)
+"""
+
+import os
+import sys
+import numpy as np
+import faiss
+from typing import Optional
+
+# Add config path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'config'))
+from simple_config import DATA_PATHS, PROJECTION
+
+PROJECTION_METHODS = ('pca', 'truncate')
+
+# Cache projection đã load theo (path, mtime) để add/update không đọc lại file mỗi lần
+_loaded_projection = {}
+
+
+class Projection:
+    """Linear projection input_dim → output_dim: (x - mean) @ components, rồi normalize L2"""
+
+    def __init__(self, method: str, mean: np.ndarray, components: np.ndarray):
+        """components: [input_dim, output_dim]"""
+        if method not in PROJECTION_METHODS:
+            raise ValueError(f"Projection method không hỗ trợ: {method}")
+        self.method = method
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.components = np.ascontiguousarray(components, dtype=np.float32)
+
+    @property
+    def input_dim(self) -> int:
+        return self.components.shape[0]
+
+    @property
+    def output_dim(self) -> int:
+        return self.components.shape[1]
+
+    @classmethod
+    def fit(cls, embeddings, method: Optional[str] = None, output_dim: Optional[int] = None,
+            sample_size: Optional[int] = None, block_size: int = 100000) -> 'Projection':
+        """Train projection từ embeddings (PCA trên một sample, tính covariance theo block)"""
+        method = method or PROJECTION['method']
+        output_dim = output_dim or PROJECTION['dim']
+        sample_size = sample_size or PROJECTION['train_sample_size']
+        num_vectors, input_dim = embeddings.shape
+        if output_dim >= input_dim:
+            raise ValueError(f"Projection dim {output_dim} phải nhỏ hơn dimension {input_dim}")
+
+        if method == 'truncate':
+            # Giữ prefix output_dim chiều (model Matryoshka dồn thông tin vào các chiều đầu)
+            return cls(method, np.zeros(input_dim, dtype=np.float32), np.eye(input_dim, output_dim, dtype=np.float32))
+
+        rng = np.random.default_rng(0)
+        rows = np.sort(rng.choice(num_vectors, size=min(num_vectors, sample_size), replace=False))
+
+        mean = np.zeros(input_dim, dtype=np.float64)
+        for start in range(0, len(rows), block_size):
+            mean += np.asarray(embeddings[rows[start:start + block_size]], dtype=np.float64).sum(axis=0)
+        mean /= len(rows)
+
+        covariance = np.zeros((input_dim, input_dim), dtype=np.float64)
+        for start in range(0, len(rows), block_size):
+            block = np.asarray(embeddings[rows[start:start + block_size]], dtype=np.float64) - mean
+            covariance += block.T @ block
+
+        eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+        top = np.argsort(eigenvalues)[::-1][:output_dim]
+        explained = eigenvalues[top].sum() / max(eigenvalues.sum(), 1e-12)
+        print(f"📐 PCA {input_dim} → {output_dim} dims, explained variance {explained * 100:.1f}%")
+        return cls(method, mean, eigenvectors[:, top])
+
+    def apply(self, vectors) -> np.ndarray:
+        """Project vectors [n, input_dim] → [n, output_dim] float32 đã normalize L2"""
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.input_dim)
+        projected = np.ascontiguousarray((vectors - self.mean) @ self.components, dtype=np.float32)
+        if len(projected) > 0:
+            faiss.normalize_L2(projected)
+        return projected
+
+    def save(self, path: Optional[str] = None) -> str:
+        """Lưu projection (ghi file tạm rồi os.replace)"""
+        path = path or DATA_PATHS['projection']
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_path, method=self.method, mean=self.mean, components=self.components)
+        os.replace(tmp_path, path)
+        return path
+
+    @classmethod
+    def load(cls, path: Optional[str] = None) -> 'Projection':
+        """Load projection từ file .npz"""
+        with np.load(path or DATA_PATHS['projection']) as data:
+            return cls(str(data['method']), data['mean'], data['components'])
+
+
+def load_projection(path: Optional[str] = None) -> Optional[Projection]:
+    """Load projection đang dùng (None nếu chưa có file), cache theo mtime của file"""
+    path = path or DATA_PATHS['projection']
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    cached = _loaded_projection.get(path)
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, Projection.load(path))
+        _loaded_projection[path] = cached
+    return cached[1]
+
+
+def remove_projection(path: Optional[str] = None):
+    """Xóa file projection (khi build lại index không giảm chiều)"""
+    path = path or DATA_PATHS['projection']
+    if os.path.exists(path):
+        os.remove(path)
+    _loaded_projection.pop(path, None)
@@ -2,24 +2,27 @@ import os
 import sys
 import pandas as pd
 import numpy as np
-import faiss
 import torch
 import time
+import threading
 from sentence_transformers import SentenceTransformer, CrossEncoder
 from transformers import AutoTokenizer
 import ast
 import json
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Optional
 import re
 import torch.nn as nn
 from embedding import load_embedding_model
+from cache import QueryEmbeddingCache, CrossEncoderScoreCache
+from index_factory import search_with_rescoring, has_product_ids
+from product_store import ProductStore, CatalogView, CatalogSnapshot
 
 # Add config path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'config'))
 from simple_config import (
-    EMBEDDING_MODEL_NAME, CROSS_ENCODER_MODEL_NAME, DATA_PATHS, 
+    EMBEDDING_MODEL_NAME, CROSS_ENCODER_MODEL_NAME,
     DEFAULT_TOP_K, RETRIEVAL_K, MAX_TOP_K, DEFAULT_SEARCH_METHOD,
-    EXIT_COMMANDS, BATCH_SIZE, get_device, get_global_embedding_model, 
+    EXIT_COMMANDS, BATCH_SIZE, QUERY_CACHE, SCORE_CACHE, get_device, get_global_embedding_model, 
     get_global_cross_encoder, monitor_gpu_memory
 )
 
@@ -84,6 +87,30 @@ def hybrid_search(query, top_k=None, retrieval_k=None, use_current_db=False):
     
     return formatted_results
 
+def search_batch(queries, method=None, top_k=None, retrieval_k=None):
+    """Search nhiều query cùng lúc, trả về list kết quả cùng format với bi_encoder_search/hybrid_search"""
+    searcher = get_global_searcher()
+    if method is None:
+        method = DEFAULT_SEARCH_METHOD
+    if top_k is None:
+        top_k = DEFAULT_TOP_K
+    if retrieval_k is None:
+        retrieval_k = RETRIEVAL_K
+    
+    batch_results = searcher.search_batch(queries, method, top_k, retrieval_k)
+    
+    formatted_batch = []
+    for results, scores in batch_results:
+        formatted_results = []
+        for i, (result, score) in enumerate(zip(results, scores)):
+            formatted_result = result.copy()
+            formatted_result['score'] = score
+            formatted_result['rank'] = i + 1
+            formatted_results.append(formatted_result)
+        formatted_batch.append(formatted_results)
+    
+    return formatted_batch
+
 def search_current_database(query, method=None, top_k=None):
     """Backward compatibility function"""
     searcher = get_global_searcher()
@@ -189,94 +216,181 @@ def interactive_search():
             print(f"❌ Error during search: {str(e)}")
 
 
-class ProductSearcher:
-    """Class để encapsulate search functionality cho các module khác"""
+class ProductSearcher(CatalogView):
+    """
+    Class để encapsulate search functionality cho các module khác
+    Index / metadata / embeddings đọc từ ProductStore dùng chung; mỗi lần search lấy snapshot một lần
+    nên không cần lock và không thấy trạng thái ghi dở.
+    """
     
-    def __init__(self):
-        """Khởi tạo ProductSearcher"""
+    def __init__(self, store: Optional[ProductStore] = None):
+        """Khởi tạo ProductSearcher (store: ProductStore dùng chung, tạo mới nếu không truyền)"""
+        self.store = store
         self.model, self.tokenizer = load_embedding_model()
         self.cross_encoder = CrossEncoder(CROSS_ENCODER_MODEL_NAME)
+        self.query_cache = QueryEmbeddingCache(
+            EMBEDDING_MODEL_NAME,
+            max_size=QUERY_CACHE['max_size'],
+            ttl_seconds=QUERY_CACHE['ttl_seconds'],
+            disk_dir=QUERY_CACHE['disk_dir']
+        ) if QUERY_CACHE['enabled'] else None
+        self.score_cache = CrossEncoderScoreCache(
+            max_size=SCORE_CACHE['max_size'],
+            ttl_seconds=SCORE_CACHE['ttl_seconds']
+        ) if SCORE_CACHE['enabled'] else None
+        self.generation = 0  # Tăng sau mỗi lần add/update/delete thành công
+        self._generation_lock = threading.Lock()
         self._load_data()
     
     def _load_data(self):
-        """Load/reload index và metadata"""
-        try:
-            self.index = faiss.read_index(DATA_PATHS['faiss_index'])
-            self.metadata_df = pd.read_csv(DATA_PATHS['metadata'])
-            print(f"✅ ProductSearcher loaded: {self.index.ntotal} vectors, {len(self.metadata_df)} products")
-        except FileNotFoundError as e:
-            print(f"❌ Error loading search data: {e}")
-            self.index = None
-            self.metadata_df = None
+        """Load/reload index và metadata (đọc lại từ đĩa và publish snapshot mới của store)"""
+        if self.store is None:
+            self.store = ProductStore()
+        else:
+            self.store.reload()
+        snapshot = self.store.snapshot()
+        if snapshot is not None:
+            if snapshot.index.d != snapshot.embeddings.shape[1]:
+                print(f"✅ Projected index: {snapshot.index.d} dims, rescoring với {snapshot.embeddings.shape[1]} dims")
+            if snapshot.binary_index is not None:
+                print(f"✅ Binary first stage enabled: {snapshot.binary_index.ntotal} codes")
+            print(f"✅ ProductSearcher loaded: {snapshot.index.ntotal} vectors, {snapshot.num_products} products")
     
-    def bi_encoder_search(self, query: str, top_k: int = 5) -> Tuple[List[Dict], List[float]]:
-        """Bi-encoder search"""
-        if self.index is None or self.metadata_df is None:
-            return [], []
+    def bump_generation(self) -> int:
+        """Tăng generation của index (gọi sau mỗi thay đổi database)"""
+        with self._generation_lock:
+            self.generation += 1
+            return self.generation
+    
+    def get_product(self, product_id: int) -> Optional[pd.Series]:
+        """Lấy dòng metadata của sản phẩm theo ID (None nếu không tồn tại)"""
+        snapshot = self.store.snapshot()
+        return snapshot.get_product(product_id) if snapshot is not None else None
+    
+    def _hydrate_results(self, snapshot: CatalogSnapshot, scores: np.ndarray, ids: np.ndarray,
+                         response_time: float) -> Tuple[List[Dict], List[float]]:
+        """Chuyển 1 hàng kết quả FAISS thành danh sách sản phẩm bằng một lần take trên từng cột"""
+        # Kiểm tra xem index có trả về ID thực không (IndexIDMap / IVF, binary first stage cũng trả về ID thực)
+        if has_product_ids(snapshot.index) or snapshot.binary_index is not None:
+            # IndexIDMap / IVF - idx là ID thực
+            positions = snapshot.id_index.lookup(ids)
+        else:
+            # Regular index - idx là array position
+            positions = np.where((ids >= 0) & (ids < len(snapshot.frame)), ids, -1)
         
-        start_time = time.time()
+        keep = (scores > 0) & (positions >= 0)  # Có kết quả
+        positions = positions[keep]
+        kept_scores = scores[keep]
         
-        # Tạo embedding cho query
-        query_embedding = self.model.encode(
-            query, 
+        gathered = {column: values[positions] for column, values in snapshot.columns.items()}
+        empty = [''] * len(positions)
+        
+        results = []
+        for i in range(len(positions)):
+            results.append({
+                'id': gathered['id'][i],
+                'name': gathered['name'][i],
+                'brand': gathered['brand'][i],
+                'ingredients': gathered.get('ingredients', empty)[i],
+                'categories': gathered.get('categories', empty)[i],
+                'manufacturer': gathered.get('manufacturer', empty)[i],
+                'manufacturerNumber': gathered.get('manufacturerNumber', empty)[i],
+                'text_corpus': gathered['text_corpus'][i],
+                'time': response_time  # Thêm thời gian
+            })
+        
+        return results, [float(score) for score in kept_scores]
+    
+    def _encode_queries(self, queries: List[str]) -> np.ndarray:
+        """Encode danh sách query, đi qua query embedding cache nếu được bật"""
+        if self.query_cache is not None:
+            return self.query_cache.encode(queries, self._encode_with_model)
+        return self._encode_with_model(queries)
+    
+    def _encode_with_model(self, queries: List[str]) -> np.ndarray:
+        """Encode danh sách query trong một lần forward (padded batch)"""
+        query_embeddings = self.model.encode(
+            queries, 
             batch_size=BATCH_SIZE,
             show_progress_bar=False,
             normalize_embeddings=True,
             device=DEVICE,
             convert_to_tensor=True
-        ).cpu().numpy().reshape(1, -1)
+        )
+        return query_embeddings.cpu().numpy().reshape(len(queries), -1)
+    
+    def _predict_pairs(self, pairs: List[Tuple[str, str]]) -> np.ndarray:
+        """Gọi cross-encoder cho danh sách cặp (query, text) trong một lần predict"""
+        return self.cross_encoder.predict(pairs, batch_size=BATCH_SIZE, show_progress_bar=False)
+    
+    def _cross_scores(self, queries: List[str], results: List[Dict]) -> np.ndarray:
+        """Score cross-encoder cho các cặp (queries[i], results[i]), chỉ gọi model cho cặp chưa cache"""
+        if not results:
+            return np.zeros(0, dtype=np.float32)
+        if self.score_cache is not None:
+            items = [(query, result['id'], result['text_corpus']) for query, result in zip(queries, results)]
+            return self.score_cache.score_pairs(items, self._predict_pairs)
+        return self._predict_pairs([(query, result['text_corpus']) for query, result in zip(queries, results)])
+    
+    def _rerank(self, bi_results: List[Dict], cross_scores, top_k: int, total_time: float) -> Tuple[List[Dict], List[float]]:
+        """Sắp xếp kết quả bi-encoder theo cross-encoder score và lấy top-k"""
+        # Kết hợp scores và sắp xếp
+        combined_results = list(zip(bi_results, cross_scores))
+        combined_results.sort(key=lambda x: x[1], reverse=True)
         
-        # Search trong FAISS index
-        scores, indices = self.index.search(query_embedding, top_k)
-        response_time = (time.time() - start_time) * 1000  # Convert to ms
+        # Lấy top-k kết quả
+        final_results = []
+        final_scores = []
         
-        results = []
-        result_scores = []
+        for result, score in combined_results[:top_k]:
+            # Cập nhật thời gian cho từng kết quả
+            result['time'] = total_time
+            final_results.append(result)
+            final_scores.append(float(score))
         
-        for score, idx in zip(scores[0], indices[0]):
-            if score > 0:  # Có kết quả
-                # Kiểm tra xem index có phải IndexIDMap không
-                if hasattr(self.index, 'index_to_id'):
-                    # IndexIDMap - idx là ID thực
-                    row = self.metadata_df[self.metadata_df['id'] == idx]
-                    if not row.empty:
-                        row = row.iloc[0]
-                        result = {
-                            'id': row['id'],
-                            'name': row['name'],
-                            'brand': row['brand'],
-                            'ingredients': row.get('ingredients', ''),
-                            'categories': row.get('categories', ''),
-                            'manufacturer': row.get('manufacturer', ''),
-                            'manufacturerNumber': row.get('manufacturerNumber', ''),
-                            'text_corpus': row['text_corpus'],
-                            'time': response_time  # Thêm thời gian
-                        }
-                        results.append(result)
-                        result_scores.append(float(score))
-                else:
-                    # Regular index - idx là array position
-                    if idx < len(self.metadata_df):
-                        row = self.metadata_df.iloc[idx]
-                        result = {
-                            'id': row['id'],
-                            'name': row['name'],
-                            'brand': row['brand'],
-                            'ingredients': row.get('ingredients', ''),
-                            'categories': row.get('categories', ''),
-                            'manufacturer': row.get('manufacturer', ''),
-                            'manufacturerNumber': row.get('manufacturerNumber', ''),
-                            'text_corpus': row['text_corpus'],
-                            'time': response_time  # Thêm thời gian
-                        }
-                        results.append(result)
-                        result_scores.append(float(score))
+        return final_results, final_scores
+    
+    def _vector_search(self, snapshot: CatalogSnapshot, query_embeddings: np.ndarray,
+                       k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Tìm top-k (scores, ids) cho các query embedding: main index merge với delta index (nếu bật)"""
+        def main_search(queries, main_k):
+            return self._main_search(snapshot, queries, main_k)
         
-        return results, result_scores
+        if snapshot.delta is not None:
+            return snapshot.delta.search(main_search, query_embeddings, k)
+        return main_search(query_embeddings, k)
+    
+    def _main_search(self, snapshot: CatalogSnapshot, query_embeddings: np.ndarray,
+                     k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Search main index: binary two-phase nếu bật, ngược lại FAISS index (rescore nếu giảm chiều)
+        ID bị loại (tombstone + delta) được bỏ bằng IDSelector, hoặc lúc rescore vì không có trong search_rows
+        """
+        if snapshot.binary_index is not None:
+            return snapshot.binary_index.search(query_embeddings, k, snapshot.embeddings, snapshot.search_rows)
+        return search_with_rescoring(snapshot.index, query_embeddings, k, snapshot.embeddings,
+                                     snapshot.search_rows, params=snapshot.search_params)
+    
+    def bi_encoder_search(self, query: str, top_k: int = 5) -> Tuple[List[Dict], List[float]]:
+        """Bi-encoder search"""
+        snapshot = self.store.snapshot()
+        if snapshot is None:
+            return [], []
+        
+        start_time = time.time()
+        
+        # Tạo embedding cho query
+        query_embedding = self._encode_queries([query])
+        
+        # Search trong FAISS index
+        scores, indices = self._vector_search(snapshot, query_embedding, top_k)
+        response_time = (time.time() - start_time) * 1000  # Convert to ms
+        
+        return self._hydrate_results(snapshot, scores[0], indices[0], response_time)
     
     def hybrid_search(self, query: str, top_k: int = 5, retrieval_k: int = 20) -> Tuple[List[Dict], List[float]]:
         """Hybrid search với bi-encoder + cross-encoder"""
-        if self.index is None or self.metadata_df is None:
+        if self.store.snapshot() is None:
             return [], []
         
         start_time = time.time()
@@ -287,28 +401,63 @@ class ProductSearcher:
         if not bi_results:
             return [], []
         
-        # Stage 2: Cross-encoder re-ranking
-        pairs = [(query, result['text_corpus']) for result in bi_results]
-        cross_scores = self.cross_encoder.predict(pairs)
-        
-        # Kết hợp scores và sắp xếp
-        combined_results = list(zip(bi_results, cross_scores))
-        combined_results.sort(key=lambda x: x[1], reverse=True)
+        # Stage 2: Cross-encoder re-ranking (score cache trước, chỉ cặp chưa cache mới qua model)
+        cross_scores = self._cross_scores([query] * len(bi_results), bi_results)
         
         # Tính tổng thời gian
         total_time = (time.time() - start_time) * 1000  # Convert to ms
         
-        # Lấy top-k kết quả
-        final_results = []
-        final_scores = []
+        return self._rerank(bi_results, cross_scores, top_k, total_time)
+    
+    def search_batch(self, queries: List[str], method: str = 'hybrid', top_k: int = 5,
+                     retrieval_k: int = 20) -> List[Tuple[List[Dict], List[float]]]:
+        """
+        Search nhiều query cùng lúc
+        - Encode tất cả query trong một padded forward pass
+        - Một lần index.search nhiều hàng
+        - Hybrid: toàn bộ cặp (query, candidate) đi qua cross-encoder trong một lần predict
+        Trả về list (results, scores) theo thứ tự query, cùng format với từng hàm search đơn.
+        Trường 'time' là thời gian trung bình mỗi query trong batch.
+        """
+        snapshot = self.store.snapshot()
+        if snapshot is None:
+            return [([], []) for _ in queries]
+        if not queries:
+            return []
         
-        for result, score in combined_results[:top_k]:
-            # Cập nhật thời gian cho từng kết quả
-            result['time'] = total_time
-            final_results.append(result)
-            final_scores.append(float(score))
+        start_time = time.time()
+        search_k = retrieval_k if method == 'hybrid' else top_k
         
-        return final_results, final_scores
+        # Stage 1: Bi-encoder retrieval cho cả batch
+        query_embeddings = self._encode_queries(queries)
+        scores, indices = self._vector_search(snapshot, query_embeddings, search_k)
+        per_query_time = (time.time() - start_time) * 1000 / len(queries)
+        
+        batch_results = [
+            self._hydrate_results(snapshot, scores[i], indices[i], per_query_time)
+            for i in range(len(queries))
+        ]
+        
+        if method != 'hybrid':
+            return batch_results
+        
+        # Stage 2: Cross-encoder re-ranking cho tất cả cặp trong một lần predict
+        pair_queries = []
+        pair_results = []
+        for query, (bi_results, _) in zip(queries, batch_results):
+            pair_queries.extend([query] * len(bi_results))
+            pair_results.extend(bi_results)
+        cross_scores = self._cross_scores(pair_queries, pair_results)
+        per_query_time = (time.time() - start_time) * 1000 / len(queries)
+        
+        final_batch = []
+        offset = 0
+        for bi_results, _ in batch_results:
+            query_scores = cross_scores[offset:offset + len(bi_results)]
+            offset += len(bi_results)
+            final_batch.append(self._rerank(bi_results, query_scores, top_k, per_query_time))
+        
+        return final_batch
 
 
 if __name__ == "__main__":
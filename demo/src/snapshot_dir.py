@@ -0,0 +1,176 @@
+"""
+Thư mục snapshot có version cho các file catalog
+- Checkpoint ghi metadata / embeddings / FAISS index / delta / tombstones / binary index vào thư mục tạm
+  trong data/snapshots/; thành phần không đổi được hard-link từ generation trước (không copy, không ghi lại)
+- manifest.json: generation, seq của catalog log đã bao gồm, sha256 + kích thước từng file
+- Publish: rename thư mục tạm → gen-<generation>, rồi thay con trỏ data/CURRENT bằng os.replace
+  → lần load sau chỉ thấy bộ file đầy đủ của một generation, không bao giờ thấy metadata / embeddings / index lệch nhau
+- Chưa có CURRENT (vừa chạy src/embedding.py): các file trong data/ được dùng như generation 0
+"""
+
+import os
+import sys
+import json
+import shutil
+import hashlib
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+# Add config path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'config'))
+from simple_config import DATA_PATHS, SNAPSHOTS
+from vector_storage import embedding_ids_path, sq8_params_path
+from catalog_log import fsync_path
+
+# Thành phần catalog → tên file (giống tên file trong data/)
+COMPONENT_FILES = {
+    key: os.path.basename(DATA_PATHS[key])
+    for key in ('metadata', 'embeddings', 'faiss_index', 'delta_index', 'tombstones', 'binary_index')
+}
+MANIFEST_FILE = 'manifest.json'
+
+
+def legacy_paths() -> Dict[str, str]:
+    """Đường dẫn file catalog trực tiếp trong data/ (generation 0, do preprocess.py / embedding.py tạo)"""
+    return {key: DATA_PATHS[key] for key in COMPONENT_FILES}
+
+
+def snapshot_paths(directory: str) -> Dict[str, str]:
+    """Đường dẫn file catalog trong một thư mục snapshot"""
+    return {key: os.path.join(directory, name) for key, name in COMPONENT_FILES.items()}
+
+
+def component_files(paths: Dict[str, str], key: str) -> List[str]:
+    """Các file của một thành phần (embeddings kèm file .ids.npy / .sq8.npy bên cạnh)"""
+    if key == 'embeddings':
+        return [paths[key], embedding_ids_path(paths[key]), sq8_params_path(paths[key])]
+    return [paths[key]]
+
+
+def read_current() -> Optional[Dict]:
+    """Manifest của generation đang được trỏ bởi data/CURRENT (None nếu chưa có snapshot nào)"""
+    pointer = DATA_PATHS['snapshot_pointer']
+    if not os.path.exists(pointer):
+        return None
+    with open(pointer, 'r', encoding='utf-8') as f:
+        directory = os.path.join(DATA_PATHS['snapshots'], f.read().strip())
+    with open(os.path.join(directory, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    manifest['directory'] = directory
+    return manifest
+
+
+def file_checksum(path: str, chunk_size: int = 1 << 20) -> str:
+    """sha256 của file (đọc từng chunk, không load cả file vào RAM)"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def verify_manifest(manifest: Dict):
+    """Kiểm tra kích thước + checksum các file của snapshot, raise ValueError nếu lệch"""
+    for name, info in manifest['files'].items():
+        path = os.path.join(manifest['directory'], name)
+        if not os.path.exists(path) or os.path.getsize(path) != info['bytes'] or file_checksum(path) != info['sha256']:
+            raise ValueError(f"Snapshot gen {manifest['generation']}: file {name} không khớp manifest")
+
+
+def begin_snapshot(generation: int) -> str:
+    """Tạo thư mục tạm cho generation mới (chưa được ai đọc tới khi publish_snapshot)"""
+    os.makedirs(DATA_PATHS['snapshots'], exist_ok=True)
+    directory = os.path.join(DATA_PATHS['snapshots'], f".tmp-gen-{generation:06d}-{os.getpid()}")
+    if os.path.exists(directory):
+        shutil.rmtree(directory)
+    os.makedirs(directory)
+    return directory
+
+
+def carry_over(keys: Iterable[str], source: Dict[str, str], target: Dict[str, str], link: bool = True):
+    """Đưa file của các thành phần không đổi sang snapshot mới: hard-link (copy nếu không link được / link=False)"""
+    for key in keys:
+        for src, dst in zip(component_files(source, key), component_files(target, key)):
+            if not os.path.exists(src):
+                continue
+            if link:
+                try:
+                    os.link(src, dst)
+                    continue
+                except OSError:
+                    pass  # Filesystem không hỗ trợ hard link
+            shutil.copy2(src, dst)
+
+
+def publish_snapshot(directory: str, generation: int, log_seq: int, previous: Optional[Dict] = None,
+                     linked: Iterable[str] = (), **info) -> Dict:
+    """
+    Ghi manifest, fsync, rename thư mục tạm → gen-<generation> rồi trỏ data/CURRENT vào đó
+    linked: thành phần được hard-link từ previous - dùng lại checksum trong manifest cũ thay vì đọc lại file.
+    """
+    linked_files = set()
+    if previous is not None:
+        paths = snapshot_paths(directory)
+        linked_files = {os.path.basename(path) for key in linked for path in component_files(paths, key)}
+
+    files = {}
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if name in linked_files and name in previous['files']:
+            files[name] = previous['files'][name]
+        else:
+            files[name] = {'sha256': file_checksum(path), 'bytes': os.path.getsize(path)}
+        fsync_path(path)
+
+    manifest = {
+        'generation': generation,
+        'log_seq': int(log_seq),
+        'created_at': datetime.now().isoformat(),
+        **info,
+        'files': files
+    }
+    manifest_path = os.path.join(directory, MANIFEST_FILE)
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    fsync_path(manifest_path)
+
+    name = f"gen-{generation:06d}"
+    final_directory = os.path.join(DATA_PATHS['snapshots'], name)
+    if os.path.exists(final_directory):
+        # Generation dở dang từ lần chạy trước bị crash sau rename (CURRENT chưa trỏ tới)
+        shutil.rmtree(final_directory)
+    os.replace(directory, final_directory)
+    fsync_path(DATA_PATHS['snapshots'])
+
+    pointer = DATA_PATHS['snapshot_pointer']
+    tmp_pointer = f"{pointer}.{os.getpid()}.tmp"
+    with open(tmp_pointer, 'w', encoding='utf-8') as f:
+        f.write(name)
+    fsync_path(tmp_pointer)
+    os.replace(tmp_pointer, pointer)
+    fsync_path(pointer)
+
+    manifest['directory'] = final_directory
+    prune_snapshots(generation)
+    return manifest
+
+
+def prune_snapshots(current_generation: int):
+    """Xóa các generation cũ, giữ SNAPSHOTS['keep'] generation gần nhất (và thư mục tạm bị bỏ dở)"""
+    root = DATA_PATHS['snapshots']
+    for name in os.listdir(root):
+        if name.startswith('gen-'):
+            if int(name[4:]) > current_generation - SNAPSHOTS['keep']:
+                continue
+        elif not name.startswith('.tmp-gen-') or name.endswith(f"-{os.getpid()}"):
+            continue
+        # Embeddings memory-mapped của snapshot cũ vẫn đọc được sau khi unlink (Linux); lỗi thì để lần sau
+        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+
+def reset_snapshots():
+    """Xóa toàn bộ snapshot và con trỏ CURRENT (catalog được build lại từ đầu trong data/)"""
+    if os.path.exists(DATA_PATHS['snapshot_pointer']):
+        os.remove(DATA_PATHS['snapshot_pointer'])
+    if os.path.exists(DATA_PATHS['snapshots']):
+        shutil.rmtree(DATA_PATHS['snapshots'], ignore_errors=True)
@@ -5,6 +5,34 @@ Demo xóa sản phẩm và test tính năng
 
 from delete_row import ProductDeleter
 from add_row import ProductManager
+from index_factory import search_with_rescoring
+
+
+def search_catalog(snapshot, query_embeddings, k):
+    """
+    Search như ProductSearcher: main index bỏ ID đã xóa (tombstone) bằng search_params / search_rows,
+    merge với delta index nếu bật. Vector của ID đã xóa vẫn nằm trong main index tới lần compaction.
+    """
+    def main_search(queries, main_k):
+        return search_with_rescoring(snapshot.index, queries, main_k, snapshot.embeddings,
+                                     snapshot.search_rows, params=snapshot.search_params)
+    
+    if snapshot.delta is not None:
+        return snapshot.delta.search(main_search, query_embeddings, k)
+    return main_search(query_embeddings, k)
+
+
+def check_vector_counts(snapshot):
+    """Số vector trong main index = sản phẩm còn lại + tombstone chờ compaction (khi delta rỗng)"""
+    print(f"   • Index vectors: {snapshot.index.ntotal} (tombstones chờ compaction: {len(snapshot.tombstones)})")
+    if snapshot.delta is not None and len(snapshot.delta) > 0:
+        print(f"   • Delta còn {len(snapshot.delta)} vectors chưa merge - bỏ qua so sánh số lượng")
+        return
+    if snapshot.index.ntotal == snapshot.num_products + len(snapshot.tombstones):
+        print("✅ Metadata and index counts match")
+    else:
+        print("❌ Metadata and index counts mismatch!")
+
 
 def test_delete_product():
     """Test chức năng xóa sản phẩm"""
@@ -60,7 +88,8 @@ def test_delete_product():
                             device=deleter.device
                         )
                         
-                        distances, indices = deleter.index.search(query_embedding, 3)
+                        snapshot = deleter.store.snapshot()
+                        distances, indices = search_catalog(snapshot, query_embedding, 3)
                         
                         print(f"Search results for '{first_product_name}':")
                         found_deleted = False
@@ -68,15 +97,15 @@ def test_delete_product():
                         for i, (idx, score) in enumerate(zip(indices[0], distances[0]), 1):
                             if idx == first_product_id:
                                 found_deleted = True
-                                print(f"❌ ERROR: Deleted product still found in index!")
+                                print(f"❌ ERROR: Deleted product still found in search results!")
                             else:
-                                product_row = deleter.metadata_df[deleter.metadata_df['id'] == idx]
-                                if not product_row.empty:
-                                    row = product_row.iloc[0]
+                                row = snapshot.get_product(idx)
+                                if row is not None:
                                     print(f"   {i}. ID {idx}: {row['name']} - Score: {score:.4f}")
                         
                         if not found_deleted:
                             print("✅ Deleted product not found in search results (correct)")
+                        check_vector_counts(snapshot)
                             
                     except Exception as e:
                         print(f"❌ Error during search test: {e}")
@@ -120,12 +149,7 @@ def test_batch_delete():
             print(f"✅ Batch deletion successful!")
             print(f"   • Products deleted: {deleted_count}")
             print(f"   • Products remaining: {final_count}")
-            print(f"   • Index vectors: {deleter.index.ntotal}")
-            
-            if final_count == deleter.index.ntotal:
-                print("✅ Metadata and index counts match")
-            else:
-                print("❌ Metadata and index counts mismatch!")
+            check_vector_counts(deleter.store.snapshot())
         else:
             print("❌ Batch deletion failed")
     else:
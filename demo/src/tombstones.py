@@ -0,0 +1,146 @@
+"""
+Tombstone cho sản phẩm đã xóa
+- Delete chỉ ghi product id vào data/tombstones.npy: ID của các sản phẩm khác giữ nguyên, main index không bị build lại
+- Search loại các ID này bằng IDSelector (index_factory.search_parameters)
+- Dòng metadata của ID đã xóa chỉ được đánh dấu (CatalogSnapshot.dead_rows), không copy lại DataFrame
+- Compaction nền: khi tỉ lệ tombstone vượt ngưỡng, bỏ vector/dòng embeddings của ID đã xóa và các dòng metadata
+  đã đánh dấu rồi publish vào ProductStore
+"""
+
+import os
+import sys
+import numpy as np
+import faiss
+from typing import Dict, Iterable, Optional
+
+# Add config path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'config'))
+from simple_config import DATA_PATHS, COMPACTION
+from index_factory import build_index, apply_search_params
+from binary_index import BinaryIndex
+
+
+class TombstoneSet:
+    """
+    Tập product id đã xóa nhưng vector vẫn còn trong main index / embeddings
+    Các bản copy dùng chung một frozenset; ID xóa sau đó nằm trong set nhỏ riêng của từng bản,
+    gộp vào frozenset khi vượt FOLD_SIZE → copy() mỗi lần delete không copy cả tập.
+    """
+
+    FOLD_SIZE = 1024
+
+    def __init__(self, ids: Optional[Iterable[int]] = None):
+        self._base = frozenset(int(product_id) for product_id in ids) if ids is not None else frozenset()
+        self._added = set()
+
+    def __len__(self) -> int:
+        return len(self._base) + len(self._added)
+
+    def __contains__(self, product_id) -> bool:
+        product_id = int(product_id)
+        return product_id in self._base or product_id in self._added
+
+    def ids(self) -> np.ndarray:
+        """Mảng product id đã xóa (sorted)"""
+        ids = np.fromiter(self._base, dtype=np.int64, count=len(self._base))
+        added = np.fromiter(self._added, dtype=np.int64, count=len(self._added))
+        return np.sort(np.concatenate([ids, added]))
+
+    def copy(self) -> 'TombstoneSet':
+        """Bản copy độc lập (snapshot đã publish không bị sửa), O(số ID chưa gộp)"""
+        tombstones = TombstoneSet()
+        tombstones._base, tombstones._added = self._base, set(self._added)
+        return tombstones
+
+    def add(self, ids: Iterable[int]):
+        """Đánh dấu xóa các product id"""
+        self._added.update(int(product_id) for product_id in ids if int(product_id) not in self._base)
+        if len(self._added) > self.FOLD_SIZE:
+            self._base, self._added = self._base.union(self._added), set()
+
+    def discard(self, ids: Iterable[int]):
+        """Bỏ các product id đã được compaction dọn khỏi index"""
+        ids = [int(product_id) for product_id in ids]
+        self._base = self._base.difference(ids)
+        self._added.difference_update(ids)
+
+    def should_compact(self, num_vectors: int) -> bool:
+        """Số tombstone đã vượt ngưỡng compaction chưa"""
+        return (COMPACTION['enabled'] and len(self) >= COMPACTION['min_tombstones']
+                and len(self) >= COMPACTION['tombstone_ratio'] * max(num_vectors, 1))
+
+    def save(self, path: Optional[str] = None):
+        """Lưu ra .npy (ghi file tạm rồi os.replace)"""
+        path = path or DATA_PATHS['tombstones']
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.save(f, self.ids())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: Optional[str] = None) -> 'TombstoneSet':
+        """Load tombstone từ file (rỗng nếu chưa có file)"""
+        path = path or DATA_PATHS['tombstones']
+        if not os.path.exists(path):
+            return cls()
+        return cls(np.load(path))
+
+    def stats(self, num_vectors: int) -> Dict:
+        """Thống kê cho /api/stats"""
+        return {
+            'tombstones': len(self),
+            'tombstone_ratio': round(len(self) / max(num_vectors, 1), 4),
+            'compaction_ratio': COMPACTION['tombstone_ratio']
+        }
+
+
+def remove_tombstones(path: Optional[str] = None):
+    """Xóa file tombstone (khi index được build lại từ đầu chỉ với sản phẩm còn tồn tại)"""
+    path = path or DATA_PATHS['tombstones']
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def build_compaction(snapshot) -> Dict:
+    """
+    Bước chậm của compaction (chạy nền, không giữ lock): snapshot mới từ snapshot (journal.base) với main index /
+    embeddings đã bỏ vector của các ID đã xóa và metadata đã bỏ các dòng đánh dấu xóa. Kết quả truyền cho
+    commit_compaction.
+    """
+    compacted_ids = snapshot.tombstones.ids()
+    keep = ~np.isin(snapshot.embedding_ids, compacted_ids)
+    kept_embeddings = np.asarray(snapshot.embeddings[keep])
+    kept_ids = snapshot.embedding_ids[keep]
+
+    index = apply_search_params(faiss.clone_index(snapshot.index))
+    try:
+        index.remove_ids(compacted_ids)
+    except RuntimeError:
+        # HNSW không hỗ trợ remove_ids: build lại từ các dòng còn lại
+        print("🔄 Main index không hỗ trợ remove_ids - build lại từ embeddings")
+        index = build_index(kept_embeddings, kept_ids)
+
+    binary_index = BinaryIndex().build(kept_embeddings, kept_ids) if snapshot.binary_index is not None else None
+    tombstones = snapshot.tombstones.copy()
+    tombstones.discard(compacted_ids)
+
+    compacted = snapshot.replace(
+        index=index, embeddings=kept_embeddings, embedding_ids=kept_ids, binary_index=binary_index,
+        tombstones=tombstones, frame=snapshot.metadata_df, dead_rows=None
+    )
+    return {'snapshot': compacted, 'compacted_ids': compacted_ids}
+
+
+def commit_compaction(store, journal, compaction: Dict) -> bool:
+    """
+    Bước nhanh của compaction (gọi khi giữ lock ghi): publish snapshot đã compaction sau khi replay các
+    add/update/delete commit trong lúc build (store.rebase). Delete trong lúc build tạo tombstone mới.
+    Trả về False nếu journal không còn hợp lệ (merge / reload / rebuild đã publish trong lúc compaction).
+    """
+    snapshot = store.rebase(journal, compaction['snapshot'], persist=True)
+    if snapshot is None:
+        print("⚠️ Catalog đã được thay trong lúc compaction (merge / reload / rebuild) - bỏ kết quả compaction")
+        return False
+    print(f"✅ Compaction: dọn {len(compaction['compacted_ids'])} vectors, main index còn "
+          f"{snapshot.index.ntotal} vectors, replay {len(journal.changes)} changes")
+    return True
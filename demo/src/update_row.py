@@ -20,24 +20,34 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config'))
 
 from simple_config import (
-    EMBEDDING_MODEL_NAME, DATA_PATHS, BATCH_SIZE, MAX_LENGTH, get_device,
+    EMBEDDING_MODEL_NAME, BATCH_SIZE, MAX_LENGTH, get_device,
     get_global_embedding_model, monitor_gpu_memory
 )
-from src.embedding import embed_text_with_attention, load_embedding_model
+from src.embedding import embed_text_with_attention, embed_texts, load_embedding_model
 from src.preprocess import create_text_corpus_for_product
+from src.index_factory import build_index
+from src.binary_index import BinaryIndex
+from src.tombstones import TombstoneSet
+from src.product_store import ProductStore, CatalogView, CatalogChange
 
 
-class ProductUpdater:
-    """Class để cập nhật thông tin sản phẩm trong database"""
+class ProductUpdater(CatalogView):
+    """
+    Class để cập nhật thông tin sản phẩm trong database
+    Dữ liệu đọc từ snapshot của ProductStore dùng chung; update sửa trên bản copy rồi ghi file.
+    """
     
-    def __init__(self):
-        """Khởi tạo ProductUpdater"""
+    def __init__(self, score_cache=None, store: Optional[ProductStore] = None):
+        """
+        Khởi tạo ProductUpdater
+        - score_cache: CrossEncoderScoreCache cần invalidate khi sản phẩm đổi
+        - store: ProductStore dùng chung (tạo mới nếu không truyền)
+        """
         self.device = get_device()
+        self.score_cache = score_cache
         self.model = None
         self.tokenizer = None
-        self.metadata_df = None
-        self.embeddings = None
-        self.index = None
+        self.store = store
         self.load_existing_data()
         
     def load_existing_data(self):
@@ -47,37 +57,25 @@ class ProductUpdater:
             self.model, self.tokenizer = get_global_embedding_model()
             print("✅ Using global embedding model")
             
-            self._load_data()
+            self._load_data(reload=False)
                 
         except Exception as e:
             print(f"❌ Error loading data: {e}")
-            self.metadata_df = None
-            self.embeddings = None
-            self.index = None
     
-    def _load_data(self):
-        """Load/reload dữ liệu database"""
+    def _load_data(self, reload: bool = True):
+        """Load/reload dữ liệu database (qua ProductStore dùng chung; reload=False: dùng snapshot hiện có)"""
         try:
-            # Load CSV metadata
-            if os.path.exists(DATA_PATHS['metadata']):
-                self.metadata_df = pd.read_csv(DATA_PATHS['metadata'])
-                print(f"✅ Loaded {len(self.metadata_df)} products from metadata")
-            else:
-                raise FileNotFoundError("Metadata file not found")
-                
-            # Load embeddings
-            if os.path.exists(DATA_PATHS['embeddings']):
-                self.embeddings = np.load(DATA_PATHS['embeddings'])
-                print(f"✅ Loaded embeddings: {self.embeddings.shape}")
-            else:
-                raise FileNotFoundError("Embeddings file not found")
-                
-            # Load FAISS index
-            if os.path.exists(DATA_PATHS['faiss_index']):
-                self.index = faiss.read_index(DATA_PATHS['faiss_index'])
-                print(f"✅ Loaded FAISS index: {self.index.ntotal} vectors")
-            else:
-                raise FileNotFoundError("FAISS index not found")
+            if self.store is None:
+                self.store = ProductStore()
+            elif reload:
+                self.store.reload()
+            
+            if self.store.snapshot() is None:
+                raise FileNotFoundError("Metadata, embeddings hoặc FAISS index không tồn tại")
+            
+            print(f"✅ Loaded {len(self.metadata_df)} products from metadata")
+            print(f"✅ Loaded embeddings: {self.embeddings.shape}")
+            print(f"✅ Loaded FAISS index: {self.index.ntotal} vectors")
                 
         except Exception as e:
             print(f"❌ Error loading data: {e}")
@@ -88,14 +86,14 @@ class ProductUpdater:
         print(f"\n📋 Danh sách sản phẩm (hiển thị {min(limit, len(self.metadata_df))} sản phẩm):")
         print("-" * 100)
         
-        for idx, row in self.metadata_df.head(limit).iterrows():
-            print(f"ID: {idx:3d} | {row['name'][:50]:<50} | {row['brand'][:20]:<20}")
+        for _, row in self.metadata_df.head(limit).iterrows():
+            print(f"ID: {row['id']:3d} | {row['name'][:50]:<50} | {row['brand'][:20]:<20}")
         
         if len(self.metadata_df) > limit:
             print(f"... và {len(self.metadata_df) - limit} sản phẩm khác")
     
     def search_products(self, query: str) -> List[int]:
-        """Tìm kiếm sản phẩm theo keyword"""
+        """Tìm kiếm sản phẩm theo keyword (trả về product id)"""
         if not self.model:
             self.model, self.tokenizer = load_embedding_model()
             
@@ -103,10 +101,10 @@ class ProductUpdater:
         results = []
         query_lower = query.lower()
         
-        for idx, row in self.metadata_df.iterrows():
+        for _, row in self.metadata_df.iterrows():
             search_text = f"{row['name']} {row['brand']} {row.get('ingredients', '')}".lower()
             if query_lower in search_text:
-                results.append(idx)
+                results.append(int(row['id']))
                 
         return results
     
@@ -135,13 +133,13 @@ class ProductUpdater:
     def _select_by_id(self) -> Optional[int]:
         """Chọn sản phẩm theo ID"""
         try:
-            product_id = int(input(f"Nhập ID sản phẩm (0-{len(self.metadata_df)-1}): "))
-            if 0 <= product_id < len(self.metadata_df):
+            product_id = int(input("Nhập ID sản phẩm: "))
+            if product_id in self.id_index:
                 self._display_product_details(product_id)
                 if input("Xác nhận cập nhật sản phẩm này? (y/n): ").lower() == 'y':
                     return product_id
             else:
-                print(f"❌ ID không hợp lệ! Phải từ 0 đến {len(self.metadata_df)-1}")
+                print(f"❌ ID {product_id} không tồn tại!")
         except ValueError:
             print("❌ ID phải là số nguyên!")
         return None
@@ -160,9 +158,9 @@ class ProductUpdater:
         print(f"\n🔍 Tìm thấy {len(results)} sản phẩm:")
         print("-" * 80)
         
-        for i, idx in enumerate(results[:10], 1):
-            row = self.metadata_df.iloc[idx]
-            print(f"{i:2d}. ID:{idx:3d} | {row['name'][:40]:<40} | {row['brand'][:15]}")
+        for i, product_id in enumerate(results[:10], 1):
+            row = self.get_product(product_id)
+            print(f"{i:2d}. ID:{product_id:3d} | {row['name'][:40]:<40} | {row['brand'][:15]}")
             
         try:
             choice = int(input(f"\nChọn sản phẩm (1-{min(len(results), 10)}): ")) - 1
@@ -188,9 +186,11 @@ class ProductUpdater:
             print(f"\n📋 Danh sách sản phẩm (Trang {current_page + 1}/{total_pages}):")
             print("-" * 80)
             
+            page_ids = []
             for i in range(start_idx, end_idx):
                 row = self.metadata_df.iloc[i]
-                print(f"{i:3d}. {row['name'][:40]:<40} | {row['brand'][:15]}")
+                page_ids.append(int(row['id']))
+                print(f"{row['id']:3d}. {row['name'][:40]:<40} | {row['brand'][:15]}")
             
             print(f"\n[n]ext | [p]rev | [s]elect | [q]uit")
             choice = input("Lựa chọn: ").strip().lower()
@@ -201,13 +201,13 @@ class ProductUpdater:
                 current_page -= 1
             elif choice == 's':
                 try:
-                    product_id = int(input(f"Nhập ID sản phẩm ({start_idx}-{end_idx-1}): "))
-                    if start_idx <= product_id < end_idx:
+                    product_id = int(input("Nhập ID sản phẩm trong trang: "))
+                    if product_id in page_ids and product_id in self.id_index:
                         self._display_product_details(product_id)
                         if input("Xác nhận cập nhật sản phẩm này? (y/n): ").lower() == 'y':
                             return product_id
                     else:
-                        print(f"❌ ID phải từ {start_idx} đến {end_idx-1}")
+                        print("❌ ID không có trong trang này")
                 except ValueError:
                     print("❌ ID phải là số nguyên!")
             elif choice == 'q':
@@ -215,7 +215,10 @@ class ProductUpdater:
     
     def _display_product_details(self, product_id: int) -> None:
         """Hiển thị chi tiết sản phẩm"""
-        row = self.metadata_df.iloc[product_id]
+        row = self.get_product(product_id)
+        if row is None:
+            print(f"❌ Product ID {product_id} không tồn tại!")
+            return
         print(f"\n📦 Chi tiết sản phẩm ID: {product_id}")
         print("-" * 60)
         print(f"Tên: {row['name']}")
@@ -283,77 +286,71 @@ class ProductUpdater:
         try:
             print(f"\n🔄 Đang cập nhật sản phẩm ID: {product_id}...")
             
-            # 0. Tìm index của product_id trong DataFrame
-            if product_id not in self.metadata_df['id'].values:
+            # 0. Tìm index của product_id trong DataFrame (trên snapshot hiện tại của store)
+            snapshot = self.store.snapshot()
+            product_index = snapshot.id_index.get(product_id)
+            if product_index is None:
                 print(f"❌ Product ID {product_id} không tồn tại!")
                 return False
             
-            # Lấy index thực tế của product_id
-            product_index = self.metadata_df[self.metadata_df['id'] == product_id].index[0]
-            
             # Debug: Kiểm tra consistency
             print(f"🔍 Debug info:")
             print(f"   Product ID: {product_id}")
             print(f"   Product index in DataFrame: {product_index}")
-            print(f"   Metadata shape: {self.metadata_df.shape}")
-            print(f"   Embeddings shape: {self.embeddings.shape}")
-            print(f"   FAISS index size: {self.index.ntotal}")
-            
-            # Validation: Đảm bảo index không vượt quá bounds
-            if product_index >= len(self.embeddings):
-                print(f"❌ Error: product_index {product_index} >= embeddings size {len(self.embeddings)}")
+            print(f"   Metadata shape: {snapshot.frame.shape} ({len(snapshot.dead_rows)} dòng đã xóa)")
+            print(f"   Embeddings shape: {snapshot.embeddings.shape}")
+            print(f"   FAISS index size: {snapshot.index.ntotal}")
+            
+            # Validation: Sản phẩm phải có dòng trong embeddings
+            embedding_row = snapshot.embedding_rows.get(product_id)
+            if embedding_row is None:
+                print(f"❌ Error: product ID {product_id} không có dòng embeddings")
                 print("🔄 Rebuilding embeddings to match metadata...")
-                self._rebuild_all_embeddings()
-                # Sau khi rebuild, kiểm tra lại
-                if product_index >= len(self.embeddings):
-                    print(f"❌ Still out of bounds after rebuild!")
+                self._rebuild_all_embeddings(snapshot)
+                # Sau khi rebuild, kiểm tra lại trên snapshot mới
+                snapshot = self.store.snapshot()
+                embedding_row = snapshot.embedding_rows.get(product_id)
+                if embedding_row is None:
+                    print(f"❌ Still missing after rebuild!")
                     return False
             
-            # 1. Tạo embedding mới
-            print("📊 Tạo embedding mới...")
-            new_embedding = self._create_embedding(updated_info)
+            # Các trường không có trong updated_info giữ giá trị hiện tại
+            current = snapshot.frame.iloc[product_index]
+            product_info = {
+                field: current.get(field, '') if pd.notna(current.get(field, '')) else ''
+                for field in ('name', 'brand', 'ingredients', 'categories', 'manufacturer', 'manufacturerNumber')
+            }
+            product_info.update(updated_info)
             
-            # 2. Cập nhật metadata trong DataFrame (sử dụng index, không phải ID)
+            # 1. Dòng metadata mới với text_corpus theo thông tin mới
             print("📝 Cập nhật metadata...")
-            for field, value in updated_info.items():
-                self.metadata_df.at[product_index, field] = value
-            
-            # Cập nhật text_corpus với thông tin mới
-            new_text_corpus = create_text_corpus_for_product(
-                name=updated_info['name'],
-                brand=updated_info['brand'], 
-                ingredients=updated_info.get('ingredients', ''),
-                categories=updated_info.get('categories', ''),
-                manufacturer=updated_info.get('manufacturer', ''),
-                manufacturerNumber=updated_info.get('manufacturerNumber', '')
+            new_row = current.to_dict()
+            new_row.update(updated_info)
+            new_row['text_corpus'] = create_text_corpus_for_product(
+                name=product_info['name'],
+                brand=product_info['brand'], 
+                ingredients=product_info.get('ingredients', ''),
+                categories=product_info.get('categories', ''),
+                manufacturer=product_info.get('manufacturer', ''),
+                manufacturerNumber=product_info.get('manufacturerNumber', '')
             )
-            self.metadata_df.at[product_index, 'text_corpus'] = new_text_corpus
-            
-            # 3. Cập nhật embedding trong array (sử dụng index)
-            print("🔢 Cập nhật embedding...")
-            self.embeddings[product_index] = new_embedding.flatten()
-            
-            # 4. Cập nhật FAISS index (QUICK UPDATE)
-            print("📚 Cập nhật FAISS index...")
             
-            # Normalize embedding cho cosine similarity
-            normalized_embedding = new_embedding.copy()
-            faiss.normalize_L2(normalized_embedding)
+            # 2. Tạo embedding mới - text_corpus không đổi thì giữ nguyên vector (không encode, không ghi index)
+            new_embedding = None
+            if new_row['text_corpus'] != current.get('text_corpus'):
+                print("📊 Tạo embedding mới...")
+                new_embedding = self._create_embedding(product_info)
+            else:
+                print("♻️ text_corpus không đổi - giữ nguyên embedding")
             
-            # Quick update: Chỉ remove và add lại vector này
-            try:
-                self.index.remove_ids(np.array([product_index], dtype=np.int64))
-                self.index.add_with_ids(normalized_embedding, np.array([product_index], dtype=np.int64))
-                print(f"⚡ Quick update vector at index {product_index}")
-                
-            except Exception as idx_error:
-                print(f"⚠️ Quick update failed: {idx_error}")
-                print("🔄 Rebuilding index...")
-                self._rebuild_faiss_index()
+            # 3-5. Phát CatalogChange: store sửa dòng metadata / embeddings, ghi vector vào FAISS index
+            #      (delta / ghi đè tại slot / remove+add tùy loại index), lưu file và publish snapshot mới
+            print("📚 Cập nhật embedding, FAISS index và lưu dữ liệu...")
+            self.store.commit(CatalogChange(rows=pd.DataFrame([new_row]), vectors=new_embedding))
             
-            # 5. Lưu dữ liệu
-            print("💾 Lưu dữ liệu...")
-            self._save_data()
+            # 6. Invalidate score cross-encoder của sản phẩm này
+            if self.score_cache is not None:
+                self.score_cache.invalidate_products([product_id])
             
             print(f"✅ Cập nhật thành công sản phẩm ID: {product_id}")
             return True
@@ -362,85 +359,61 @@ class ProductUpdater:
             print(f"❌ Lỗi khi cập nhật sản phẩm: {e}")
             return False
     
-    def _rebuild_faiss_index(self):
-        """Rebuild toàn bộ FAISS index"""
-        embedding_dim = self.embeddings.shape[1]
-        
-        # Tạo IndexIDMap mới
-        base_index = faiss.IndexFlatIP(embedding_dim)
-        self.index = faiss.IndexIDMap(base_index)
-        
-        # Normalize embeddings cho cosine similarity
-        normalized_embeddings = self.embeddings.copy()
-        faiss.normalize_L2(normalized_embeddings)
-        
-        # Thêm tất cả embeddings với ID
-        ids = np.arange(len(self.embeddings), dtype=np.int64)
-        self.index.add_with_ids(normalized_embeddings, ids)
-        
-        print(f"✅ Rebuilt FAISS index với {self.index.ntotal} vectors")
+    def _rebuild_faiss_index(self, embeddings, embedding_ids) -> faiss.Index:
+        """Rebuild toàn bộ FAISS index (loại index theo FAISS_CONFIG, embeddings được normalize khi add)"""
+        # FAISS id = product id của từng dòng embeddings (giống lúc build trong embedding.py)
+        index = build_index(embeddings, embedding_ids)
+        print(f"✅ Rebuilt FAISS index với {index.ntotal} vectors")
+        return index
     
-    def _rebuild_all_embeddings(self):
-        """Rebuild toàn bộ embeddings từ metadata"""
+    def _rebuild_all_embeddings(self, snapshot):
+        """Rebuild toàn bộ embeddings + FAISS index từ metadata, lưu file và publish vào store"""
         try:
             print("🔄 Rebuilding all embeddings from metadata...")
             
-            embeddings_list = []
-            
-            for idx, row in self.metadata_df.iterrows():
+            metadata_df = snapshot.metadata_df
+            texts = []
+            for _, row in metadata_df.iterrows():
                 # Tạo embedding từ text_corpus hoặc từ các field
                 if 'text_corpus' in row and pd.notna(row['text_corpus']):
-                    text = row['text_corpus']
+                    texts.append(row['text_corpus'])
                 else:
                     # Tạo text_corpus từ các field
-                    text = create_text_corpus_for_product(
+                    texts.append(create_text_corpus_for_product(
                         name=row.get('name', ''),
                         brand=row.get('brand', ''),
                         ingredients=row.get('ingredients', ''),
                         categories=row.get('categories', ''),
                         manufacturer=row.get('manufacturer', ''),
                         manufacturerNumber=row.get('manufacturerNumber', '')
-                    )
-                
-                # Tạo embedding
-                embedding = embed_text_with_attention(
-                    text,
-                    self.model,
-                    self.tokenizer,
-                    max_length=MAX_LENGTH,
-                    device=self.device
-                )
-                
-                embeddings_list.append(embedding.detach().cpu().numpy())
-                
-                if (idx + 1) % 50 == 0:
-                    print(f"   Processed {idx + 1}/{len(self.metadata_df)} products...")
-            
-            # Convert to numpy array
-            self.embeddings = np.array(embeddings_list)
-            
-            # Rebuild FAISS index
-            self._rebuild_faiss_index()
-            
-            print(f"✅ Rebuilt all embeddings: {self.embeddings.shape}")
+                    ))
+            
+            # Embed theo batch, text đã có trong embedding cache không bị encode lại
+            embeddings = embed_texts(texts, self.model, self.tokenizer, MAX_LENGTH, self.device,
+                                     show_progress=True)
+            embedding_ids = metadata_df['id'].values.astype(np.int64)
+            
+            # Rebuild FAISS index (main index mới đã chứa mọi vector trong delta)
+            index = self._rebuild_faiss_index(embeddings, embedding_ids)
+            delta = None
+            if snapshot.delta is not None:
+                delta = snapshot.delta.copy()
+                delta.clear()
+            binary_index = None
+            if snapshot.binary_index is not None:
+                binary_index = BinaryIndex().build(embeddings, embedding_ids)
+            
+            # Chỉ còn sản phẩm trong metadata nên không còn tombstone / dòng đã xóa
+            self.store.replace(persist=True, index=index, embeddings=embeddings, embedding_ids=embedding_ids,
+                               delta=delta, binary_index=binary_index, tombstones=TombstoneSet(),
+                               frame=metadata_df, dead_rows=None)
+            
+            print(f"✅ Rebuilt all embeddings: {embeddings.shape}")
             
         except Exception as e:
             print(f"❌ Lỗi khi rebuild embeddings: {e}")
             raise e
     
-    def _save_data(self):
-        """Lưu dữ liệu ra file"""
-        # Lưu CSV metadata
-        self.metadata_df.to_csv(DATA_PATHS['metadata'], index=False)
-        
-        # Lưu embeddings
-        np.save(DATA_PATHS['embeddings'], self.embeddings)
-        
-        # Lưu FAISS index
-        faiss.write_index(self.index, DATA_PATHS['faiss_index'])
-        
-        print("💾 Đã lưu tất cả dữ liệu")
-    
     def interactive_update(self):
         """Giao diện tương tác để cập nhật sản phẩm"""
         print("🔧 CHỨC NĂNG CẬP NHẬT SẢN PHẨM")
@@ -452,8 +425,11 @@ class ProductUpdater:
             if product_id is None:
                 break
                 
-            # Lấy thông tin hiện tại
-            current_product = self.metadata_df.iloc[product_id]
+            # Lấy thông tin hiện tại (sản phẩm có thể vừa bị xóa ở nơi khác)
+            current_product = self.get_product(product_id)
+            if current_product is None:
+                print(f"❌ Product ID {product_id} không tồn tại!")
+                continue
             
             # Thu thập thông tin mới
             updated_info = self.get_updated_product_info(current_product)
@@ -0,0 +1,343 @@
+"""
+Lưu trữ embeddings dạng gọn
+- float32 (mặc định), float16 (2 bytes/dim) hoặc sq8 (scalar quantization 8-bit, 1 byte/dim)
+- Load bằng mmap_mode để các process dùng chung page cache và chỉ đọc trang khi cần
+- Ghi file tạm rồi os.replace: mapping cũ vẫn trỏ tới file cũ, không bị ghi đè khi đang đọc
+- Product id của từng dòng lưu ở file .ids.npy bên cạnh (dòng của sản phẩm đã xóa còn lại tới lần compaction)
+- OverlayEmbeddings: dòng bị update nằm trong overlay nhỏ đặt trên mảng gốc (memmap), không copy cả ma trận
+- SQ8Embeddings: uint8 codes của file sq8 giữ memory-mapped (1 byte/dim, page dùng chung), giải mã khi đọc dòng
+"""
+
+import os
+import sys
+import numpy as np
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+# Add config path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'config'))
+from simple_config import EMBEDDING_STORAGE
+
+STORAGE_DTYPES = ('float32', 'float16', 'sq8')
+
+# Số bytes mỗi chiều trên đĩa của từng kiểu lưu trữ
+BYTES_PER_DIM = {'float32': 4, 'float16': 2, 'sq8': 1}
+
+SQ8_DECODE_BLOCK = 65536
+
+
+def normalize_storage_dtype(dtype: str) -> str:
+    """Chuẩn hóa tên kiểu lưu trữ về float32 | float16 | sq8"""
+    key = str(dtype).lower().replace('-', '').replace('_', '')
+    aliases = {'float32': 'float32', 'fp32': 'float32', 'float16': 'float16', 'fp16': 'float16',
+               'sq8': 'sq8', 'uint8': 'sq8', 'int8': 'sq8'}
+    if key not in aliases:
+        raise ValueError(f"Kiểu lưu trữ embeddings không hỗ trợ: {dtype}")
+    return aliases[key]
+
+
+def sq8_params_path(path: str) -> str:
+    """File chứa tham số giải mã sq8 (vmin, scale theo từng chiều) đặt cạnh file embeddings"""
+    return f"{os.path.splitext(path)[0]}.sq8.npy"
+
+
+def embedding_ids_path(path: str) -> str:
+    """File chứa product id theo từng dòng embeddings"""
+    return f"{os.path.splitext(path)[0]}.ids.npy"
+
+
+def sq8_train(embeddings: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Tính khoảng giá trị theo từng chiều cho scalar quantization 8-bit"""
+    vmin = np.min(embeddings, axis=0).astype(np.float32)
+    vmax = np.max(embeddings, axis=0).astype(np.float32)
+    scale = np.maximum(vmax - vmin, 1e-12) / 255.0
+    return vmin, scale.astype(np.float32)
+
+
+def sq8_encode(embeddings: np.ndarray, vmin: np.ndarray, scale: np.ndarray) -> np.ndarray:
+    """float → uint8 codes"""
+    codes = np.rint((np.asarray(embeddings, dtype=np.float32) - vmin) / scale)
+    return np.clip(codes, 0, 255).astype(np.uint8)
+
+
+def sq8_decode(codes: np.ndarray, vmin: np.ndarray, scale: np.ndarray, dtype=np.float32) -> np.ndarray:
+    """uint8 codes → float"""
+    return (codes.astype(np.float32) * scale + vmin).astype(dtype, copy=False)
+
+
+def round_trip(embeddings: np.ndarray, dtype: str) -> np.ndarray:
+    """Giá trị float32 sau khi lưu với kiểu dtype rồi đọc lại (dùng để đo recall delta)"""
+    dtype = normalize_storage_dtype(dtype)
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    if dtype == 'float16':
+        return embeddings.astype(np.float16).astype(np.float32)
+    if dtype == 'sq8':
+        vmin, scale = sq8_train(embeddings)
+        return sq8_decode(sq8_encode(embeddings, vmin, scale), vmin, scale)
+    return embeddings
+
+
+def _atomic_save(path: str, array: np.ndarray):
+    """np.save ra file tạm rồi os.replace"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+def save_embeddings(path: str, embeddings: np.ndarray, dtype: Optional[str] = None, ids=None) -> str:
+    """
+    Lưu embeddings theo kiểu cấu hình trong EMBEDDING_STORAGE['dtype']
+    sq8 lưu uint8 codes vào path và (vmin, scale) vào file .sq8.npy bên cạnh.
+    ids: product id theo từng dòng, lưu vào file .ids.npy bên cạnh
+    """
+    dtype = normalize_storage_dtype(dtype or EMBEDDING_STORAGE['dtype'])
+    embeddings = np.asarray(embeddings)
+
+    if dtype == 'sq8':
+        vmin, scale = sq8_train(embeddings) if len(embeddings) > 0 else (
+            np.zeros(embeddings.shape[1], np.float32), np.ones(embeddings.shape[1], np.float32))
+        _atomic_save(sq8_params_path(path), np.stack([vmin, scale]))
+        _atomic_save(path, sq8_encode(embeddings, vmin, scale))
+    else:
+        _atomic_save(path, embeddings.astype(dtype, copy=False))
+        if os.path.exists(sq8_params_path(path)):
+            os.remove(sq8_params_path(path))
+
+    if ids is not None:
+        _atomic_save(embedding_ids_path(path), np.asarray(ids, dtype=np.int64))
+
+    return dtype
+
+
+def save_embedding_blocks(path: str, blocks: Callable[[], Iterable[np.ndarray]], num_vectors: int, dimension: int,
+                          dtype: Optional[str] = None, ids=None) -> str:
+    """
+    Lưu embeddings đến từ nhiều block (vd. shard của parallel_build) mà không giữ toàn bộ trong RAM
+    blocks(): iterator các block [n, dimension] theo thứ tự dòng (gọi hai lần với sq8: tính vmin/scale rồi encode).
+    Ghi thẳng vào .npy tạm qua memmap rồi os.replace, cùng định dạng với save_embeddings.
+    """
+    dtype = normalize_storage_dtype(dtype or EMBEDDING_STORAGE['dtype'])
+
+    vmin = scale = None
+    if dtype == 'sq8':
+        vmin = np.full(dimension, np.inf, dtype=np.float32)
+        vmax = np.full(dimension, -np.inf, dtype=np.float32)
+        for block in blocks():
+            if len(block) > 0:
+                vmin = np.minimum(vmin, np.min(block, axis=0))
+                vmax = np.maximum(vmax, np.max(block, axis=0))
+        if num_vectors == 0:
+            vmin, vmax = np.zeros(dimension, np.float32), np.full(dimension, 255.0, np.float32)
+        scale = (np.maximum(vmax - vmin, 1e-12) / 255.0).astype(np.float32)
+        _atomic_save(sq8_params_path(path), np.stack([vmin, scale]))
+    elif os.path.exists(sq8_params_path(path)):
+        os.remove(sq8_params_path(path))
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    out = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.uint8 if dtype == 'sq8' else dtype,
+                                    shape=(num_vectors, dimension))
+    row = 0
+    for block in blocks():
+        out[row:row + len(block)] = sq8_encode(block, vmin, scale) if dtype == 'sq8' else block
+        row += len(block)
+    if row != num_vectors:
+        raise ValueError(f"Các block có {row} dòng, cần {num_vectors}")
+    out.flush()
+    del out
+    os.replace(tmp_path, path)
+
+    if ids is not None:
+        _atomic_save(embedding_ids_path(path), np.asarray(ids, dtype=np.int64))
+    return dtype
+
+
+def load_embeddings(path: str, mmap: Optional[bool] = None) -> np.ndarray:
+    """
+    Load embeddings, tự nhận kiểu từ file
+    - float32/float16: memmap copy-on-write (mmap_mode='c'), ghi vào array không ảnh hưởng file
+    - sq8: SQ8Embeddings trên uint8 codes memory-mapped (mmap=False: giải mã cả mảng sang float16 trong RAM)
+    """
+    mmap = EMBEDDING_STORAGE['mmap'] if mmap is None else mmap
+    array = np.load(path, mmap_mode='c' if mmap else None)
+
+    if array.dtype == np.uint8:
+        params = np.load(sq8_params_path(path))
+        embeddings = SQ8Embeddings(array, params[0], params[1])
+        return embeddings if mmap else np.asarray(embeddings)
+
+    return array
+
+
+def load_embedding_ids(path: str, default_ids=None) -> np.ndarray:
+    """
+    Product id theo từng dòng embeddings
+    Chưa có file .ids.npy (dữ liệu cũ, dòng embeddings khớp dòng metadata) → trả về default_ids.
+    """
+    ids_path = embedding_ids_path(path)
+    if os.path.exists(ids_path):
+        return np.load(ids_path)
+    return np.asarray(default_ids if default_ids is not None else [], dtype=np.int64)
+
+
+class OverlayEmbeddings:
+    """
+    Embeddings = mảng gốc (thường là memmap của file đã lưu / view của AppendBuffer) + các dòng bị ghi đè
+    - write(): bản mới với vài dòng được thay, chỉ copy overlay (O(số dòng trong overlay)); mảng gốc không bị
+      copy hay sửa nên vẫn memory-mapped và snapshot cũ không bị đổi
+    - Đọc như ndarray: embeddings[rows | slice | mask] trả về mảng đã áp overlay, shape / dtype / len
+    - np.asarray(embeddings): mảng đầy đủ (checkpoint, compaction); checkpoint memory-map lại file vừa ghi
+      nên overlay chỉ giữ các dòng bị sửa từ checkpoint gần nhất
+    """
+
+    def __init__(self, base, rows=None, vectors=None):
+        """rows: vị trí dòng đã sắp tăng, không trùng; vectors: giá trị mới của các dòng đó (dtype của base)"""
+        self.base = base
+        self.rows = np.zeros(0, dtype=np.int64) if rows is None else rows
+        self.vectors = np.zeros((0,) + base.shape[1:], dtype=base.dtype) if vectors is None else vectors
+
+    @classmethod
+    def write(cls, embeddings, rows, vectors) -> 'OverlayEmbeddings':
+        """embeddings với các dòng rows được thay bằng vectors (embeddings không bị sửa; dòng trùng: lần cuối thắng)"""
+        if not isinstance(embeddings, cls):
+            embeddings = cls(embeddings)
+        rows = np.asarray(rows, dtype=np.int64)
+        vectors = np.asarray(vectors, dtype=embeddings.dtype).reshape((len(rows),) + embeddings.shape[1:])
+        last = len(rows) - 1 - np.unique(rows[::-1], return_index=True)[1]
+        rows, vectors = rows[last], vectors[last]
+
+        keep = ~np.isin(embeddings.rows, rows)
+        all_rows = np.concatenate([embeddings.rows[keep], rows])
+        order = np.argsort(all_rows, kind='stable')
+        return cls(embeddings.base, all_rows[order], np.concatenate([embeddings.vectors[keep], vectors])[order])
+
+    def with_base(self, base) -> 'OverlayEmbeddings':
+        """Cùng overlay đặt trên base mới (vd base cũ + các dòng append phía sau)"""
+        return OverlayEmbeddings(base, self.rows, self.vectors)
+
+    def rebased(self, previous, base):
+        """
+        Các dòng ghi sau previous (khác giá trị của previous) đặt trên base mới - base có cùng giá trị với previous
+        (checkpoint memory-map lại previous trong khi snapshot hiện tại đã có thêm update)
+        """
+        changed = np.any(self.vectors != np.asarray(previous[self.rows], dtype=self.dtype).reshape(self.vectors.shape),
+                         axis=tuple(range(1, self.vectors.ndim)))
+        if not changed.any():
+            return base
+        return OverlayEmbeddings(base, self.rows[changed], self.vectors[changed])
+
+    @property
+    def shape(self):
+        return self.base.shape
+
+    @property
+    def dtype(self):
+        return self.base.dtype
+
+    @property
+    def ndim(self) -> int:
+        return self.base.ndim
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.base.nbytes + self.vectors.nbytes)
+
+    def __len__(self) -> int:
+        return len(self.base)
+
+    def _positions(self, key) -> np.ndarray:
+        """Vị trí dòng (theo base) của từng dòng trong kết quả base[key]"""
+        if isinstance(key, slice):
+            return np.arange(*key.indices(len(self.base)), dtype=np.int64)
+        key = np.asarray(key)
+        if key.dtype == bool:
+            return np.flatnonzero(key)
+        key = key.astype(np.int64)
+        return np.where(key < 0, key + len(self.base), key)
+
+    def __getitem__(self, key):
+        result = self.base[key]
+        if len(self.rows) == 0:
+            return result
+        scalar = np.ndim(key) == 0 and not isinstance(key, slice)
+        positions = self._positions(key).reshape(-1)
+        found = np.searchsorted(self.rows, positions).clip(max=len(self.rows) - 1)
+        hit = self.rows[found] == positions
+        if not hit.any():
+            return result
+        # Slice / một dòng của base là view (memmap): copy trước khi áp overlay
+        result = np.array(result).reshape((len(positions),) + self.shape[1:])
+        result[hit] = self.vectors[found[hit]]
+        return result[0] if scalar else result
+
+    def __array__(self, dtype=None, copy=None):
+        array = np.array(self.base, dtype=dtype)
+        array[self.rows] = self.vectors
+        return array
+
+
+class SQ8Embeddings:
+    """
+    Embeddings sq8 đọc như ndarray float16 chỉ đọc: codes (uint8, thường là memmap) giải mã theo dòng khi truy cập
+    - embeddings[rows | slice | mask] trả về mảng float16 đã giải mã, shape / dtype / len như mảng float16
+    - np.asarray(embeddings): giải mã toàn bộ theo block (build index, compaction, checkpoint)
+    - Dòng bị update / append nằm ở OverlayEmbeddings / AppendBuffer phía trên, codes không bị ghi
+    """
+
+    dtype = np.dtype(np.float16)
+
+    def __init__(self, codes: np.ndarray, vmin: np.ndarray, scale: np.ndarray):
+        self.codes = codes
+        self.vmin = np.asarray(vmin, dtype=np.float32)
+        self.scale = np.asarray(scale, dtype=np.float32)
+
+    @property
+    def shape(self):
+        return self.codes.shape
+
+    @property
+    def ndim(self) -> int:
+        return self.codes.ndim
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.codes.nbytes)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __getitem__(self, key):
+        return sq8_decode(self.codes[key], self.vmin, self.scale, dtype=self.dtype)
+
+    def __array__(self, dtype=None, copy=None):
+        # Giải mã theo block để không cần giữ bản float32 của toàn bộ array
+        array = np.empty(self.shape, dtype=dtype or self.dtype)
+        for start in range(0, len(self.codes), SQ8_DECODE_BLOCK):
+            end = start + SQ8_DECODE_BLOCK
+            array[start:end] = self[start:end]
+        return array
+
+
+def embeddings_base(embeddings):
+    """Mảng gốc của embeddings (bỏ overlay)"""
+    return embeddings.base if isinstance(embeddings, OverlayEmbeddings) else embeddings
+
+
+def is_memory_mapped(embeddings) -> bool:
+    """Mảng gốc của embeddings đọc thẳng từ file (memmap / codes sq8 memmap), chưa bị copy vào RAM"""
+    base = embeddings_base(embeddings)
+    if isinstance(base, SQ8Embeddings):
+        base = base.codes
+    return isinstance(base, np.memmap)
+
+
+def storage_info(embeddings: np.ndarray, path: Optional[str] = None) -> Dict:
+    """Thông tin kiểu lưu trữ và kích thước cho log/stats"""
+    info = {
+        'dtype': str(embeddings.dtype),
+        'shape': list(embeddings.shape),
+        'memory_mapped': is_memory_mapped(embeddings),
+        'array_bytes': int(embeddings.nbytes)
+    }
+    if path and os.path.exists(path):
+        info['file_bytes'] = int(os.path.getsize(path))
+    return info
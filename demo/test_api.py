@@ -63,6 +63,38 @@ def test_search():
             print(f"  ❌ Search error: {e}")
 
 
+def test_batch_search():
+    """Test batch search functionality"""
+    print("\n🔍 Testing batch search...")
+    
+    batch_request = {
+        "queries": ["milk chocolate", "organic protein", "vitamin"],
+        "method": "hybrid",
+        "top_k": 3
+    }
+    
+    try:
+        response = requests.post(
+            f"{BASE_URL}/search/batch",
+            json=batch_request,
+            headers={'Content-Type': 'application/json'}
+        )
+        
+        if response.status_code == 200:
+            data = response.json()
+            print(f"✅ Batch search returned {data['total_queries']} result lists")
+            for item in data['results']:
+                print(f"   '{item['query']}': {item['total_results']} results")
+            return True
+        else:
+            print(f"❌ Batch search failed: {response.status_code} - {response.text}")
+            return False
+            
+    except Exception as e:
+        print(f"❌ Batch search error: {e}")
+        return False
+
+
 def test_add_product():
     """Test add product functionality"""
     print("\n➕ Testing add product...")
@@ -268,6 +300,7 @@ def run_comprehensive_test():
     
     # Test 4: Search functionality
     test_search()
+    test_batch_search()
     
     # Test 5: Add product
     product_id = test_add_product()
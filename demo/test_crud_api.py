@@ -144,6 +144,200 @@ def test_delete_product(product_id: int):
         print(f"❌ Delete product error: {e}")
         return False
 
+def test_delete_keeps_ids(name: str):
+    """Test delete: ID của các sản phẩm khác không đổi, sản phẩm đã xóa không còn trong kết quả search"""
+    print(f"\n🪦 Testing Delete Keeps IDs: '{name}'")
+    try:
+        found = requests.get(f"{BASE_URL}/products", params={'search': name, 'limit': 1}).json()['products']
+        if not found:
+            print("❌ Product to delete not found")
+            return False
+        product_id = found[0]['id']
+        
+        ids_before = [p['id'] for p in requests.get(f"{BASE_URL}/products?limit=50").json()['products']]
+        if not test_delete_product(product_id):
+            return False
+        ids_after = [p['id'] for p in requests.get(f"{BASE_URL}/products?limit=50").json()['products']]
+        
+        kept = [i for i in ids_before if i != product_id]
+        if ids_after[:len(kept)] != kept:
+            print(f"❌ IDs changed after delete: {ids_before[:5]} → {ids_after[:5]}")
+            return False
+        
+        results = requests.post(
+            f"{BASE_URL}/search",
+            json={"query": name, "method": "bi_encoder", "top_k": 10},
+            headers={'Content-Type': 'application/json'}
+        ).json()['results']
+        if any(r['id'] == product_id for r in results):
+            print(f"❌ Deleted product {product_id} still returned by search")
+            return False
+        
+        stats = requests.get(f"{BASE_URL}/stats").json()['stats']
+        print(f"✅ IDs unchanged, deleted product hidden from search (tombstones: {stats.get('tombstones')})")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Delete keeps IDs error: {e}")
+        return False
+
+def get_store_stats():
+    """Thống kê ProductStore dùng chung (version snapshot, số sản phẩm / vectors)"""
+    try:
+        return requests.get(f"{BASE_URL}/stats").json()['stats'].get('product_store')
+    except Exception as e:
+        print(f"❌ Get store stats error: {e}")
+        return None
+
+def test_store_published(store_before):
+    """Test ghi dữ liệu publish snapshot mới: version tăng và searcher thấy ngay số sản phẩm mới"""
+    print(f"\n🗃️ Testing Shared Product Store")
+    store_after = get_store_stats()
+    if not store_before or not store_after:
+        print("❌ product_store missing from /api/stats")
+        return False
+    if store_after['version'] <= store_before['version']:
+        print(f"❌ Store version did not advance: {store_before['version']} → {store_after['version']}")
+        return False
+    print(f"✅ Store v{store_before['version']} → v{store_after['version']}, "
+          f"products {store_before['products']} → {store_after['products']}, "
+          f"embeddings memory-mapped: {store_after['embeddings_memory_mapped']}")
+    return True
+
+def test_admin_reload():
+    """Test đọc lại catalog từ đĩa: trạng thái trong bộ nhớ (sau các thao tác ghi) phải khớp với file đã ghi"""
+    print(f"\n♻️ Testing Admin Reload")
+    store_before = get_store_stats()
+    try:
+        response = requests.post(f"{BASE_URL}/admin/reload")
+        if response.status_code != 200:
+            print(f"❌ Admin reload failed: {response.status_code} - {response.text}")
+            return False
+        store_after = response.json()['product_store']
+        for key in ('products', 'vectors', 'embedding_rows'):
+            if store_after[key] != store_before[key]:
+                print(f"❌ {key} in memory ({store_before[key]}) != on disk ({store_after[key]})")
+                return False
+        print(f"✅ Reloaded v{store_after['version']}: {store_after['products']} products, "
+              f"{store_after['vectors']} vectors khớp với bộ nhớ")
+        return True
+    except Exception as e:
+        print(f"❌ Admin reload error: {e}")
+        return False
+
+def test_bulk_operations():
+    """Test /api/products/bulk: batch lỗi không đổi gì, batch hợp lệ add/update/delete trong một lần commit"""
+    print(f"\n📦 Testing Bulk Operations")
+    try:
+        store_before = get_store_stats()
+        products = [
+            {"name": f"Bulk Test Product {i}", "brand": "Bulk Brand", "ingredients": "water, salt"}
+            for i in range(3)
+        ]
+        
+        # Thao tác cuối lỗi (ID không tồn tại) → không sản phẩm nào được thêm
+        operations = [{"op": "add", "product": p} for p in products] + [{"op": "delete", "id": -1}]
+        response = requests.post(f"{BASE_URL}/products/bulk", json={"operations": operations})
+        store_after = get_store_stats()
+        if response.status_code != 400 or store_after['products'] != store_before['products']:
+            print(f"❌ Invalid batch was not rejected atomically: {response.status_code} - {response.text}")
+            return False
+        
+        # Thêm 3 sản phẩm
+        operations = [{"op": "add", "product": p} for p in products]
+        response = requests.post(f"{BASE_URL}/products/bulk", json={"operations": operations})
+        if response.status_code != 200:
+            print(f"❌ Bulk add failed: {response.status_code} - {response.text}")
+            return False
+        ids = [r['id'] for r in response.json()['results']]
+        
+        # Sửa sản phẩm đầu, xóa 2 sản phẩm còn lại trong cùng một batch
+        operations = [{"op": "update", "id": ids[0], "product": {"name": "Bulk Updated Product"}}] + \
+                     [{"op": "delete", "id": product_id} for product_id in ids[1:]]
+        response = requests.post(f"{BASE_URL}/products/bulk", json={"operations": operations})
+        if response.status_code != 200:
+            print(f"❌ Bulk update/delete failed: {response.status_code} - {response.text}")
+            return False
+        
+        response = requests.get(f"{BASE_URL}/products/bulk", params={"ids": ",".join(map(str, ids))})
+        result = response.json()
+        if [p['name'] for p in result['products']] != ["Bulk Updated Product"] or result['missing_ids'] != ids[1:]:
+            print(f"❌ Bulk get mismatch: {result}")
+            return False
+        
+        # Dọn dẹp
+        requests.post(f"{BASE_URL}/products/bulk", json={"operations": [{"op": "delete", "id": ids[0]}]})
+        print(f"✅ Bulk add/update/delete OK (IDs {ids}), invalid batch rejected without changes")
+        return True
+    except Exception as e:
+        print(f"❌ Bulk operations error: {e}")
+        return False
+
+def test_import_job():
+    """Test /api/import: upload CSV, theo dõi job tới khi xong, dòng lỗi được báo theo số dòng"""
+    print(f"\n📥 Testing Streaming Import")
+    try:
+        csv_data = "name,brand,ingredients\n" + \
+                   "".join(f"Import Test Product {i},Import Brand,\"sugar, salt\"\n" for i in range(5)) + \
+                   ",Import Brand,missing name\n"
+        response = requests.post(f"{BASE_URL}/import", files={'file': ('feed.csv', csv_data, 'text/csv')})
+        if response.status_code != 202:
+            print(f"❌ Import submit failed: {response.status_code} - {response.text}")
+            return False
+        status_url = BASE_URL.rsplit('/api', 1)[0] + response.json()['status_url']
+        
+        for _ in range(120):
+            job = requests.get(status_url).json()['job']
+            if job['status'] in ('completed', 'failed'):
+                break
+            time.sleep(0.5)
+        
+        if job['status'] != 'completed' or job['counts']['add'] != 5 or job['rows_failed'] != 1:
+            print(f"❌ Unexpected import result: {job}")
+            return False
+        print(f"✅ Imported {job['counts']['add']} products in {job['chunks_committed']} chunks, "
+              f"row error: {job['errors'][0]}")
+        
+        # Dọn dẹp sản phẩm vừa import
+        products = requests.get(f"{BASE_URL}/products", params={'search': 'Import Test Product', 'limit': 100}).json()
+        operations = [{"op": "delete", "id": p['id']} for p in products['products']]
+        if operations:
+            requests.post(f"{BASE_URL}/products/bulk", json={"operations": operations})
+        return True
+    except Exception as e:
+        print(f"❌ Import error: {e}")
+        return False
+
+def test_export():
+    """Test /api/export: stream toàn bộ catalog, rồi pull tăng dần từ X-Catalog-Generation"""
+    print(f"\n📤 Testing Catalog Export")
+    try:
+        response = requests.get(f"{BASE_URL}/export", params={'format': 'ndjson'}, stream=True)
+        if response.status_code != 200:
+            print(f"❌ Export failed: {response.status_code} - {response.text}")
+            return False
+        products = [json.loads(line) for line in response.iter_lines() if line]
+        generation = int(response.headers['X-Catalog-Generation'])
+        if len(products) != int(response.headers['X-Total-Count']):
+            print(f"❌ Export returned {len(products)} products, header says {response.headers['X-Total-Count']}")
+            return False
+        
+        # Thêm một sản phẩm → export tăng dần chỉ chứa sản phẩm đó
+        operations = [{"op": "add", "product": {"name": "Export Test Product", "brand": "Export Brand"}}]
+        added_id = requests.post(f"{BASE_URL}/products/bulk", json={"operations": operations}).json()['results'][0]['id']
+        response = requests.get(f"{BASE_URL}/export", params={'since_generation': generation, 'include_vectors': 'true'})
+        changed = [json.loads(line) for line in response.text.splitlines() if line]
+        requests.post(f"{BASE_URL}/products/bulk", json={"operations": [{"op": "delete", "id": added_id}]})
+        
+        if [p['id'] for p in changed] != [added_id] or not changed[0].get('embedding'):
+            print(f"❌ Incremental export mismatch: {[p['id'] for p in changed]}")
+            return False
+        print(f"✅ Exported {len(products)} products (generation {generation}), incremental pull returned ID {added_id}")
+        return True
+    except Exception as e:
+        print(f"❌ Export error: {e}")
+        return False
+
 def run_crud_tests():
     """Run complete CRUD tests"""
     print("🎯 TESTING CRUD API ENDPOINTS")
@@ -167,7 +361,10 @@ def run_crud_tests():
         "manufacturerNumber": "TEST123"
     }
     
+    store_before = get_store_stats()
     add_success = test_add_product(test_product)
+    if add_success:
+        test_store_published(store_before)
     
     # 4. Search for the new product
     if add_success:
@@ -190,8 +387,21 @@ def run_crud_tests():
         time.sleep(1)  # Wait for indexing
         test_search_products("Updated Product")
     
-    # Clean up - delete test product if we can find it
-    # Note: In a real test, you'd want to track the added product ID
+    # 8. Clean up - delete test product (tombstone, ID của sản phẩm khác giữ nguyên)
+    if add_success:
+        test_delete_keeps_ids(test_product['name'])
+    
+    # 9. Bulk add/update/delete trong một transaction + bulk get
+    test_bulk_operations()
+    
+    # 10. Import CSV chạy nền theo job
+    test_import_job()
+    
+    # 11. Export stream + pull tăng dần
+    test_export()
+    
+    # 12. Reload từ đĩa khớp với thay đổi đã publish trong bộ nhớ
+    test_admin_reload()
     
     print(f"\n🎉 CRUD API Tests Completed!")
     print("="*60)
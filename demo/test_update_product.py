@@ -28,11 +28,11 @@ def test_update_product():
         updater.display_products(10)
         
         # Test update sản phẩm đầu tiên
-        product_id = 0
+        product_id = int(updater.metadata_df['id'].iloc[0])
         print(f"\n🎯 Test cập nhật sản phẩm ID: {product_id}")
         
         # Lấy thông tin hiện tại
-        current_product = updater.data_df.iloc[product_id]
+        current_product = updater.get_product(product_id)
         print(f"\n📦 Thông tin hiện tại:")
         updater._display_product_details(product_id)
         
@@ -65,9 +65,9 @@ def test_update_product():
             results = updater.search_products("Updated")
             if results:
                 print(f"Tìm thấy {len(results)} sản phẩm có chứa 'Updated'")
-                for idx in results[:3]:
-                    row = updater.data_df.iloc[idx]
-                    print(f"  ID: {idx} - {row['name']}")
+                for result_id in results[:3]:
+                    row = updater.get_product(result_id)
+                    print(f"  ID: {result_id} - {row['name']}")
             else:
                 print("Không tìm thấy sản phẩm nào")
         else:
@@ -95,9 +95,9 @@ def test_search_functionality():
             results = updater.search_products(query)
             print(f"Kết quả: {len(results)} sản phẩm")
             
-            for idx in results[:3]:  # Hiển thị 3 kết quả đầu
-                row = updater.data_df.iloc[idx]
-                print(f"  ID: {idx} - {row['name'][:50]}")
+            for result_id in results[:3]:  # Hiển thị 3 kết quả đầu
+                row = updater.get_product(result_id)
+                print(f"  ID: {result_id} - {row['name'][:50]}")
                 
     except Exception as e:
         print(f"❌ Lỗi test tìm kiếm: {e}")